@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from edziennik.models import Lector, Group, Student, ClassDate, Grades, Parent, SMS
+from edziennik.models import Lector, Group, Student, ClassDate, Grades, Parent, SMS, WeeklyReport
 
 admin.site.register(Lector)
 admin.site.register(Group)
@@ -8,4 +8,5 @@ admin.site.register(Parent)
 admin.site.register(Student)
 admin.site.register(ClassDate)
 admin.site.register(Grades)
-admin.site.register(SMS)
\ No newline at end of file
+admin.site.register(SMS)
+admin.site.register(WeeklyReport)
@@ -5,3 +5,7 @@ from django.apps import AppConfig
 
 class EdziennikConfig(AppConfig):
     name = 'edziennik'
+
+    def ready(self):
+        # connects signals invalidating cached tables and updating stats
+        from edziennik import caching, stats
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from django.db import IntegrityError, transaction
+
+from edziennik.caching import invalidate_attendance, invalidate_grades
+from edziennik.models import Group, Student, ClassDate, Grades
+from edziennik.stats import attendance_recorded, grades_recorded
+
+
+def _ids(values):
+    ''' converts ids sent in a form to a set of ints, ignoring invalid ones '''
+    return set(int(value) for value in values if str(value).isdigit())
+
+
+def attendance_checked_today(group):
+    ''' returns True if attendance was checked today in this group; must be
+    called in a transaction, the group is locked until its end, so that
+    attendance sent twice at the same time is saved once '''
+    list(Group.objects.select_for_update().filter(pk=group.pk).values_list('id', flat=True))
+    return ClassDate.objects.filter(
+        student__group=group, date_of_class=datetime.date.today()).exists()
+
+
+def record_attendance(group, class_subject, present_ids, homework_ids):
+    ''' creates today's ClassDate of a group with attendance and homework
+    of its students; the number of queries does not depend on group size.
+    Returns created ClassDate and ids of absent students '''
+    student_ids = set(group.student_set.values_list('id', flat=True))
+    present = student_ids & _ids(present_ids)
+    homework = present & _ids(homework_ids)
+
+    with transaction.atomic():
+        class_date = ClassDate.objects.create(
+            date_of_class=datetime.date.today(),
+            subject=class_subject,
+            lector_id=group.lector_id)
+        ClassDate.student.through.objects.bulk_create([
+            ClassDate.student.through(classdate_id=class_date.id, student_id=i)
+            for i in present])
+        ClassDate.has_homework.through.objects.bulk_create([
+            ClassDate.has_homework.through(classdate_id=class_date.id, student_id=i)
+            for i in homework])
+        Student.objects.filter(id__in=present).update(quizlet=False)
+        # bulk_create does not send m2m_changed
+        invalidate_attendance([group.id])
+        attendance_recorded(class_date.date_of_class, present, homework,
+                            student_ids - present)
+
+    return class_date, sorted(student_ids - present)
+
+
+def record_grades(grade_name, date_of_test, scores):
+    ''' adds a grade with the same name and date to many students at once,
+    scores is a dict of Student: score. Returns students who already have
+    this grade, if there are any nothing is saved '''
+    students = sorted(scores, key=lambda student: student.id)
+
+    def duplicates():
+        graded = set(Grades.objects.filter(
+            student__in=students, name=grade_name, date_of_test=date_of_test
+            ).values_list('student_id', flat=True))
+        return [s for s in students if s.id in graded]
+
+    if not students:
+        return []
+    conflicts = duplicates()
+    if conflicts:
+        return conflicts
+    try:
+        with transaction.atomic():
+            Grades.objects.bulk_create([
+                Grades(name=grade_name, date_of_test=date_of_test,
+                       student=student, score=score)
+                for student, score in scores.items()])
+            # bulk_create does not send post_save
+            invalidate_grades(students)
+            grades_recorded(dict((student.id, score) for student, score in scores.items()))
+    except IntegrityError:
+        # the same grades were added by someone else in the meantime
+        return duplicates()
+    return []
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete,\
+                                     pre_save
+from django.dispatch import receiver
+
+from edziennik.models import Student, ClassDate, Grades
+
+# what cached tables depend on, versions are bumped when it changes
+GROUP_ATTENDANCE = 'group_attendance'
+GROUP_GRADES = 'group_grades'
+STUDENT = 'student'
+
+# cached tables are dropped when any of their dependencies change,
+# the timeout only frees memory of tables nobody looks at
+TIMEOUT = 24 * 60 * 60
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+def _version_key(scope, pk):
+    return 'edziennik:version:%s:%s' % (scope, pk)
+
+
+def _new_version():
+    # a version lost from cache must not start again from a number used before
+    return int(time.time() * 1000)
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def invalidate(scope, pks):
+    ''' drops cached tables depending on objects of scope with given ids; done
+    again on commit, so that tables cached from data read before the commit
+    are dropped as well '''
+    keys = set(_version_key(scope, pk) for pk in pks if pk is not None)
+    if not keys:
+        return
+    _bump(keys)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(keys))
+
+
+def cached(name, pk, dependencies, build):
+    ''' returns build() cached under a key made of name, pk and current
+    versions of dependencies, a list of (scope, id) pairs '''
+    keys = [_version_key(scope, dependency) for scope, dependency in dependencies]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+
+    key = 'edziennik:%s:%s:%s' % (name, pk, ':'.join(str(versions[k]) for k in keys))
+    value = cache.get(key)
+    hit = value is not None
+    with _stats_lock:
+        _stats[name]['hits' if hit else 'misses'] += 1
+    if not hit:
+        value = build()
+        cache.set(key, value, TIMEOUT)
+    return value
+
+
+def cache_stats():
+    ''' returns hits, misses and hit rate of each cached table in this process '''
+    with _stats_lock:
+        stats = dict((name, dict(counts)) for name, counts in _stats.items())
+    for counts in stats.values():
+        total = counts['hits'] + counts['misses']
+        counts['hit_rate'] = float(counts['hits']) / total if total else 0.0
+    return stats
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def invalidate_attendance(group_ids):
+    invalidate(GROUP_ATTENDANCE, group_ids)
+
+
+def invalidate_grades(students):
+    ''' students is a list of Student whose grades were changed '''
+    invalidate(STUDENT, [student.id for student in students])
+    invalidate(GROUP_GRADES, [student.group_id for student in students])
+
+
+def _class_date_groups(class_date):
+    return set(Student.objects.filter(
+        Q(student=class_date) | Q(has_homework=class_date)).values_list('group_id', flat=True))
+
+
+@receiver(post_save, sender=Grades)
+@receiver(post_delete, sender=Grades)
+def grades_changed(sender, instance, **kwargs):
+    invalidate_grades([instance.student])
+
+
+@receiver(pre_save, sender=Student)
+def student_saving(sender, instance, **kwargs):
+    # student moved to another group disappears from tables of the old one
+    instance._old_group_id = Student.objects.filter(pk=instance.pk).values_list(
+        'group_id', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, instance, **kwargs):
+    group_ids = set([instance.group_id, getattr(instance, '_old_group_id', None)])
+    invalidate(STUDENT, [instance.id])
+    invalidate(GROUP_GRADES, group_ids)
+    invalidate(GROUP_ATTENDANCE, group_ids)
+
+
+@receiver(post_save, sender=ClassDate)
+@receiver(pre_delete, sender=ClassDate)
+def class_date_changed(sender, instance, **kwargs):
+    if kwargs.get('created'):
+        # no students yet, they are added later
+        return
+    invalidate_attendance(_class_date_groups(instance))
+
+
+@receiver(m2m_changed, sender=ClassDate.student.through)
+@receiver(m2m_changed, sender=ClassDate.has_homework.through)
+def class_date_students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance is a Student
+        group_ids = [instance.group_id]
+    elif action == 'pre_clear':
+        group_ids = _class_date_groups(instance)
+    else:
+        group_ids = set(Student.objects.filter(id__in=pk_set).values_list(
+            'group_id', flat=True))
+    invalidate_attendance(group_ids)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import csv
+import itertools
+import tempfile
+
+from django.utils import six
+
+from edziennik.models import ClassDate, Grades
+from edziennik.tables import ATTENDANCE_LABELS, attendance_status
+
+try:
+    import openpyxl
+except ImportError:
+    # xlsx export is optional
+    openpyxl = None
+
+TABLES = ('attendance', 'grades')
+
+
+def _group_by(rows, length):
+    ''' groups consecutive rows by their first `length` columns, yields
+    (key, list of the remaining columns) '''
+    for key, group_rows in itertools.groupby(rows, key=lambda row: row[:length]):
+        yield key, [row[length:] for row in group_rows]
+
+
+def attendance_rows(groups):
+    ''' yields header and attendance rows of every group: date, subject and
+    status of each student, labelled like in the legend of attendance tables;
+    rows are read with iterator() in class date order, so only one class date
+    of a group is in memory at a time '''
+    for group in groups:
+        students = list(group.student_set.order_by('id'))
+        yield [group.name, 'data', 'temat'] + [student.name for student in students]
+
+        attended = ClassDate.student.through.objects.filter(
+            student__group=group).order_by(
+                'classdate__date_of_class', 'classdate_id').values_list(
+                    'classdate__date_of_class', 'classdate_id', 'classdate__subject',
+                    'student_id').iterator()
+        homework = _group_by(ClassDate.has_homework.through.objects.filter(
+            student__group=group).order_by(
+                'classdate__date_of_class', 'classdate_id').values_list(
+                    'classdate__date_of_class', 'classdate_id', 'student_id').iterator(), 2)
+        next_homework = next(homework, None)
+
+        for (date, class_date_id, subject), rows in _group_by(attended, 3):
+            present = set(row[0] for row in rows)
+            # both are ordered by class date, homework of other classes is skipped
+            while next_homework and next_homework[0] < (date, class_date_id):
+                next_homework = next(homework, None)
+            done = set()
+            if next_homework and next_homework[0] == (date, class_date_id):
+                done = set(row[0] for row in next_homework[1])
+            yield [group.name, date, subject] + [
+                ATTENDANCE_LABELS[attendance_status(student.id in present, student.id in done)]
+                for student in students]
+
+
+def grade_rows(groups):
+    ''' yields header and grade rows of every group: date of test, what the
+    grade is for and the score of each student; grades are read with
+    iterator(), so only one test of a group is in memory at a time '''
+    for group in groups:
+        students = list(group.student_set.order_by('id'))
+        yield [group.name, 'data', 'za co'] + [student.name for student in students]
+
+        grades = Grades.objects.filter(student__group=group).order_by(
+            'date_of_test', 'name', 'id').values_list(
+                'date_of_test', 'name', 'student_id', 'score').iterator()
+        for (date_of_test, name), rows in _group_by(grades, 2):
+            scores = {}
+            for student_id, score in rows:
+                scores.setdefault(student_id, score)
+            yield [group.name, date_of_test, name] + [
+                scores.get(student.id) for student in students]
+
+
+def table_rows(table, groups):
+    return {'attendance': attendance_rows, 'grades': grade_rows}[table](groups)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if six.PY2 and isinstance(value, six.text_type):
+        # csv module of python 2 only writes bytes
+        return value.encode('utf-8')
+    return value
+
+
+class Echo(object):
+    ''' file-like object returning what is written to it, lets csv.writer
+    produce lines one by one '''
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    ''' yields rows formatted as csv lines '''
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def write_xlsx(rows, output):
+    ''' saves rows to an xlsx file in write-only mode, rows are not kept
+    in memory; needs openpyxl '''
+    if openpyxl is None:
+        raise RuntimeError('xlsx export needs openpyxl')
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    workbook.save(output)
+    return output
+
+
+def xlsx_file(rows):
+    ''' returns a temporary file with rows saved as xlsx, rewound '''
+    output = tempfile.TemporaryFile()
+    write_xlsx(rows, output)
+    output.seek(0)
+    return output
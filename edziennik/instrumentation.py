@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger('edziennik.instrumentation')
+
+Measurement = namedtuple('Measurement', [
+    'view', 'method', 'path', 'status', 'time', 'queries', 'sql_time',
+    'template_time', 'size', 'timestamp'])
+
+_local = threading.local()
+
+
+class Recorder(object):
+    ''' keeps last `size` measurements of views in memory of this process '''
+
+    def __init__(self, size):
+        self.measurements = deque(maxlen=size)
+
+        self.lock = threading.Lock()
+
+    def add(self, measurement):
+        with self.lock:
+            self.measurements.append(measurement)
+
+    def clear(self):
+        with self.lock:
+            self.measurements.clear()
+
+    def recent(self):
+        with self.lock:
+            return list(self.measurements)
+
+    def summary(self):
+        ''' returns a dict of totals and maximums of each view '''
+        views = {}
+        for m in self.recent():
+            view = views.setdefault(m.view, {
+                'view': m.view, 'requests': 0, 'time': 0.0, 'max_time': 0.0,
+                'queries': 0, 'max_queries': 0, 'sql_time': 0.0, 'template_time': 0.0})
+            view['requests'] += 1
+            view['time'] += m.time
+            view['max_time'] = max(view['max_time'], m.time)
+            view['queries'] += m.queries
+            view['max_queries'] = max(view['max_queries'], m.queries)
+            view['sql_time'] += m.sql_time
+            view['template_time'] += m.template_time
+        for view in views.values():
+            for total in ('time', 'queries', 'sql_time', 'template_time'):
+                view['avg_' + total] = float(view[total]) / view['requests']
+        return views
+
+    def slowest(self, limit=10):
+        return sorted(self.summary().values(), key=lambda view: -view['avg_time'])[:limit]
+
+    def most_queries(self, limit=10):
+        return sorted(self.summary().values(), key=lambda view: -view['max_queries'])[:limit]
+
+
+_recorder = None
+
+
+def recorder():
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder(getattr(settings, 'INSTRUMENTATION_BUFFER_SIZE', 500))
+    return _recorder
+
+
+# Template.render replaced by install_template_timer, None when not installed
+_template_render = None
+
+
+def _timed_render(self, context):
+    ''' Template.render adding time spent on the outermost template to the
+    measurement of the current request '''
+    timer = getattr(_local, 'templates', None)
+    if timer is None or timer['depth']:
+        # request is not measured, or template included in a measured one
+        return _template_render(self, context)
+    timer['depth'] += 1
+    start = time.time()
+    try:
+        return _template_render(self, context)
+    finally:
+        timer['time'] += time.time() - start
+        timer['depth'] -= 1
+
+
+def install_template_timer():
+    ''' times rendering of templates, called only by the middleware when
+    instrumentation is enabled '''
+    global _template_render
+    if _template_render is None:
+        _template_render = Template.__dict__['render']
+        Template.render = _timed_render
+
+
+def uninstall_template_timer():
+    global _template_render
+    if _template_render is not None:
+        Template.render = _template_render
+        _template_render = None
+
+
+def start(request):
+    ''' starts measuring a request; queries are recorded for every database '''
+    request._instrumentation = {
+        'start': time.time(),
+        # queries logged before, e.g. by assertNumQueries, are left as they are
+        'connections': [(connection, connection.force_debug_cursor, connection.queries_logged,
+                         len(connection.queries_log)) for connection in connections.all()],
+    }
+    for connection in connections.all():
+        connection.force_debug_cursor = True
+    _local.templates = {'depth': 0, 'time': 0.0}
+
+
+def finish(request, response, view):
+    ''' stops measuring a request, records and logs its measurement '''
+    state = getattr(request, '_instrumentation', None)
+    if state is None:
+        return None
+    elapsed = time.time() - state['start']
+
+    queries = 0
+    sql_time = 0.0
+    for connection, debug_cursor, logged, logged_before in state['connections']:
+        request_queries = list(connection.queries_log)[logged_before:]
+        queries += len(request_queries)
+        sql_time += sum(float(query['time']) for query in request_queries)
+        connection.force_debug_cursor = debug_cursor
+        if not logged:
+            # nobody else reads the log
+            connection.queries_log.clear()
+
+    templates = getattr(_local, 'templates', None) or {'time': 0.0}
+    _local.templates = None
+
+    measurement = Measurement(
+        view=view, method=request.method, path=request.path,
+        status=response.status_code, time=elapsed, queries=queries, sql_time=sql_time,
+        template_time=templates['time'],
+        # streamed content is not known yet
+        size=None if response.streaming else len(response.content),
+        timestamp=state['start'])
+    recorder().add(measurement)
+    logger.info(json.dumps(measurement._asdict(), sort_keys=True))
+    return measurement
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import datetime
+import time
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+
+from edziennik.models import Lector, Group, Parent, Student, Grades
+from edziennik.tables import build_grade_sheet, grade_table_content
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measures how render time of group tables grows with group size. '
+            'Test data is created in a transaction which is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=['grades'])
+        parser.add_argument('--sizes', default='5,15,30,60',
+                            help='comma separated numbers of students in a group')
+        parser.add_argument('--tests', type=int, default=40,
+                            help='number of graded tests per group')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        getattr(self, 'benchmark_%s' % options['target'])(sizes, options)
+
+    def benchmark_grades(self, sizes, options):
+        self.stdout.write('%10s %10s %10s %12s' % (
+            'students', 'grades', 'queries', 'render [ms]'))
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    group = self.create_group(size, options['tests'])
+                    queries, elapsed = self.measure(
+                        lambda: self.render_grades(group), options['repeat'])
+                    self.stdout.write('%10d %10d %10d %12.2f' % (
+                        size, size * options['tests'], queries, elapsed * 1000))
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def render_grades(self, group):
+        sheet = build_grade_sheet(group)
+        context = {
+            'students': sheet.students,
+            'group': group,
+            'lector': group.lector,
+            'table_content': grade_table_content(sheet),
+        }
+        return render_to_string('edziennik/show_group_grades.html', context)
+
+    def measure(self, func, repeat):
+        ''' returns number of queries and the best time of repeated calls '''
+        timings = []
+        for i in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.time()
+                func()
+                timings.append(time.time() - start)
+        return len(context.captured_queries), min(timings)
+
+    def create_group(self, size, tests):
+        # the name must not clash with existing users, data is rolled back anyway
+        user = User.objects.create(username='benchmark_%s' % uuid4().hex[:12])
+        lector = Lector.objects.create(user=user)
+        parent = Parent.objects.create(user=user, phone_number=0)
+        group = Group.objects.create(name='benchmark', lector=lector)
+        Student.objects.bulk_create([
+            Student(name='student %d' % i, group=group, parent=parent, gender='F')
+            for i in range(size)])
+        first_day = datetime.date.today() - datetime.timedelta(tests)
+        Grades.objects.bulk_create([
+            Grades(name='test %d' % test,
+                   date_of_test=first_day + datetime.timedelta(test),
+                   student=student,
+                   score=test % 6 + 1)
+            for student in group.student_set.all() for test in range(tests)])
+        return group
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from edziennik.models import ClassDate, Grades, SMS
+
+EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def hot_queries():
+    ''' returns (description, queryset) of queries run on every page view
+    or in every periodic task '''
+    today = datetime.date.today()
+    week_ago = today - datetime.timedelta(7)
+    return [
+        ('attendance checked today',
+         ClassDate.objects.filter(student__group_id=1, date_of_class=today)),
+        ('classes in a group',
+         ClassDate.objects.filter(student__group_id=1).distinct().order_by(
+             'date_of_class', 'id')),
+        ('lector hours',
+         ClassDate.objects.filter(lector_id=1, date_of_class__range=[week_ago, today])),
+        ('classes in last week',
+         ClassDate.objects.filter(date_of_class__gte=week_ago)),
+        ('grades in a group',
+         Grades.objects.filter(student__group_id=1).order_by('date_of_test', 'id')),
+        ('duplicated grades',
+         Grades.objects.filter(student__in=[1, 2], name='test', date_of_test=today)),
+        ('grades given in last week',
+         Grades.objects.filter(timestamp__gte=timezone.make_aware(
+             datetime.datetime.combine(week_ago, datetime.time.min)))),
+        ('sms first status check',
+         SMS.objects.filter(checked_once=False)),
+        ('sms second status check',
+         SMS.objects.filter(checked_once=True, checked_twice=False, delivered=False)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Prints EXPLAIN output of hot queries to show which indexes are used.'
+
+    def handle(self, *args, **options):
+        prefix = EXPLAIN.get(connection.vendor)
+        if prefix is None:
+            self.stderr.write('EXPLAIN is not supported for %s' % connection.vendor)
+            return
+        cursor = connection.cursor()
+        for description, queryset in hot_queries():
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(prefix + sql, params)
+            self.stdout.write('== %s' % description)
+            self.stdout.write(sql % tuple(params))
+            for row in cursor.fetchall():
+                self.stdout.write('   ' + ' '.join(str(column) for column in row))
+            self.stdout.write('')
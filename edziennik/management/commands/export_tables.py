@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from edziennik import export
+from edziennik.models import Group
+
+
+class Command(BaseCommand):
+    help = ('Exports attendance or grades of all groups, or of chosen ones, as csv '
+            '(to standard output by default) or xlsx. Rows are streamed, memory use '
+            'does not grow with the number of classes and grades.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=export.TABLES)
+        parser.add_argument('--group', type=int, action='append', dest='groups',
+                            help='id of a group, can be repeated; all groups by default')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--output', help='file to write to, required for xlsx')
+
+    def handle(self, *args, **options):
+        groups = Group.objects.order_by('name', 'id')
+        if options['groups']:
+            groups = groups.filter(id__in=options['groups'])
+        rows = export.table_rows(options['table'], groups.iterator())
+
+        if options['format'] == 'xlsx':
+            if export.openpyxl is None:
+                raise CommandError('xlsx export needs openpyxl')
+            if not options['output']:
+                raise CommandError('--output is required for xlsx')
+            export.write_xlsx(rows, options['output'])
+            return
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for line in export.csv_lines(rows):
+                    output.write(line.encode('utf-8') if not isinstance(line, bytes) else line)
+            return
+        for line in export.csv_lines(rows):
+            self.stdout.write(line, ending='')
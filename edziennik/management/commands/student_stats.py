@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from edziennik.models import Group, Student
+from edziennik.stats import check_stats, rebuild_stats
+
+
+class Command(BaseCommand):
+    help = ('Checks saved attendance and grade stats of students against stats computed '
+            'from scratch, group by group, and with --rebuild saves the computed ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='save stats computed from scratch')
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for group_id in Group.objects.order_by('id').values_list('id', flat=True):
+            students = Student.objects.filter(group_id=group_id)
+            if options['rebuild']:
+                rebuild_stats(students)
+                continue
+            for student_id, field, saved, computed in check_stats(students):
+                drifted += 1
+                self.stdout.write('student %s: %s is %s, should be %s' % (
+                    student_id, field, saved, computed))
+
+        if options['rebuild']:
+            self.stdout.write('Stats rebuilt')
+        elif drifted:
+            raise CommandError('%d stats differ, run with --rebuild to fix them' % drifted)
+        else:
+            self.stdout.write('Stats are up to date')
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from edziennik.models import WeeklyReport
+from edziennik.utils2 import WEEK, admin_report, school_year, week_start, weekly_reports
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Dates must be given as YYYY-MM-DD, not %s' % value)
+
+
+class Command(BaseCommand):
+    help = ('Builds missing weekly report rollups of finished weeks, by default since '
+            'the start of the school year, and prints the report of the period. '
+            'Use --rebuild after attendance or grades of past weeks were changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='first day, YYYY-MM-DD')
+        parser.add_argument('--until', help='last day, YYYY-MM-DD, today by default')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='build again weeks which were already built')
+        parser.add_argument('--quiet', action='store_true', help='do not print the report')
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        since = parse_date(options['since']) if options['since'] else school_year(today)[0]
+        until = parse_date(options['until']) if options['until'] else today
+        if since > until:
+            raise CommandError('--since must not be later than --until')
+
+        first_week = week_start(since)
+        last_week = min(week_start(until), week_start(today) - WEEK)
+        if first_week <= last_week:
+            if options['rebuild']:
+                WeeklyReport.objects.filter(
+                    week_start__range=[first_week, last_week]).delete()
+            built = WeeklyReport.objects.filter(
+                week_start__range=[first_week, last_week]).count()
+            reports = weekly_reports(first_week, last_week)
+            self.stderr.write('%d weeks, %d built now' % (len(reports), len(reports) - built))
+
+        if not options['quiet']:
+            title, body = admin_report(since, until, today)
+            self.stdout.write(title)
+            self.stdout.write(body)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from edziennik import instrumentation
+from edziennik.roles import Role
+
+
+class InstrumentationMiddleware(object):
+    ''' measures every view when settings.INSTRUMENT_VIEWS is set, see
+    edziennik.instrumentation; must be placed first, so that queries of
+    other middleware are counted as well '''
+
+    def __init__(self):
+        if not getattr(settings, 'INSTRUMENT_VIEWS', False):
+            # nothing is patched when instrumentation is disabled
+            instrumentation.uninstall_template_timer()
+            raise MiddlewareNotUsed
+        instrumentation.install_template_timer()
+
+    def process_request(self, request):
+        instrumentation.start(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumented_view = '%s.%s' % (view_func.__module__, view_func.__name__)
+
+    def process_response(self, request, response):
+        # views which were not resolved, e.g. 404, are grouped by status
+        view = getattr(request, '_instrumented_view', 'unresolved %s' % response.status_code)
+        instrumentation.finish(request, response, view)
+        return response
+
+
+class RoleMiddleware(object):
+    ''' exposes role of the logged in user as request.edziennik_role,
+    must be placed after AuthenticationMiddleware '''
+
+    def process_request(self, request):
+        request.edziennik_role = Role(request.user)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import sys
+
+from django.db import migrations
+from django.db.models import Count, Min
+from django.utils.encoding import force_str
+
+
+def remove_duplicate_grades(apps, schema_editor):
+    ''' keeps the first of grades with the same student, name and date of
+    test, like record_grades does, the constraint can not be added while there
+    are duplicates; every deleted grade is printed, as its score may differ
+    from the kept one. Grades without date are not checked by the constraint '''
+    Grades = apps.get_model('edziennik', 'Grades')
+    duplicates = Grades.objects.filter(date_of_test__isnull=False).values(
+        'student_id', 'name', 'date_of_test').annotate(
+            count=Count('id'), first=Min('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        grades = Grades.objects.filter(
+            student_id=duplicate['student_id'], name=duplicate['name'],
+            date_of_test=duplicate['date_of_test'])
+        kept = grades.get(id=duplicate['first'])
+        for grade in grades.exclude(id=kept.id).order_by('id'):
+            sys.stdout.write(force_str(
+                'Deleting duplicate grade %s: student %s, %s, %s, score %s (kept grade %s, '
+                'score %s)\n' % (grade.id, grade.student_id, grade.name, grade.date_of_test,
+                                  grade.score, kept.id, kept.score)))
+            grade.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edziennik', '0006_profile'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_grades, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='grades',
+            unique_together=set([('student', 'name', 'date_of_test')]),
+        ),
+    ]
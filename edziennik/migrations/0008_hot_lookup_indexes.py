@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# indexes on SMS messages waiting for a status check; on postgresql they
+# are partial so they only hold the few messages which are not checked yet,
+# sqlite can not match partial indexes against bound query parameters
+# and other backends have no partial indexes, they get plain indexes on the flags
+SMS_INDEXES = [
+    ('edziennik_sms_unchecked', 'NOT checked_once', 'checked_once'),
+    ('edziennik_sms_undelivered', 'checked_once AND NOT checked_twice AND NOT delivered',
+     'checked_once, checked_twice, delivered'),
+]
+
+
+def create_sms_indexes(apps, schema_editor):
+    for name, condition, columns in SMS_INDEXES:
+        if schema_editor.connection.vendor == 'postgresql':
+            sql = 'CREATE INDEX %s ON edziennik_sms (timestamp) WHERE %s' % (
+                name, condition)
+        else:
+            sql = 'CREATE INDEX %s ON edziennik_sms (%s, timestamp)' % (
+                name, columns)
+        schema_editor.execute(sql)
+
+
+def drop_sms_indexes(apps, schema_editor):
+    for name, condition, columns in SMS_INDEXES:
+        if schema_editor.connection.vendor == 'mysql':
+            schema_editor.execute('DROP INDEX %s ON edziennik_sms' % name)
+        else:
+            schema_editor.execute('DROP INDEX %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edziennik', '0007_grades_unique_together'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='classdate',
+            name='date_of_class',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='classdate',
+            index_together=set([('lector', 'date_of_class')]),
+        ),
+        migrations.AlterField(
+            model_name='grades',
+            name='date_of_test',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='grades',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.RunPython(create_sms_indexes, drop_sms_indexes),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edziennik', '0008_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sms',
+            name='twilio_message_sid',
+            field=models.CharField(blank=True, db_index=True, max_length=120, null=True),
+        ),
+        migrations.AlterField(
+            model_name='sms',
+            name='smsapipl_message_id',
+            field=models.CharField(blank=True, db_index=True, max_length=120, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edziennik', '0009_sms_message_id_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField(unique=True)),
+                ('attendance', models.TextField(blank=True)),
+                ('grades', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
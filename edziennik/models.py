@@ -41,22 +41,30 @@ class Student(models.Model):
 
 class ClassDate(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
-    date_of_class = models.DateField()
+    date_of_class = models.DateField(db_index=True)
     subject = models.CharField(max_length=200, default = 'testowy temat')
     student = models.ManyToManyField(Student, related_name="student")
     has_homework = models.ManyToManyField(Student, related_name="has_homework")
     lector = models.ForeignKey(Lector, default=1)
-    
+
+    class Meta:
+        # lector's hours
+        index_together = [('lector', 'date_of_class')]
+
     def __str__(self):
         return str(self.date_of_class)
 
 class Grades(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
-    date_of_test = models.DateField(null=True, blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    date_of_test = models.DateField(null=True, blank=True, db_index=True)
     name = models.CharField(max_length = 200) # what is the grade for
     student = models.ForeignKey(Student)
     score = models.PositiveSmallIntegerField()
 
+    class Meta:
+        # the same grade can not be added to a student twice in one day
+        unique_together = ('student', 'name', 'date_of_test')
+
     def __str__(self):
         return str(self.name)
 
@@ -72,9 +80,9 @@ class SMS(models.Model):
     delivered = models.BooleanField(default=False)
     checked_once = models.BooleanField(default=False)
     checked_twice = models.BooleanField(default=False)
-    twilio_message_sid = models.CharField(max_length=120, null=True, blank=True)
+    twilio_message_sid = models.CharField(max_length=120, null=True, blank=True, db_index=True)
     twilio_message_status = models.CharField(max_length=120, null=True, blank=True)
-    smsapipl_message_id = models.CharField(max_length=120, null=True, blank=True)
+    smsapipl_message_id = models.CharField(max_length=120, null=True, blank=True, db_index=True)
     smsapipl_status = models.CharField(max_length=120, null=True, blank=True)
     smsapipl_error_code = models.CharField(max_length=120, null=True, blank=True)
     smsapipl_error_message = models.CharField(max_length=120, null=True, blank=True)
@@ -82,6 +90,42 @@ class SMS(models.Model):
     def __str__(self):
         return self.service + self.addressee.username + str(self.timestamp)
 
+class StudentStats(models.Model):
+    ''' attendance and grade counts of a student, updated whenever attendance
+    and grades are saved; manage.py student_stats rebuilds and checks them '''
+    student = models.OneToOneField(Student, primary_key=True, related_name='stats')
+    attended = models.PositiveIntegerField(default=0)
+    # classes of student's group he did not attend
+    missed = models.PositiveIntegerField(default=0)
+    homework = models.PositiveIntegerField(default=0)
+    grade_sum = models.PositiveIntegerField(default=0)
+    grade_count = models.PositiveIntegerField(default=0)
+    last_attended = models.DateField(null=True, blank=True)
+
+    def attendance_rate(self):
+        total = self.attended + self.missed
+        return float(self.attended) / total if total else None
+
+    def homework_rate(self):
+        return float(self.homework) / self.attended if self.attended else None
+
+    def grade_average(self):
+        return float(self.grade_sum) / self.grade_count if self.grade_count else None
+
+    def __str__(self):
+        return str(self.student_id)
+
+class WeeklyReport(models.Model):
+    ''' attendance and grades report sections of one finished week (from monday),
+    kept so that reports of long periods do not read raw data again '''
+    week_start = models.DateField(unique=True)
+    attendance = models.TextField(blank=True)
+    grades = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.week_start)
+
 # class AdminNote(models.Model):
 #     timestamp = models.DateTimeField(auto_now_add=True)
 #     published = models.DateField(auto_now=False, auto_now_add=False)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import redis
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.utils import six
+
+
+class RedisCache(BaseCache):
+    ''' django cache backend storing values in redis, so that all web processes
+    share them; LOCATION is a redis url. Integers are stored as they are, so
+    that incr() is atomic, other values are pickled '''
+
+    def __init__(self, server, params):
+        super(RedisCache, self).__init__(params)
+        self._server = server
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.StrictRedis.from_url(self._server)
+        return self._client
+
+    def _key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _timeout(self, timeout):
+        ''' returns timeout in whole seconds or None if the value should not expire '''
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return None
+        return max(int(timeout), 1)
+
+    def _dumps(self, value):
+        if isinstance(value, six.integer_types) and not isinstance(value, bool):
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _loads(self, value):
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return bool(self.client.set(self._key(key, version), self._dumps(value),
+                                    ex=self._timeout(timeout), nx=True))
+
+    def get(self, key, default=None, version=None):
+        value = self._loads(self.client.get(self._key(key, version)))
+        return default if value is None else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.client.set(self._key(key, version), self._dumps(value), ex=self._timeout(timeout))
+
+    def delete(self, key, version=None):
+        self.client.delete(self._key(key, version))
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        values = self.client.mget([self._key(key, version) for key in keys])
+        return dict((key, self._loads(value)) for key, value in zip(keys, values)
+                    if value is not None)
+
+    def has_key(self, key, version=None):
+        return bool(self.client.exists(self._key(key, version)))
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        if not self.client.exists(key):
+            raise ValueError("Key '%s' not found" % key)
+        return self.client.incr(key, delta)
+
+    def clear(self):
+        ''' removes keys of this cache only, the database is shared with celery '''
+        for key in self.client.scan_iter(match=self.make_key('*')):
+            self.client.delete(key)
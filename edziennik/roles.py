@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from edziennik.models import Lector, Parent
+
+LECTOR = 'lector'
+PARENT = 'parent'
+ADMIN = 'admin'
+ANONYMOUS = 'anonymous'
+OTHER = 'other' # authenticated user who is not a lector, admin nor parent
+
+
+class Role(object):
+    ''' resolves role of a user with indexed lookups by user id,
+    each lookup is done at most once per Role instance '''
+
+    def __init__(self, user):
+        self.user = user
+        self._cache = {}
+
+    def _cached(self, key, lookup):
+        if key not in self._cache:
+            self._cache[key] = lookup() if self.user.is_authenticated() else None
+        return self._cache[key]
+
+    @property
+    def lector(self):
+        ''' Lector object of the user or None '''
+        return self._cached(
+            LECTOR, lambda: Lector.objects.filter(user_id=self.user.id).first())
+
+    @property
+    def parent(self):
+        ''' Parent object of the user or None '''
+        return self._cached(
+            PARENT, lambda: Parent.objects.filter(user_id=self.user.id).first())
+
+    @property
+    def is_lector(self):
+        return self.lector is not None
+
+    @property
+    def is_parent(self):
+        return self.parent is not None
+
+    @property
+    def is_admin(self):
+        return self.user.is_authenticated() and self.user.is_superuser
+
+    @property
+    def name(self):
+        ''' main role of the user, lector takes precedence over admin,
+        admin over parent '''
+        if not self.user.is_authenticated():
+            return ANONYMOUS
+        if self.is_lector:
+            return LECTOR
+        if self.is_admin:
+            return ADMIN
+        if self.is_parent:
+            return PARENT
+        return OTHER
+
+    def __str__(self):
+        return self.name
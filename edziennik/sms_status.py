@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import datetime
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db.models import BooleanField, Case, CharField, F, Min, Value, When
+from django.utils import timezone
+from celery.utils.log import get_task_logger
+from twilio.rest import Client
+import redis
+
+from edziennik.models import SMS
+
+logger = get_task_logger(__name__)
+
+# number of messages updated with one query
+BATCH_SIZE = 500
+
+# delivery statuses are reported by webhooks, messages are polled only
+# when no report came in time or webhooks are not used
+FIRST_CHECK_AFTER = datetime.timedelta(minutes=5)
+SECOND_CHECK_AFTER = datetime.timedelta(minutes=20)
+
+# redis keys marking that a status check task is already pending
+FIRST_CHECK_PENDING = 'edziennik:sms_status_check:first'
+SECOND_CHECK_PENDING = 'edziennik:sms_status_check:second'
+# a pending mark outlives its task by this many seconds, so that a lost
+# task does not block scheduling for good
+PENDING_GRACE = 60
+
+_redis = None
+
+# statuses after which twilio will not send more reports
+TWILIO_FINAL_STATUSES = ('delivered', 'undelivered', 'failed')
+
+# smsapi.pl delivery report codes
+SMSAPI_STATUSES = {
+    '401': 'NOT_FOUND',
+    '402': 'EXPIRED',
+    '403': 'SENT',
+    '404': 'DELIVERED',
+    '405': 'UNDELIVERED',
+    '406': 'FAILED',
+    '407': 'REJECTED',
+    '408': 'UNKNOWN',
+    '409': 'QUEUE',
+    '410': 'ACCEPTED',
+    '411': 'RENEWAL',
+    '412': 'STOP',
+}
+SMSAPI_FINAL_STATUSES = ('NOT_FOUND', 'EXPIRED', 'DELIVERED', 'UNDELIVERED',
+                         'FAILED', 'REJECTED', 'STOP')
+
+TwilioStatus = namedtuple('TwilioStatus', ['status', 'to'])
+
+
+def twilio_client():
+    return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+
+
+def fetch_twilio_statuses(client, sids, workers=None):
+    ''' fetches statuses of many messages concurrently in a bounded pool of
+    threads, returns a dict of sid: TwilioStatus; messages whose status
+    could not be fetched are left out, to be checked again later '''
+    workers = workers or getattr(settings, 'SMS_STATUS_CHECK_WORKERS', 10)
+
+    def fetch(sid):
+        try:
+            fetched = client.messages(sid).fetch()
+            return sid, TwilioStatus(fetched.status, fetched.to)
+        except Exception:
+            logger.exception("unable to fetch status of sms %s" % sid)
+            return sid, None
+
+    if not sids:
+        return {}
+    pool = ThreadPool(min(workers, len(sids)))
+    try:
+        results = pool.map(fetch, sids)
+    finally:
+        pool.close()
+        pool.join()
+    return dict((sid, status) for sid, status in results if status)
+
+
+def apply_twilio_statuses(messages, statuses, checked_field):
+    ''' saves fetched statuses of messages and marks them as checked,
+    with one UPDATE per batch of messages '''
+    checked = [msg for msg in messages if msg.twilio_message_sid in statuses]
+    for i in range(0, len(checked), BATCH_SIZE):
+        batch = checked[i:i + BATCH_SIZE]
+        status_by_id = dict(
+            (msg.id, statuses[msg.twilio_message_sid].status) for msg in batch)
+        delivered_ids = [id for id, status in status_by_id.items() if status == 'delivered']
+        fields = {
+            checked_field: True,
+            'twilio_message_status': Case(
+                *[When(id=id, then=Value(status)) for id, status in status_by_id.items()],
+                output_field=CharField()),
+        }
+        # an empty id__in would make django skip the whole update
+        if delivered_ids:
+            fields['delivered'] = Case(
+                When(id__in=delivered_ids, then=Value(True)),
+                default=F('delivered'),
+                output_field=BooleanField())
+        SMS.objects.filter(id__in=list(status_by_id)).update(**fields)
+    return checked
+
+
+def check_twilio_statuses(messages, checked_field, client=None):
+    ''' fetches and saves statuses of messages sent with twilio,
+    returns a list of (message, TwilioStatus) of checked messages '''
+    messages = list(messages.filter(service='twilio').select_related('addressee'))
+    if not messages:
+        return []
+    client = client or twilio_client()
+    statuses = fetch_twilio_statuses(
+        client, [msg.twilio_message_sid for msg in messages])
+    checked = apply_twilio_statuses(messages, statuses, checked_field)
+    return [(msg, statuses[msg.twilio_message_sid]) for msg in checked]
+
+
+def redis_connection():
+    ''' connection to redis used as celery broker '''
+    global _redis
+    if _redis is None:
+        _redis = redis.StrictRedis.from_url(settings.BROKER_URL)
+    return _redis
+
+
+def schedule_once(task, key, countdown):
+    ''' enqueues task unless one marked with key is already pending,
+    returns True if task was enqueued '''
+    countdown = max(int(countdown), 0)
+    if not redis_connection().set(key, 1, nx=True, ex=countdown + PENDING_GRACE):
+        return False
+    task.apply_async(countdown=countdown)
+    return True
+
+
+def release_schedule(key):
+    ''' called by a running task, so that next one can be scheduled '''
+    redis_connection().delete(key)
+
+
+def seconds_to_next_check(messages, wait, now=None):
+    ''' seconds until the oldest of messages, not yet due for a check,
+    becomes due, None if there is no such message '''
+    now = now or timezone.now()
+    oldest = messages.filter(timestamp__gt=now - wait).aggregate(
+        oldest=Min('timestamp'))['oldest']
+    if oldest is None:
+        return None
+    return (oldest + wait - now).total_seconds()
+
+
+def due_for_first_check(now=None):
+    ''' messages without a delivery report long after they were sent '''
+    now = now or timezone.now()
+    return SMS.objects.filter(
+        checked_once=False, timestamp__lte=now - FIRST_CHECK_AFTER)
+
+
+def due_for_second_check(now=None):
+    ''' messages still not delivered long after they were sent '''
+    now = now or timezone.now()
+    return SMS.objects.filter(
+        checked_once=True, checked_twice=False, delivered=False,
+        timestamp__lte=now - SECOND_CHECK_AFTER)
+
+
+def record_twilio_status(sid, status):
+    ''' saves status reported by twilio status callback, returns number of
+    updated messages; delivered messages need no more checks, undelivered
+    ones are checked once more so that admin is notified '''
+    fields = {'twilio_message_status': status}
+    if status == 'delivered':
+        fields.update(delivered=True, checked_once=True, checked_twice=True)
+    elif status in TWILIO_FINAL_STATUSES:
+        fields.update(checked_once=True)
+    # reports may come out of order, never overwrite a delivered message
+    return SMS.objects.filter(
+        twilio_message_sid=sid, delivered=False).update(**fields)
+
+
+def record_smsapi_status(message_id, status_code):
+    ''' saves status reported by smsapi.pl callback, returns number of
+    updated messages '''
+    status = SMSAPI_STATUSES.get(status_code, status_code)
+    fields = {'smsapipl_status': status}
+    if status == 'DELIVERED':
+        fields.update(delivered=True, checked_once=True, checked_twice=True)
+    elif status in SMSAPI_FINAL_STATUSES:
+        fields.update(checked_once=True)
+    return SMS.objects.filter(
+        smsapipl_message_id=message_id, delivered=False).update(**fields)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DateField, F, Max, PositiveIntegerField, Q, Sum, Value,\
+                             When
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete,\
+                                     pre_save
+from django.dispatch import receiver
+
+from edziennik.models import Student, StudentStats, ClassDate, Grades
+
+STAT_FIELDS = ('attended', 'missed', 'homework', 'grade_sum', 'grade_count', 'last_attended')
+
+
+def compute_stats(students):
+    ''' returns {student id: dict of StudentStats fields} computed from attendance
+    and grades of given students, in 5 queries no matter how many there are '''
+    students = list(students)
+    ids = [student.id for student in students]
+    stats = dict((student_id, {'attended': 0, 'missed': 0, 'homework': 0, 'grade_sum': 0,
+                               'grade_count': 0, 'last_attended': None})
+                 for student_id in ids)
+    if not ids:
+        return stats
+
+    # classes of a group are the ones attended by any of its students
+    group_classes = {}
+    for group_id, class_date_id in ClassDate.student.through.objects.filter(
+            student__group_id__in=set(student.group_id for student in students)
+            ).values_list('student__group_id', 'classdate_id').distinct():
+        group_classes.setdefault(group_id, set()).add(class_date_id)
+
+    attended = {}
+    for student_id, class_date_id in ClassDate.student.through.objects.filter(
+            student_id__in=ids).values_list('student_id', 'classdate_id'):
+        attended.setdefault(student_id, set()).add(class_date_id)
+
+    for student in students:
+        classes = attended.get(student.id, set())
+        stats[student.id]['attended'] = len(classes)
+        stats[student.id]['missed'] = len(group_classes.get(student.group_id, set()) - classes)
+
+    for row in ClassDate.student.through.objects.filter(student_id__in=ids).values(
+            'student_id').annotate(last_attended=Max('classdate__date_of_class')):
+        stats[row['student_id']]['last_attended'] = row['last_attended']
+
+    for row in ClassDate.has_homework.through.objects.filter(student_id__in=ids).values(
+            'student_id').annotate(homework=Count('id')):
+        stats[row['student_id']]['homework'] = row['homework']
+
+    for row in Grades.objects.filter(student_id__in=ids).values('student_id').annotate(
+            grade_sum=Sum('score'), grade_count=Count('id')):
+        stats[row['student_id']]['grade_sum'] = row['grade_sum']
+        stats[row['student_id']]['grade_count'] = row['grade_count']
+
+    return stats
+
+
+def rebuild_stats(students):
+    ''' computes stats of students from scratch and saves them '''
+    computed = compute_stats(students)
+    existing = set(StudentStats.objects.filter(student_id__in=computed).values_list(
+        'student_id', flat=True))
+    created = []
+    for student_id, values in computed.items():
+        if student_id in existing:
+            StudentStats.objects.filter(student_id=student_id).update(**values)
+        else:
+            created.append(StudentStats(student_id=student_id, **values))
+    try:
+        with transaction.atomic():
+            StudentStats.objects.bulk_create(created)
+    except IntegrityError:
+        # created by someone else in the meantime, from the same data
+        pass
+
+
+def check_stats(students):
+    ''' returns (student id, field, saved value, computed value) of every stat
+    which differs from the one computed from scratch, saved value of
+    students without stats is None '''
+    computed = compute_stats(students)
+    saved = dict((stats.student_id, stats) for stats in
+                 StudentStats.objects.filter(student_id__in=computed))
+    drift = []
+    for student_id in sorted(computed):
+        for field in STAT_FIELDS:
+            value = getattr(saved[student_id], field) if student_id in saved else None
+            if value != computed[student_id][field]:
+                drift.append((student_id, field, value, computed[student_id][field]))
+    return drift
+
+
+def _with_stats(student_ids):
+    ''' returns ids of students which have stats, the others get them computed
+    from scratch, including changes which are being recorded '''
+    student_ids = set(student_ids)
+    existing = set(StudentStats.objects.filter(student_id__in=student_ids).values_list(
+        'student_id', flat=True))
+    if student_ids - existing:
+        rebuild_stats(Student.objects.filter(id__in=student_ids - existing))
+    return existing
+
+
+def attendance_recorded(date, present_ids, homework_ids, absent_ids):
+    ''' updates stats after a class of one group was saved, must be called
+    after attendance was written '''
+    if not present_ids:
+        # nobody came, the class does not count as a class of the group
+        return
+    existing = _with_stats(set(present_ids) | set(absent_ids))
+    StudentStats.objects.filter(student_id__in=existing & set(present_ids)).update(
+        attended=F('attended') + 1,
+        last_attended=Case(When(last_attended__gte=date, then=F('last_attended')),
+                           default=Value(date), output_field=DateField()))
+    StudentStats.objects.filter(student_id__in=existing & set(homework_ids)).update(
+        homework=F('homework') + 1)
+    StudentStats.objects.filter(student_id__in=existing & set(absent_ids)).update(
+        missed=F('missed') + 1)
+
+
+def grades_recorded(scores):
+    ''' updates stats after grades were saved, scores is a dict of student id:
+    score; must be called after grades were written '''
+    existing = _with_stats(scores)
+    added = [When(student_id=student_id, then=Value(int(score)))
+             for student_id, score in scores.items() if student_id in existing]
+    if added:
+        # one query no matter how many students and scores there are
+        StudentStats.objects.filter(student_id__in=existing).update(
+            grade_sum=F('grade_sum') + Case(*added, default=Value(0),
+                                            output_field=PositiveIntegerField()),
+            grade_count=F('grade_count') + 1)
+
+
+def _grade_removed(student_id, score):
+    # update() does not create stats of a student which is being deleted
+    StudentStats.objects.filter(student_id=student_id).update(
+        grade_sum=F('grade_sum') - score, grade_count=F('grade_count') - 1)
+
+
+def _rebuild_groups(group_ids):
+    group_ids = set(group_id for group_id in group_ids if group_id is not None)
+    if group_ids:
+        rebuild_stats(Student.objects.filter(group_id__in=group_ids))
+
+
+def _class_date_groups(class_date):
+    return set(Student.objects.filter(
+        Q(student=class_date) | Q(has_homework=class_date)).values_list('group_id', flat=True))
+
+
+# bulk paths (edziennik.bulk) call attendance_recorded and grades_recorded,
+# other changes, e.g. in admin, are handled by signals below
+
+@receiver(pre_save, sender=Grades)
+def grade_saving(sender, instance, **kwargs):
+    instance._old_grade = Grades.objects.filter(pk=instance.pk).values_list(
+        'student_id', 'score').first() if instance.pk else None
+
+
+@receiver(post_save, sender=Grades)
+def grade_saved(sender, instance, **kwargs):
+    old = getattr(instance, '_old_grade', None)
+    if old:
+        _grade_removed(*old)
+    grades_recorded({instance.student_id: instance.score})
+
+
+@receiver(post_delete, sender=Grades)
+def grade_deleted(sender, instance, **kwargs):
+    _grade_removed(instance.student_id, instance.score)
+
+
+@receiver(pre_save, sender=Student)
+def student_saving(sender, instance, **kwargs):
+    instance._old_group_id = Student.objects.filter(pk=instance.pk).values_list(
+        'group_id', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, created, **kwargs):
+    if created:
+        rebuild_stats([instance])
+    elif instance._old_group_id != instance.group_id:
+        # classes of both groups are the ones attended by any of their students,
+        # so missed classes of the others may change as well
+        _rebuild_groups([instance._old_group_id, instance.group_id])
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    # classes attended only by this student are no longer classes of the group
+    _rebuild_groups([instance.group_id])
+
+
+@receiver(post_save, sender=ClassDate)
+def class_date_saved(sender, instance, created, **kwargs):
+    if not created:
+        _rebuild_groups(_class_date_groups(instance))
+
+
+@receiver(pre_delete, sender=ClassDate)
+def class_date_deleting(sender, instance, **kwargs):
+    instance._stats_groups = _class_date_groups(instance)
+
+
+@receiver(post_delete, sender=ClassDate)
+def class_date_deleted(sender, instance, **kwargs):
+    _rebuild_groups(getattr(instance, '_stats_groups', ()))
+
+
+@receiver(m2m_changed, sender=ClassDate.student.through)
+@receiver(m2m_changed, sender=ClassDate.has_homework.through)
+def class_date_students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._stats_groups = [instance.group_id] if reverse else \
+            _class_date_groups(instance)
+    elif action == 'post_clear':
+        _rebuild_groups(getattr(instance, '_stats_groups', ()))
+    elif action in ('post_add', 'post_remove'):
+        if reverse:
+            group_ids = [instance.group_id]
+        else:
+            group_ids = Student.objects.filter(id__in=pk_set).values_list(
+                'group_id', flat=True)
+        _rebuild_groups(group_ids)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple, OrderedDict
+
+from django.contrib.staticfiles.templatetags.staticfiles import static
+
+from edziennik.models import ClassDate, Grades
+
+# attendance statuses of a student on a given class date
+ABSENT = 'absent'
+PRESENT = 'present'
+PRESENT_NO_HOMEWORK = 'present_no_homework'
+
+ATTENDANCE_ICONS = {
+    ABSENT: 'img/x-mark-red.png',
+    PRESENT: 'img/check_sign_icon_green.png',
+    PRESENT_NO_HOMEWORK: 'img/green_on_red.png',
+}
+
+# the same as in the legend of attendance tables
+ATTENDANCE_LABELS = {
+    ABSENT: 'nieobecny',
+    PRESENT: 'obecny',
+    PRESENT_NO_HOMEWORK: 'obecny bez zadania domowego',
+}
+
+AttendanceMatrix = namedtuple('AttendanceMatrix', ['students', 'rows'])
+AttendanceRow = namedtuple('AttendanceRow', ['class_date', 'statuses'])
+TimelineRow = namedtuple('TimelineRow', ['class_date', 'status'])
+GradeSheet = namedtuple('GradeSheet', ['students', 'rows'])
+GradeRow = namedtuple('GradeRow', ['date_of_test', 'name', 'scores'])
+
+
+def attendance_status(attended, has_homework):
+    ''' returns one of ABSENT, PRESENT, PRESENT_NO_HOMEWORK '''
+    if not attended:
+        return ABSENT
+    return PRESENT if has_homework else PRESENT_NO_HOMEWORK
+
+
+def attendance_icon(status):
+    ''' returns html img tag used to display attendance status '''
+    return '<img src=%s>' % static(ATTENDANCE_ICONS[status])
+
+
+def build_attendance_matrix(group):
+    ''' returns students of a group and, for every class date in this group,
+    a row with attendance status of each student;
+    uses 4 queries no matter how many students and class dates there are '''
+    students = list(group.student_set.all())
+    class_dates = ClassDate.objects.filter(
+        student__group=group).distinct().order_by('date_of_class', 'id')
+
+    attended = set(ClassDate.student.through.objects.filter(
+        student__group=group).values_list('classdate_id', 'student_id'))
+    homework = set(ClassDate.has_homework.through.objects.filter(
+        student__group=group).values_list('classdate_id', 'student_id'))
+
+    rows = []
+    for class_date in class_dates:
+        statuses = []
+        for student in students:
+            key = (class_date.id, student.id)
+            statuses.append(
+                attendance_status(key in attended, key in homework))
+        rows.append(AttendanceRow(class_date, statuses))
+    return AttendanceMatrix(students, rows)
+
+
+def build_student_timeline(student):
+    ''' returns a row with attendance status of a student for every class date
+    in his group; uses 3 queries no matter how many class dates there are '''
+    attended = set(student.student.values_list('id', flat=True))
+    homework = set(student.has_homework.values_list('id', flat=True))
+    class_dates = ClassDate.objects.filter(
+        student__group_id=student.group_id).distinct().order_by('date_of_class', 'id')
+
+    return [TimelineRow(class_date, attendance_status(
+                class_date.id in attended, class_date.id in homework))
+            for class_date in class_dates]
+
+
+def build_grade_sheet(group):
+    ''' returns students of a group and, for every (date_of_test, name) pair,
+    a row with the score of each student or None if student has no such grade;
+    uses 2 queries no matter how many students and grades there are '''
+    students = list(group.student_set.all())
+    grades = Grades.objects.filter(student__group=group).order_by(
+        'date_of_test', 'id').values_list(
+            'date_of_test', 'name', 'student_id', 'score')
+
+    scores = OrderedDict()
+    for date_of_test, name, student_id, score in grades:
+        scores.setdefault((date_of_test, name), {}).setdefault(student_id, score)
+
+    rows = []
+    for (date_of_test, name), scores_by_student in scores.items():
+        rows.append(GradeRow(date_of_test, name,
+                             [scores_by_student.get(s.id) for s in students]))
+    return GradeSheet(students, rows)
+
+
+def grade_table_content(sheet):
+    ''' returns rows of a grade sheet ready to be displayed in a table '''
+    table_content = []
+    for row in sheet.rows:
+        date_string = row.date_of_test.strftime("%d/%m/%Y") if row.date_of_test else '-'
+        table_content.append([date_string, row.name] + [
+            '-' if score is None else score for score in row.scores])
+    return table_content
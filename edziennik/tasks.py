@@ -2,8 +2,6 @@
 from django.conf import settings
 from django.core.mail import send_mail
 
-from twilio.rest import Client
-
 from celery.decorators import task
 from celery.utils.log import get_task_logger
 from celery.task.schedules import crontab
@@ -12,6 +10,11 @@ from celery.decorators import periodic_task
 from edziennik.models import SMS, Student
 
 from edziennik.utils2 import generate_weekly_admin_report
+from edziennik.sms_status import check_twilio_statuses, due_for_first_check,\
+                                  due_for_second_check, schedule_once,\
+                                  release_schedule, seconds_to_next_check,\
+                                  FIRST_CHECK_AFTER, SECOND_CHECK_AFTER,\
+                                  FIRST_CHECK_PENDING, SECOND_CHECK_PENDING
 
 logger = get_task_logger(__name__)
 
@@ -42,46 +45,47 @@ def weekly_admin_email():
     admin_email(email_title, email_body)
     logger.info("email to admin has been sent")
 
+@task(name='absence_notifications_task')
+def absence_notifications_task(student_ids):
+    ''' notifies parents of all students absent on a class '''
+    # imported here as edziennik.utils imports this module
+    from edziennik.utils import students_absence
+    students = Student.objects.filter(id__in=student_ids).select_related('parent__user')
+    students_absence(students)
+    logger.info("absence of %s students notified" % len(student_ids))
+
 #twilio sms
-@task(name='twilio_first_sms_status_check_task')
-def twilio_first_sms_status_check_task():
-    ''' after time specified in call parameter checks msg status with sms provider '''
+def schedule_sms_status_checks():
+    ''' makes sure first and second status checks are pending; called after
+    every sms sent, however many messages go out only one task of each
+    kind waits in the broker '''
+    schedule_once(twilio_first_sms_status_check_task, FIRST_CHECK_PENDING,
+                  FIRST_CHECK_AFTER.total_seconds())
+    schedule_once(twilio_second_sms_status_check_task, SECOND_CHECK_PENDING,
+                  SECOND_CHECK_AFTER.total_seconds())
+
+@periodic_task(
+    run_every=(crontab(minute='*/30')),
+    name="sms_status_sweep",
+    ignore_result=True
+)
+def sms_status_sweep_task():
+    ''' delivery statuses are reported by webhooks, this checks statuses
+    of messages which did not get a report in time '''
+    first_sms_status_check()
+    second_sms_status_check()
+
+def first_sms_status_check():
     logger.info("first sms status check")
-    new_msgs = SMS.objects.filter(checked_once=False)
-    ACCOUNT_SID = settings.TWILIO_ACCOUNT_SID
-    AUTH_TOKEN = settings.TWILIO_AUTH_TOKEN
-    client = Client(ACCOUNT_SID, AUTH_TOKEN)
-    for msg in new_msgs:
-        fetched = client.messages(msg.twilio_message_sid).fetch()
-        msg.checked_once = True
-        msg.save()
-        if fetched.status == 'delivered':
-            msg.twilio_message_status = 'delivered'
-            msg.delivered = True
-            msg.save()
-        else:
-            msg.twilio_message_status = fetched.status
-            msg.save()
+    new_msgs = due_for_first_check()
+    checked = check_twilio_statuses(new_msgs, 'checked_once')
+    logger.info("status of %s sms checked" % len(checked))
 
-@task(name='twilio_second_sms_status_check_task')
-def twilio_second_sms_status_check_task():
-    '''  after time specified in call parameter checks msg status
-    with sms provider for messages which had not "delivered" status '''
+def second_sms_status_check():
     logger.info("second sms status check")
-    undelivered_msgs = SMS.objects.filter(checked_once=True, checked_twice=False, delivered=False)
-    ACCOUNT_SID = settings.TWILIO_ACCOUNT_SID
-    AUTH_TOKEN = settings.TWILIO_AUTH_TOKEN
-    client = Client(ACCOUNT_SID, AUTH_TOKEN)
-    for msg in undelivered_msgs:
-        fetched = client.messages(msg.twilio_message_sid).fetch()
-        msg.checked_twice = True
-        msg.save()
-        if fetched.status == 'delivered':
-            msg.twilio_message_status = 'delivered'
-            msg.delivered = True
-            msg.save()
-        else:
-            msg.twilio_message_status = fetched.status
+    undelivered_msgs = due_for_second_check()
+    for msg, fetched in check_twilio_statuses(undelivered_msgs, 'checked_twice'):
+        if fetched.status != 'delivered':
             mail_title = 'SMS undelivered to %s' % msg.addressee.username
             mail_body = 'SMS to {parent_name} was undelivered. Message details:\n\
             phone_number: {phone_number}\n\
@@ -89,8 +93,32 @@ def twilio_second_sms_status_check_task():
             message: {msg_body}\n\
             message sid: {msg_sid}\n\
             message status: {msg_status}'.format(parent_name=msg.addressee.username,
-                                                    phone_number=msg.to, msg_body=msg.body,
-                                                    msg_sid=msg.sid,
-                                                    msg_status=msg.status)
+                                                    phone_number=fetched.to, msg_body=msg.message,
+                                                    msg_sid=msg.twilio_message_sid,
+                                                    msg_status=fetched.status)
             admin_email(mail_title, mail_body)
-            
+
+@task(name='twilio_first_sms_status_check_task')
+def twilio_first_sms_status_check_task():
+    ''' checks msg status with sms provider for messages sent
+    at least FIRST_CHECK_AFTER ago '''
+    release_schedule(FIRST_CHECK_PENDING)
+    first_sms_status_check()
+    # messages sent after this task had been scheduled
+    countdown = seconds_to_next_check(
+        SMS.objects.filter(checked_once=False), FIRST_CHECK_AFTER)
+    if countdown is not None:
+        schedule_once(twilio_first_sms_status_check_task,
+                      FIRST_CHECK_PENDING, countdown)
+
+@task(name='twilio_second_sms_status_check_task')
+def twilio_second_sms_status_check_task():
+    ''' checks msg status with sms provider for messages sent at least
+    SECOND_CHECK_AFTER ago which had not "delivered" status '''
+    release_schedule(SECOND_CHECK_PENDING)
+    second_sms_status_check()
+    countdown = seconds_to_next_check(
+        SMS.objects.filter(checked_twice=False, delivered=False), SECOND_CHECK_AFTER)
+    if countdown is not None:
+        schedule_once(twilio_second_sms_status_check_task,
+                      SECOND_CHECK_PENDING, countdown)
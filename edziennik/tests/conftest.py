@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+# the asyncio client and its tests use Python 3.5+ syntax, on Python 2 they
+# are run by python3 from test_smsapi.TestAsyncClient
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_smsapi_aio.py')
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    tables cached by one test must not be seen by the next one, whose
+    objects get the same ids
+    """
+    from django.core.cache import cache
+    cache.clear()
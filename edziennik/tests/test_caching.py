@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mixer.backend.django import mixer
+import pytest
+
+from edziennik import caching, views
+from edziennik.bulk import record_attendance, record_grades
+from edziennik.caching import cached, cache_stats, GROUP_ATTENDANCE, GROUP_GRADES, STUDENT
+from edziennik.models import Group, Student, ClassDate, Grades
+from edziennik.redis_cache import RedisCache
+
+pytestmark = pytest.mark.django_db
+today = datetime.today().date()
+
+
+def grade_tables(group):
+    return cached('group_grades', group.id, [(GROUP_GRADES, group.id)],
+                  lambda: views.grade_sheet(group))
+
+
+def attendance_dates(group):
+    return cached('group_attendance', group.id, [(GROUP_ATTENDANCE, group.id)],
+                  lambda: list(ClassDate.objects.filter(
+                      student__group=group).distinct().values_list('id', flat=True)))
+
+
+def student_grades(student):
+    return cached('student_tables', student.id, [(STUDENT, student.id)],
+                  lambda: list(student.grades_set.values_list('name', flat=True)))
+
+
+class TestCachedViews(TestCase):
+    def setUp(self):
+        caching.reset_cache_stats()
+        self.group = mixer.blend(Group)
+        self.students = [mixer.blend(Student, group=self.group) for i in range(5)]
+        for i in range(5):
+            class_date = ClassDate.objects.create(date_of_class=today)
+            class_date.student.add(*self.students[:3])
+            for student in self.students:
+                Grades.objects.create(name='test %d' % i, student=student, score=5,
+                                      date_of_test=today)
+        User.objects.create_superuser(
+            username='admin', email='jlennon@beatles.com', password='glassonion')
+        self.client.login(username='admin', password='glassonion')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_repeated_views(self):
+        """
+        tables should be built once and then read from cache
+        """
+        for name, url in (
+                ('student_tables', reverse('edziennik:student', args=(self.students[0].id,))),
+                ('group_grades', reverse('edziennik:show_group_grades', args=(self.group.id,))),
+                ('group_attendance', reverse('edziennik:attendance_by_group',
+                                             args=(self.group.id,)))):
+            first, response = self.count_queries(url)
+            second, cached_response = self.count_queries(url)
+            self.assertTrue(second < first, name)
+            self.assertEqual(cached_response.content, response.content)
+            self.assertEqual(cache_stats()[name],
+                             {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_bulk_grades(self):
+        """
+        grades added by the form should be displayed at once
+        """
+        url = reverse('edziennik:student', args=(self.students[0].id,))
+        self.client.get(url)
+        record_grades('new test', today, {self.students[0]: 4})
+        response = self.client.get(url)
+        self.assertContains(response, 'new test')
+        self.assertEqual(cache_stats()['student_tables']['misses'], 2)
+
+
+class TestInvalidation(TestCase):
+    def setUp(self):
+        self.group = mixer.blend(Group)
+        self.other_group = mixer.blend(Group)
+        self.student = mixer.blend(Student, group=self.group, name='Ala')
+
+    def test_grade_saved_and_deleted(self):
+        """
+        tables of the student and his group should change, other groups not
+        """
+        other = grade_tables(self.other_group)
+        grade = Grades.objects.create(name='test', student=self.student, score=3)
+        self.assertEqual(student_grades(self.student), ['test'])
+        self.assertEqual(len(grade_tables(self.group)[1]), 1)
+        grade.delete()
+        self.assertEqual(student_grades(self.student), [])
+        self.assertEqual(grade_tables(self.group)[1], [])
+        self.assertEqual(grade_tables(self.other_group), other)
+
+    def test_bulk_attendance(self):
+        """
+        attendance saved with bulk_create should change attendance of the group
+        """
+        self.assertEqual(attendance_dates(self.group), [])
+        class_date, absent = record_attendance(self.group, 'subject', [self.student.id], [])
+        self.assertEqual(attendance_dates(self.group), [class_date.id])
+
+    def test_m2m_changes(self):
+        """
+        adding, removing and clearing students of a class should change
+        attendance of their group
+        """
+        class_date = ClassDate.objects.create(date_of_class=today)
+        self.assertEqual(attendance_dates(self.group), [])
+        class_date.student.add(self.student)
+        self.assertEqual(attendance_dates(self.group), [class_date.id])
+        class_date.student.clear()
+        self.assertEqual(attendance_dates(self.group), [])
+        self.student.student.add(class_date)
+        self.assertEqual(attendance_dates(self.group), [class_date.id])
+        class_date.delete()
+        self.assertEqual(attendance_dates(self.group), [])
+
+    def test_student_moved(self):
+        """
+        student moved to another group should disappear from the old one
+        """
+        self.assertEqual(grade_tables(self.group)[0], [self.student])
+        self.assertEqual(grade_tables(self.other_group)[0], [])
+        self.student.group = self.other_group
+        self.student.save()
+        self.assertEqual(grade_tables(self.group)[0], [])
+        self.assertEqual(grade_tables(self.other_group)[0], [self.student])
+
+    def test_lost_version(self):
+        """
+        version lost from cache should not bring back an old table
+        """
+        grade_tables(self.group)
+        caching.cache.delete(caching._version_key(GROUP_GRADES, self.group.id))
+        Grades.objects.create(name='test', student=self.student, score=3)
+        self.assertEqual(len(grade_tables(self.group)[1]), 1)
+
+
+class FakeRedis(object):
+    """
+    keeps values in a dict, expiration is not simulated
+    """
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def exists(self, key):
+        return key in self.values
+
+    def incr(self, key, delta):
+        self.values[key] = str(int(self.values[key]) + delta).encode()
+        return int(self.values[key])
+
+    def scan_iter(self, match):
+        return [key for key in list(self.values) if key.startswith(match[:-1])]
+
+
+class TestRedisCache(TestCase):
+    def test_values(self):
+        """
+        pickled values and integers should be read back, incr should
+        only work on existing keys
+        """
+        cache = RedisCache('redis://localhost:6379/0', {'KEY_PREFIX': 'test'})
+        cache._client = FakeRedis()
+        cache.set('table', [('a', 1)])
+        self.assertEqual(cache.get('table'), [('a', 1)])
+        self.assertTrue(cache.add('version', 10, None))
+        self.assertFalse(cache.add('version', 20, None))
+        self.assertEqual(cache.incr('version'), 11)
+        self.assertEqual(cache.get_many(['version', 'table', 'missing']),
+                         {'version': 11, 'table': [('a', 1)]})
+        self.assertRaises(ValueError, cache.incr, 'missing')
+        cache._client.values['other'] = b'celery'
+        cache.clear()
+        self.assertEqual(list(cache._client.values), ['other'])
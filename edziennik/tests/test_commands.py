@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.core.management import call_command
+from django.utils.six import StringIO
+import pytest
+
+from edziennik.management.commands.explain_hot_queries import hot_queries
+
+pytestmark = pytest.mark.django_db
+
+
+class TestExplainHotQueries(TestCase):
+    def test_explain_all_queries(self):
+        """
+        query plan of every hot query should be printed
+        """
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        output = out.getvalue()
+        for description, queryset in hot_queries():
+            self.assertIn('== %s' % description, output)
+        self.assertIn('USING INDEX', output)
+
+
+class TestBenchmark(TestCase):
+    def test_repeated_runs(self):
+        """
+        benchmark should run next to existing users and leave no data behind
+        """
+        User.objects.create(username='benchmark_lector')
+        users = User.objects.count()
+        for run in range(2):
+            out = StringIO()
+            call_command('benchmark', 'grades', sizes='2', tests=2, repeat=1, stdout=out)
+            self.assertIn('render [ms]', out.getvalue())
+        self.assertEqual(User.objects.count(), users)
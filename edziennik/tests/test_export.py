@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from datetime import datetime, timedelta
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.utils.six import StringIO
+from mixer.backend.django import mixer
+import pytest
+
+from edziennik import export
+from edziennik.models import Group, Lector, Student, ClassDate, Grades
+
+pytestmark = pytest.mark.django_db
+today = datetime.today().date()
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.group = mixer.blend(Group, name=u'Grupa żółta')
+        self.other = mixer.blend(Group, name='Other')
+        self.student1 = mixer.blend(Student, group=self.group, name=u'Łucja')
+        self.student2 = mixer.blend(Student, group=self.group, name='Jan')
+        other_student = mixer.blend(Student, group=self.other, name='Ola')
+
+        self.class_date1 = ClassDate.objects.create(
+            date_of_class=today - timedelta(1), subject='past simple')
+        self.class_date1.student.add(self.student1, self.student2)
+        self.class_date1.has_homework.add(self.student2)
+        self.class_date2 = ClassDate.objects.create(date_of_class=today, subject='irregular verbs')
+        self.class_date2.student.add(self.student2)
+        self.class_date2.has_homework.add(self.student2)
+        # homework of a class without attendance is not exported
+        ClassDate.objects.create(date_of_class=today - timedelta(2)).has_homework.add(
+            self.student1)
+        ClassDate.objects.create(date_of_class=today).student.add(other_student)
+
+        Grades.objects.create(name='test', date_of_test=today, student=self.student1, score=5)
+        Grades.objects.create(name='test', date_of_test=today, student=self.student2, score=3)
+        Grades.objects.create(name='quiz', date_of_test=today, student=self.student2, score=4)
+
+
+class TestExportRows(ExportTestCase):
+    def test_attendance_rows(self):
+        """
+        every class of a group should be a row with status of each student
+        """
+        rows = list(export.attendance_rows([self.group]))
+        self.assertEqual(rows, [
+            [u'Grupa żółta', 'data', 'temat', u'Łucja', 'Jan'],
+            [u'Grupa żółta', today - timedelta(1), 'past simple',
+             'obecny bez zadania domowego', 'obecny'],
+            [u'Grupa żółta', today, 'irregular verbs', 'nieobecny', 'obecny'],
+        ])
+
+    def test_grade_rows(self):
+        """
+        every test of a group should be a row with score of each student
+        """
+        rows = list(export.grade_rows([self.group]))
+        self.assertEqual(rows, [
+            [u'Grupa żółta', 'data', 'za co', u'Łucja', 'Jan'],
+            [u'Grupa żółta', today, 'quiz', None, 4],
+            [u'Grupa żółta', today, 'test', 5, 3],
+        ])
+
+    def test_csv(self):
+        """
+        rows should be written as utf-8 csv lines
+        """
+        lines = list(export.csv_lines(export.grade_rows([self.group])))
+        self.assertEqual(len(lines), 3)
+        content = ''.join(lines)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        self.assertIn(u'Grupa żółta,%s,quiz,,4' % today, content.decode('utf-8'))
+
+
+class TestExportView(ExportTestCase):
+    def test_school_wide_for_superuser(self):
+        """
+        superuser should get attendance of all groups streamed as csv
+        """
+        User.objects.create_superuser(
+            username='admin', email='jlennon@beatles.com', password='glassonion')
+        self.client.login(username='admin', password='glassonion')
+        response = self.client.get(reverse('edziennik:export_table', args=('attendance',)))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="attendance.csv"')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 5)
+        self.assertIn('Other,data,temat,Ola', content)
+
+    def test_group_for_its_lector(self):
+        """
+        lector should only export groups he teaches and not the whole school
+        """
+        user = User.objects.create_user(username='john', password='glassonion', is_staff=True)
+        self.group.lector = Lector.objects.create(user=user)
+        self.group.save()
+        self.client.login(username='john', password='glassonion')
+
+        response = self.client.get(
+            reverse('edziennik:export_group_table', args=(self.group.id, 'grades')))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+
+        response = self.client.get(
+            reverse('edziennik:export_group_table', args=(self.other.id, 'grades')))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('edziennik:export_table', args=('grades',)))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestExportCommand(ExportTestCase):
+    def test_csv_to_stdout(self):
+        """
+        chosen group should be written as csv
+        """
+        out = StringIO()
+        call_command('export_tables', 'grades', groups=[self.other.id], stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['Other,data,za co,Ola'])
+
+    @pytest.mark.skipif(export.openpyxl is None, reason='openpyxl is not installed')
+    def test_xlsx(self):
+        """
+        xlsx file should have rows of all groups
+        """
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command('export_tables', 'attendance', format='xlsx', output=path)
+        sheet = export.openpyxl.load_workbook(path).active
+        self.assertEqual(sheet.max_row, 5)
+        self.assertEqual(sheet.cell(row=1, column=4).value, u'Łucja')
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+from datetime import datetime
+from django.template.base import Template
+from django.test import TestCase, override_settings
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mixer.backend.django import mixer
+import pytest
+
+from edziennik import instrumentation
+from edziennik.middleware import InstrumentationMiddleware
+from edziennik.instrumentation import Measurement, Recorder
+from edziennik.models import Group, Student, ClassDate
+
+pytestmark = pytest.mark.django_db
+today = datetime.today().date()
+
+
+def measurement(view, time, queries):
+    return Measurement(view=view, method='GET', path='/', status=200, time=time,
+                       queries=queries, sql_time=time / 2, template_time=0.0, size=10,
+                       timestamp=0)
+
+
+class TestRecorder(TestCase):
+    def test_ring_buffer(self):
+        """
+        only the last measurements should be kept
+        """
+        recorder = Recorder(3)
+        for i in range(5):
+            recorder.add(measurement('view %d' % i, 0.1, i))
+        self.assertEqual([m.view for m in recorder.recent()], ['view 2', 'view 3', 'view 4'])
+
+    def test_summary(self):
+        """
+        views should be ordered by average time and by maximum query count
+        """
+        recorder = Recorder(10)
+        recorder.add(measurement('fast', 0.1, 50))
+        recorder.add(measurement('fast', 0.3, 10))
+        recorder.add(measurement('slow', 1.0, 5))
+
+        summary = recorder.summary()
+        self.assertEqual(summary['fast']['requests'], 2)
+        self.assertAlmostEqual(summary['fast']['avg_time'], 0.2)
+        self.assertAlmostEqual(summary['fast']['max_time'], 0.3)
+        self.assertEqual(summary['fast']['max_queries'], 50)
+        self.assertAlmostEqual(summary['fast']['avg_queries'], 30)
+        self.assertEqual([view['view'] for view in recorder.slowest()], ['slow', 'fast'])
+        self.assertEqual([view['view'] for view in recorder.most_queries()], ['fast', 'slow'])
+
+
+class CapturingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@override_settings(INSTRUMENT_VIEWS=True)
+class TestInstrumentationMiddleware(TestCase):
+    def setUp(self):
+        instrumentation.recorder().clear()
+        self.addCleanup(instrumentation.recorder().clear)
+        self.addCleanup(instrumentation.uninstall_template_timer)
+        self.handler = CapturingHandler()
+        instrumentation.logger.addHandler(self.handler)
+        self.addCleanup(instrumentation.logger.removeHandler, self.handler)
+
+        self.group = mixer.blend(Group)
+        students = [mixer.blend(Student, group=self.group) for i in range(3)]
+        ClassDate.objects.create(date_of_class=today).student.add(*students)
+        User.objects.create_superuser(
+            username='admin', email='jlennon@beatles.com', password='glassonion')
+        self.client.login(username='admin', password='glassonion')
+
+    def test_measurement(self):
+        """
+        query count, times and size of the response should be recorded and logged
+        """
+        url = reverse('edziennik:attendance_by_group', args=(self.group.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        measured, = instrumentation.recorder().recent()
+        self.assertEqual(measured.view, 'edziennik.views.attendance_by_group')
+        self.assertEqual(measured.path, url)
+        self.assertEqual(measured.status, 200)
+        self.assertEqual(measured.queries, len(queries))
+        self.assertEqual(measured.size, len(response.content))
+        self.assertGreater(measured.template_time, 0)
+        self.assertGreaterEqual(measured.time, measured.sql_time + measured.template_time)
+
+        logged = json.loads(self.handler.messages[-1])
+        self.assertEqual(logged['view'], 'edziennik.views.attendance_by_group')
+        self.assertEqual(logged['queries'], measured.queries)
+
+    def test_streaming_response(self):
+        """
+        size of streamed responses is not known
+        """
+        response = self.client.get(reverse('edziennik:export_table', args=('grades',)))
+        self.assertEqual(response.status_code, 200)
+        measured, = instrumentation.recorder().recent()
+        self.assertEqual(measured.view, 'edziennik.views.export_table')
+        self.assertIsNone(measured.size)
+
+    def test_debug_cursor_restored(self):
+        """
+        queries should not be logged by the connection after the request
+        """
+        self.client.get(reverse('edziennik:group', args=(self.group.id,)))
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_stats_page(self):
+        """
+        superuser should see measured views
+        """
+        self.client.get(reverse('edziennik:group', args=(self.group.id,)))
+        response = self.client.get(reverse('edziennik:instrumentation'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'edziennik.views.group')
+        self.assertNotContains(response, 'INSTRUMENT_VIEWS=1')
+
+    def test_stats_page_not_for_lectors(self):
+        """
+        other users should not see the stats page
+        """
+        self.client.logout()
+        User.objects.create_user(username='lector', password='glassonion')
+        self.client.login(username='lector', password='glassonion')
+        response = self.client.get(reverse('edziennik:instrumentation'))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestInstrumentationDisabled(TestCase):
+    def test_templates_not_patched(self):
+        """
+        rendering of templates should be left as it is
+        """
+        render = Template.__dict__['render']
+        with override_settings(INSTRUMENT_VIEWS=True):
+            InstrumentationMiddleware()
+        self.assertIsNot(Template.__dict__['render'], render)
+        with self.assertRaises(MiddlewareNotUsed):
+            InstrumentationMiddleware()
+        self.assertIs(Template.__dict__['render'], render)
+
+    def test_nothing_recorded(self):
+        """
+        without INSTRUMENT_VIEWS views should not be measured
+        """
+        instrumentation.recorder().clear()
+        User.objects.create_superuser(
+            username='admin', email='jlennon@beatles.com', password='glassonion')
+        self.client.login(username='admin', password='glassonion')
+        response = self.client.get(reverse('edziennik:instrumentation'))
+        self.assertContains(response, 'INSTRUMENT_VIEWS=1')
+        self.assertEqual(instrumentation.recorder().recent(), [])
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import User, AnonymousUser
+from mixer.backend.django import mixer
+import pytest
+from edziennik.middleware import RoleMiddleware
+from edziennik.models import Lector, Parent
+from edziennik.roles import Role, LECTOR, PARENT, ADMIN, ANONYMOUS, OTHER
+
+pytestmark = pytest.mark.django_db
+
+
+class TestRole(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='john',
+                                 email='jlennon@beatles.com',
+                                 password='glassonion')
+
+    def test_anonymous(self):
+        """
+        anonymous user has no role and no queries are made
+        """
+        with self.assertNumQueries(0):
+            role = Role(AnonymousUser())
+            self.assertEqual(role.name, ANONYMOUS)
+            self.assertFalse(role.is_lector)
+            self.assertFalse(role.is_parent)
+
+    def test_lector(self):
+        lector = Lector.objects.create(user=self.user)
+        role = Role(self.user)
+        self.assertEqual(role.name, LECTOR)
+        self.assertEqual(role.lector, lector)
+
+    def test_admin(self):
+        admin = User.objects.create_superuser(username='admin',
+                                 email='jlennon@beatles.com',
+                                 password='glassonion')
+        self.assertEqual(Role(admin).name, ADMIN)
+
+    def test_parent(self):
+        parent = Parent.objects.create(user=self.user, phone_number=111111111)
+        role = Role(self.user)
+        self.assertEqual(role.name, PARENT)
+        self.assertEqual(role.parent, parent)
+
+    def test_other(self):
+        self.assertEqual(Role(self.user).name, OTHER)
+
+    def test_lookups_cached(self):
+        """
+        each role is looked up with one query, no matter how many lectors
+        and parents there are
+        """
+        for i in range(5):
+            mixer.blend(Lector)
+            mixer.blend(Parent)
+        role = Role(self.user)
+        with self.assertNumQueries(2):
+            role.name
+            role.name
+            role.is_parent
+
+    def test_middleware(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        RoleMiddleware().process_request(request)
+        self.assertEqual(request.edziennik_role.name, OTHER)
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+import threading
+import time
+from datetime import timedelta
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.utils import timezone
+from django.core import mail
+from mixer.backend.django import mixer
+import pytest
+from twilio.rest import Client
+from twilio.request_validator import RequestValidator
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from edziennik.models import SMS
+from edziennik import sms_status, utils
+from edziennik.sms_status import check_twilio_statuses, due_for_first_check
+from edziennik import tasks
+from edziennik.tasks import twilio_first_sms_status_check_task,\
+                            twilio_second_sms_status_check_task,\
+                            schedule_sms_status_checks
+
+pytestmark = pytest.mark.django_db
+
+
+# message resource as returned by twilio api
+MESSAGE = {
+    'account_sid': 'ACtest', 'api_version': '2010-04-01', 'body': 'absence',
+    'date_created': None, 'date_updated': None, 'date_sent': None,
+    'direction': 'outbound-api', 'error_code': None, 'error_message': None,
+    'from': '+15005550006', 'messaging_service_sid': None, 'num_media': '0',
+    'num_segments': '1', 'price': None, 'price_unit': 'USD', 'sid': None,
+    'status': None, 'subresource_uris': {}, 'to': '+48111111111', 'uri': '',
+}
+
+
+class FakeTwilioServer(ThreadingMixIn, HTTPServer):
+    ''' answers twilio message fetch requests with statuses from self.statuses '''
+    daemon_threads = True
+
+    def __init__(self, statuses, delay=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeTwilioHandler)
+        self.statuses = statuses
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server_address[1]
+
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        sid = re.search(r'/Messages/(\w+)\.json', self.path).group(1)
+        status = server.statuses.get(sid)
+        if status is None:
+            code, body = 404, {'code': 20404, 'message': 'not found', 'status': 404}
+        else:
+            code, body = 200, dict(MESSAGE, sid=sid, status=status)
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeRedis(object):
+    ''' keeps keys set by scheduler, expiration is not simulated '''
+    def __init__(self):
+        self.keys = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = ex
+        return True
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+
+def use_fake_redis(test):
+    ''' points scheduler to a fake redis and records enqueued tasks '''
+    fake = FakeRedis()
+    fake.enqueued = []
+    original = sms_status.redis_connection
+    sms_status.redis_connection = lambda: fake
+    test.addCleanup(setattr, sms_status, 'redis_connection', original)
+    for task in (twilio_first_sms_status_check_task,
+                 twilio_second_sms_status_check_task):
+        task.apply_async = lambda countdown, name=task.name: \
+            fake.enqueued.append((name, countdown))
+        test.addCleanup(delattr, task, 'apply_async')
+    return fake
+
+
+class TestTwilioStatusCheck(TestCase):
+    def start_server(self, statuses, delay=0):
+        server = FakeTwilioServer(statuses, delay)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = Client('ACtest', 'token')
+        client.api.base_url = server.url
+        return server, client
+
+    def test_first_check(self):
+        """
+        statuses should be saved in one update, messages which could not be
+        fetched stay unchecked
+        """
+        delivered = mixer.blend(SMS, service='twilio', twilio_message_sid='SM1',
+                                checked_once=False, delivered=False)
+        sent = mixer.blend(SMS, service='twilio', twilio_message_sid='SM2',
+                           checked_once=False, delivered=False)
+        missing = mixer.blend(SMS, service='twilio', twilio_message_sid='SM3',
+                              checked_once=False, delivered=False)
+        server, client = self.start_server({'SM1': 'delivered', 'SM2': 'sent'})
+
+        # select messages + one update
+        with self.assertNumQueries(2):
+            checked = check_twilio_statuses(
+                SMS.objects.filter(checked_once=False), 'checked_once', client)
+        self.assertEqual(sorted(msg.id for msg, status in checked),
+                         [delivered.id, sent.id])
+        delivered = SMS.objects.get(id=delivered.id)
+        self.assertEqual((delivered.checked_once, delivered.delivered,
+                          delivered.twilio_message_status), (True, True, 'delivered'))
+        sent = SMS.objects.get(id=sent.id)
+        self.assertEqual((sent.checked_once, sent.delivered,
+                          sent.twilio_message_status), (True, False, 'sent'))
+        self.assertFalse(SMS.objects.get(id=missing.id).checked_once)
+
+    def test_concurrent_fetch(self):
+        """
+        statuses should be fetched by several workers at the same time
+        """
+        statuses = {}
+        for i in range(12):
+            statuses['SM%s' % i] = 'delivered'
+            mixer.blend(SMS, service='twilio', twilio_message_sid='SM%s' % i,
+                        delivered=False)
+        server, client = self.start_server(statuses, delay=0.05)
+        with self.settings(SMS_STATUS_CHECK_WORKERS=4):
+            check_twilio_statuses(SMS.objects.all(), 'checked_once', client)
+        self.assertEqual(server.requests, 12)
+        self.assertTrue(1 < server.max_in_flight <= 4)
+        self.assertEqual(SMS.objects.filter(delivered=True).count(), 12)
+
+    def test_second_check_undelivered_email(self):
+        """
+        admin should get an email about a message which is still undelivered
+        """
+        msg = mixer.blend(SMS, service='twilio', twilio_message_sid='SM1', message='absence',
+                          checked_once=True, checked_twice=False, delivered=False)
+        SMS.objects.filter(id=msg.id).update(
+            timestamp=timezone.now() - timedelta(minutes=30))
+        server, client = self.start_server({'SM1': 'undelivered'})
+        # the task creates its own client, point it to the fake server
+        original = sms_status.twilio_client
+        sms_status.twilio_client = lambda: client
+        self.addCleanup(setattr, sms_status, 'twilio_client', original)
+        use_fake_redis(self)
+        twilio_second_sms_status_check_task()
+        self.assertTrue(SMS.objects.get(id=msg.id).checked_twice)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('absence', mail.outbox[0].body)
+        self.assertIn('+48111111111', mail.outbox[0].body)
+
+
+class TestStatusCheckScheduling(TestCase):
+    def test_only_overdue_messages_checked(self):
+        """
+        messages sent recently should wait for a delivery report
+        """
+        old = mixer.blend(SMS, checked_once=False)
+        SMS.objects.filter(id=old.id).update(
+            timestamp=timezone.now() - timedelta(minutes=10))
+        mixer.blend(SMS, checked_once=False)
+        self.assertEqual(list(due_for_first_check()), [old])
+
+    def test_burst_schedules_one_check_of_each_kind(self):
+        """
+        however many messages are sent, only one first and one second check
+        should wait in the broker
+        """
+        fake = use_fake_redis(self)
+        for i in range(200):
+            schedule_sms_status_checks()
+        self.assertEqual(fake.enqueued, [
+            ('twilio_first_sms_status_check_task', 300),
+            ('twilio_second_sms_status_check_task', 1200)])
+
+    def test_check_reschedules_for_later_messages(self):
+        """
+        check should run again for messages sent after it had been scheduled
+        """
+        fake = use_fake_redis(self)
+        schedule_sms_status_checks()
+        mixer.blend(SMS, service='twilio', checked_once=False, delivered=False)
+        twilio_first_sms_status_check_task()
+        name, countdown = fake.enqueued[-1]
+        self.assertEqual(name, 'twilio_first_sms_status_check_task')
+        self.assertTrue(290 < countdown <= 300)
+        self.assertEqual(len(fake.enqueued), 3)
+
+    def test_check_not_rescheduled_when_nothing_pending(self):
+        """
+        check should not run again if all messages were checked
+        """
+        fake = use_fake_redis(self)
+        schedule_sms_status_checks()
+        twilio_first_sms_status_check_task()
+        self.assertEqual(len(fake.enqueued), 2)
+        # next message sent schedules a new check
+        schedule_sms_status_checks()
+        self.assertEqual(len(fake.enqueued), 3)
+
+
+class TestTwilioStatusCallback(TestCase):
+    def post_report(self, data, token='token'):
+        url = reverse('edziennik:twilio_status_callback')
+        signature = RequestValidator(token).compute_signature(
+            'http://testserver' + url, data)
+        return self.client.post(url, data, HTTP_X_TWILIO_SIGNATURE=signature)
+
+    def test_delivered(self):
+        """
+        delivered message should not be polled any more
+        """
+        msg = mixer.blend(SMS, twilio_message_sid='SM1', delivered=False,
+                          checked_once=False, checked_twice=False)
+        with self.settings(TWILIO_AUTH_TOKEN='token'):
+            response = self.post_report(
+                {'MessageSid': 'SM1', 'MessageStatus': 'delivered'})
+        self.assertEqual(response.status_code, 204)
+        msg = SMS.objects.get(id=msg.id)
+        self.assertEqual((msg.delivered, msg.checked_once, msg.checked_twice,
+                          msg.twilio_message_status), (True, True, True, 'delivered'))
+
+    def test_undelivered(self):
+        """
+        undelivered message should be left for the second check which notifies admin
+        """
+        msg = mixer.blend(SMS, twilio_message_sid='SM1', delivered=False,
+                          checked_once=False, checked_twice=False)
+        with self.settings(TWILIO_AUTH_TOKEN='token'):
+            self.post_report({'MessageSid': 'SM1', 'MessageStatus': 'undelivered'})
+        msg = SMS.objects.get(id=msg.id)
+        self.assertEqual((msg.delivered, msg.checked_once, msg.checked_twice),
+                         (False, True, False))
+
+    def test_late_report_ignored(self):
+        """
+        report which comes after delivered one should not change the message
+        """
+        msg = mixer.blend(SMS, twilio_message_sid='SM1', delivered=True,
+                          twilio_message_status='delivered')
+        with self.settings(TWILIO_AUTH_TOKEN='token'):
+            self.post_report({'MessageSid': 'SM1', 'MessageStatus': 'sent'})
+        self.assertEqual(SMS.objects.get(id=msg.id).twilio_message_status, 'delivered')
+
+    def test_invalid_signature(self):
+        """
+        report signed with another token should be rejected
+        """
+        msg = mixer.blend(SMS, twilio_message_sid='SM1', delivered=False)
+        with self.settings(TWILIO_AUTH_TOKEN='token'):
+            response = self.post_report(
+                {'MessageSid': 'SM1', 'MessageStatus': 'delivered'}, token='other')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(SMS.objects.get(id=msg.id).delivered)
+
+
+class TestSmsapiStatusCallback(TestCase):
+    def test_reports(self):
+        """
+        all reports sent in one request should be saved
+        """
+        msg1 = mixer.blend(SMS, smsapipl_message_id='1001', delivered=False,
+                           checked_once=False)
+        msg2 = mixer.blend(SMS, smsapipl_message_id='1002', delivered=False,
+                           checked_once=False)
+        with self.settings(SMS_CALLBACK_TOKEN='secret'):
+            response = self.client.get(reverse('edziennik:smsapi_status_callback'),
+                {'token': 'secret', 'MsgId': '1001,1002', 'status': '404,406'})
+        self.assertEqual(response.content, b'OK')
+        msg1 = SMS.objects.get(id=msg1.id)
+        self.assertEqual((msg1.delivered, msg1.smsapipl_status), (True, 'DELIVERED'))
+        msg2 = SMS.objects.get(id=msg2.id)
+        self.assertEqual((msg2.delivered, msg2.checked_once, msg2.smsapipl_status),
+                         (False, True, 'FAILED'))
+
+    def test_wrong_token(self):
+        """
+        report without the right token should be rejected
+        """
+        msg = mixer.blend(SMS, smsapipl_message_id='1001', delivered=False)
+        with self.settings(SMS_CALLBACK_TOKEN='secret'):
+            response = self.client.get(reverse('edziennik:smsapi_status_callback'),
+                {'token': 'wrong', 'MsgId': '1001', 'status': '404'})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(SMS.objects.get(id=msg.id).delivered)
+
+    def test_notify_url(self):
+        """
+        reports should be requested only when they can be accepted
+        """
+        with self.settings(SITE_URL='https://example.com', SMS_CALLBACK_TOKEN=None):
+            self.assertNotIn('notify_url', utils.smsapi_options())
+        with self.settings(SITE_URL=None, SMS_CALLBACK_TOKEN='secret'):
+            self.assertNotIn('notify_url', utils.smsapi_options())
+        with self.settings(SITE_URL='https://example.com/', SMS_CALLBACK_TOKEN='a&b c'):
+            self.assertEqual(utils.smsapi_options()['notify_url'],
+                             'https://example.com%s?token=a%%26b+c'
+                             % reverse('edziennik:smsapi_status_callback'))
@@ -0,0 +1,749 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from distutils.spawn import find_executable
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+from django.test import TestCase
+from django.core import mail
+from mixer.backend.django import mixer
+import pytest
+
+from edziennik import utils
+from edziennik.models import SMS, Parent
+from smsapi.batch import BatchMessage, plan_batches, send_batch
+from smsapi.client import SmsAPI
+from smsapi.failover import FailoverPolicy, is_idempotent
+from smsapi.media_cache import MediaCache
+from smsapi.multipart import MultipartBody
+from smsapi.proxy import ApiHttpProxy, ApiProxyError
+from smsapi.request import ApiRequest
+from smsapi.responses import ApiError, ApiRecord, ApiResponse, StreamingApiResponse
+from smsapi.smil import Smil, SmilImage, SmilMedia, SmilTemplate
+from smsapi.testing import StubServer, sms_sent
+from smsapi.transport import BufferedResponse, ConnectError, PooledHttpTransport,\
+                             TransportError, UrllibTransport
+
+pytestmark = pytest.mark.django_db
+
+
+def send(api, number):
+    api.service('sms').action('send')
+    api.set_content('test')
+    api.set_to(number)
+    return api.execute()
+
+
+class TestPooledHttpTransport(TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.addCleanup(self.server.stop)
+        self.transport = PooledHttpTransport()
+        self.addCleanup(self.transport.close)
+        self.api = SmsAPI(transport=self.transport)
+        self.api.set_hostname(self.server.url)
+
+    def test_connection_reused(self):
+        """
+        all messages should be sent through one kept alive connection
+        """
+        for i in range(5):
+            result = send(self.api, '4850000000%d' % i)
+            self.assertEqual(result.number, '4850000000%d' % i)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.transport.connections_made, 1)
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_reconnect_after_server_closed_connection(self):
+        """
+        request on a connection closed by the server should be sent again
+        on a new one
+        """
+        send(self.api, '48500000000')
+        for pool in self.transport._pools.values():
+            for connection in pool:
+                connection.sock.shutdown(2)
+        send(self.api, '48500000001')
+        self.assertEqual(self.transport.connections_made, 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_next_host_used_on_error(self):
+        """
+        proxy should try the next host when a host cannot be reached
+        """
+        self.api.set_hostname(['http://127.0.0.1:1/', self.server.url])
+        send(self.api, '48500000000')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_unsupported_url(self):
+        """
+        only http and https urls can be requested
+        """
+        with self.assertRaises(TransportError):
+            self.transport.request('ftp://example.com/')
+
+
+class TestApiRequest(TestCase):
+    def test_immutable(self):
+        """
+        setting a value should return a new request and keep the base one
+        """
+        base = ApiRequest('sms', 'send').set_from('Info')
+        first = base.set_to('48500000001')
+        second = base.set_to('48500000002')
+        self.assertEqual(len(base.calls), 1)
+        self.assertEqual(first.calls[-1], ('set_to', ('48500000001',), {}))
+        self.assertEqual(second.calls[-1], ('set_to', ('48500000002',), {}))
+        with self.assertRaises(AttributeError):
+            base.service = 'mms'
+
+    def test_unknown_action(self):
+        """
+        request for an action which does not exist should not be created
+        """
+        with self.assertRaises(ValueError):
+            ApiRequest('sms', 'fly')
+
+    def test_shared_client(self):
+        """
+        one client should serve many threads sending at the same time
+        """
+        server = StubServer().start()
+        self.addCleanup(server.stop)
+        transport = PooledHttpTransport(pool_size=8)
+        self.addCleanup(transport.close)
+        api = SmsAPI('user', 'pass', transport=transport)
+        api.set_hostname(server.url)
+        base = api.request('sms', 'send', {'from': 'Info'})
+
+        def send(i):
+            number = '485000000%02d' % i
+            result = api.send(base.set_content('message %d' % i).set_to(number))
+            return number, result.number
+
+        pool = ThreadPool(8)
+        self.addCleanup(pool.close)
+        results = pool.map(send, range(40))
+        self.assertTrue(all(number == sent for number, sent in results))
+        sent = sorted((params['to'], params['message'], params['from'])
+                      for path, params in server.requests)
+        self.assertEqual(sent, sorted(('485000000%02d' % i, 'message %d' % i, 'Info')
+                                      for i in range(40)))
+        self.assertTrue(server.connections <= 8)
+
+
+class TestBatchSend(TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.addCleanup(self.server.stop)
+        self.api = SmsAPI()
+        self.api.set_hostname(self.server.url)
+
+    def test_plan_batches(self):
+        """
+        messages with the same content should be grouped, a number should
+        appear once in a batch and batches should not exceed the limit
+        """
+        messages = [BatchMessage('4850000000%d' % i, 'hello') for i in range(5)] + \
+                   [BatchMessage('48500000000', 'hello'),
+                    BatchMessage('48500000009', 'bye [%1%]', ['Ala'])]
+        batches = [[m.to for m in batch] for batch in plan_batches(messages, 3)]
+        self.assertEqual(batches, [
+            ['48500000000', '48500000001', '48500000002'],
+            ['48500000003', '48500000004', '48500000000'],
+            ['48500000009']])
+
+    def test_personalised_messages_in_one_request(self):
+        """
+        messages differing only by params should be sent in one request
+        """
+        messages = [BatchMessage('48500000001', 'Hello [%1%]', ['Ala'], key=1),
+                    BatchMessage('48500000002', 'Hello [%1%]', ['Ola'], key=2)]
+        results = list(send_batch(self.api, messages, options={'from': 'Info'}))
+        self.assertEqual(len(self.server.requests), 1)
+        path, params = self.server.requests[0]
+        self.assertEqual((params['to'], params['param1'], params['from']),
+                         ('48500000001,48500000002', 'Ala|Ola', 'Info'))
+        self.assertEqual([(r.message.key, r.id, r.error) for r in results],
+                         [(1, '1000', None), (2, '1001', None)])
+        self.assertEqual(results[1].message.render(), 'Hello Ola')
+
+    def test_failed_request(self):
+        """
+        error of one request should be reported for all its messages
+        and other requests should still be sent
+        """
+        def responder(params):
+            if params['message'] == 'bad':
+                return {'error': 13, 'message': 'Invalid number'}
+            return sms_sent(params)
+        self.server.responder = responder
+        messages = [BatchMessage('48500000001', 'bad'),
+                    BatchMessage('48500000002', 'bad'),
+                    BatchMessage('48500000003', 'good')]
+        results = list(send_batch(self.api, messages))
+        self.assertEqual([r.error for r in results], [13, 13, None])
+
+    def test_unreachable_api(self):
+        """
+        request which did not reach the api should be reported for its
+        messages, the others should still be sent
+        """
+        class FailingTransport(UrllibTransport):
+            requests = 0
+
+            def request(self, *args, **kwargs):
+                FailingTransport.requests += 1
+                if FailingTransport.requests == 2:
+                    raise TransportError('Connection refused')
+                return UrllibTransport.request(self, *args, **kwargs)
+
+        api = SmsAPI(transport=FailingTransport())
+        api.set_hostname(self.server.url)
+        messages = [BatchMessage('48500000001', 'first'),
+                    BatchMessage('48500000002', 'second'),
+                    BatchMessage('48500000003', 'third')]
+        results = list(send_batch(api, messages))
+        self.assertEqual([r.id for r in results], ['1000', None, '1000'])
+        self.assertIn(self.server.url, results[1].error)
+
+    def test_non_ascii_params(self):
+        """
+        params, e.g. names of students, should be sent as utf-8
+        """
+        messages = [BatchMessage('48500000001', u'Uczeń [%1%]', [u'Łucja Żółć']),
+                    BatchMessage('48500000002', u'Uczeń [%1%]', [u'Jan'])]
+        results = list(send_batch(self.api, messages))
+        self.assertEqual([r.error for r in results], [None, None])
+        path, params = self.server.requests[0]
+        self.assertEqual((params['message'], params['param1']),
+                         (u'Uczeń [%1%]', u'Łucja Żółć|Jan'))
+
+    def test_send_sms_smsapi_batch(self):
+        """
+        sms rows should be saved for all sent messages and admin should get
+        one email
+        """
+        parents = [mixer.blend(Parent, phone_number=500000000 + i) for i in range(3)]
+        original = utils.smsapi_client
+        utils.smsapi_client = lambda: self.api
+        self.addCleanup(setattr, utils, 'smsapi_client', original)
+        with self.settings(SITE_URL=None):
+            utils.send_sms_smsapi_batch(
+                [(parent, 'Hello [%1%]', [str(i)]) for i, parent in enumerate(parents)])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            sorted(SMS.objects.values_list('addressee_id', 'message', 'smsapipl_message_id')),
+            [(parents[0].user_id, 'Hello 0', '1000'),
+             (parents[1].user_id, 'Hello 1', '1001'),
+             (parents[2].user_id, 'Hello 2', '1002')])
+
+
+class CountingBody(BytesIO):
+    """ remembers how many bytes were read """
+    def read(self, size=-1):
+        data = BytesIO.read(self, size)
+        self.bytes_read = self.tell()
+        return data
+
+
+def contacts(params):
+    """ phonebook with 250 contacts, limit and offset are applied """
+    numbers = ['48500%06d' % i for i in range(250)]
+    offset, limit = int(params.get('offset', 0)), int(params.get('limit', 250))
+    return {'count': len(numbers),
+            'list': [{'number': number, 'first_name': u'Zo\u0142tan'}
+                     for number in numbers[offset:offset + limit]]}
+
+
+class TestStreamingResponse(TestCase):
+    def stream(self, payload, chunk_size=3):
+        body = CountingBody(json.dumps(payload).encode('utf-8'))
+        opened = []
+
+        def open_response():
+            body.seek(0)
+            opened.append(body)
+            return StubResponse(body)
+        return StreamingApiResponse(open_response, chunk_size), body, opened
+
+    def test_items_parsed_incrementally(self):
+        """
+        records should be yielded before the whole body is read,
+        also when values are split between chunks
+        """
+        response, body, opened = self.stream(contacts({}))
+        records = iter(response)
+        first = next(records)
+        self.assertEqual((first.number, first.first_name), ('48500000000', u'Zo\u0142tan'))
+        self.assertTrue(body.bytes_read < len(body.getvalue()) / 10)
+        self.assertEqual(len(list(records)), 249)
+        self.assertEqual(response.count, 250)
+
+    def test_repeated_iteration(self):
+        """
+        every loop should get all records from a new response
+        """
+        response, body, opened = self.stream({'list': [{'id': 1}, {'id': 22}], 'count': 2})
+        self.assertEqual([r.id for r in response], [1, 22])
+        self.assertEqual([r.id for r in response], [1, 22])
+        self.assertEqual(len(opened), 2)
+
+    def test_single_object_and_error(self):
+        """
+        response without a list should give one record, error should be raised
+        """
+        response, body, opened = self.stream({'id': '1', 'status': 'QUEUE'})
+        self.assertEqual(list(response), [ApiRecord({'id': '1', 'status': 'QUEUE'})])
+        response, body, opened = self.stream({'error': 13, 'message': 'Invalid number'})
+        with self.assertRaises(ApiError):
+            list(response)
+
+    def test_record_immutable(self):
+        """
+        records should not be changed
+        """
+        record = ApiRecord({'id': '1'})
+        with self.assertRaises(AttributeError):
+            record.id = '2'
+        with self.assertRaises(AttributeError):
+            record.status
+
+    def test_api_response_independent_iteration(self):
+        """
+        nested loops over one response should not affect each other
+        """
+        response = ApiResponse(BufferedResponse(
+            'http://api/', 200, {}, json.dumps({'list': [{'id': 1}, {'id': 2}]}).encode('utf-8')))
+        pairs = [(a.id, b.id) for a in response for b in response]
+        self.assertEqual(pairs, [(1, 1), (1, 2), (2, 1), (2, 2)])
+
+    def test_stream_and_pages(self):
+        """
+        list endpoint should be streamed over a kept alive connection
+        and paged with limit and offset
+        """
+        server = StubServer(contacts).start()
+        self.addCleanup(server.stop)
+        transport = PooledHttpTransport()
+        self.addCleanup(transport.close)
+        api = SmsAPI('user', 'pass', transport=transport)
+        api.set_hostname(server.url)
+        request = api.request('phonebook', 'contact_list')
+
+        response = api.stream(request, chunk_size=64)
+        self.assertEqual(len(list(response)), 250)
+        self.assertEqual(len(list(response)), 250)
+        self.assertEqual(server.connections, 1)
+
+        pages = list(api.pages(request, page_size=100))
+        self.assertEqual([len(page) for page in pages], [100, 100, 50])
+        self.assertEqual(pages[2][-1].number, '48500000249')
+        self.assertEqual([params['offset'] for path, params in server.requests[2:]],
+                         ['0', '100', '200'])
+
+
+class StubResponse(object):
+    def __init__(self, body):
+        self.body = body
+
+    def geturl(self):
+        return 'http://api/'
+
+    def getcode(self):
+        return 200
+
+    def read(self, size=-1):
+        return self.body.read(size)
+
+    def close(self):
+        pass
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class OkResponse(object):
+    def getcode(self):
+        return 200
+
+
+class TestFailoverPolicy(TestCase):
+    def policy(self, **kwargs):
+        self.clock = FakeClock()
+        return FailoverPolicy(clock=self.clock, sleep=self.clock.sleep,
+                              random=lambda: 0.5, **kwargs)
+
+    def test_healthy_host_first(self):
+        """
+        host which failed recently should be tried after the healthy one
+        """
+        policy = self.policy()
+        policy.record_failure('a')
+        self.assertEqual(policy.order(['a', 'b']), ['b', 'a'])
+        policy.record_success('a')
+        policy.record_failure('b')
+        self.assertEqual(policy.order(['a', 'b']), ['a', 'b'])
+
+    def test_circuit_breaker(self):
+        """
+        host failing several times in a row should be skipped until cooldown passes
+        """
+        policy = self.policy(failure_threshold=3, cooldown=30)
+        for i in range(3):
+            policy.record_failure('a')
+        self.assertEqual(policy.order(['a', 'b']), ['b'])
+        self.clock.now += 31
+        self.assertEqual(policy.order(['a', 'b']), ['b', 'a'])
+        # trial request failed, host is skipped again
+        policy.record_failure('a')
+        self.assertEqual(policy.order(['a', 'b']), ['b'])
+
+    def test_retries_with_backoff(self):
+        """
+        idempotent request should be retried with growing delays,
+        a send without idx only once
+        """
+        policy = self.policy(retries=3, backoff=1, jitter=0.5, failure_threshold=100)
+        tried = []
+        connect = lambda host: tried.append(host)
+        self.assertIsNone(policy.send(['a', 'b'], connect, idempotent=True))
+        self.assertEqual(len(tried), 8)
+        self.assertEqual(self.clock.sleeps, [0.75, 1.5, 3.0])
+
+        del tried[:]
+        policy.send(['a', 'b'], connect, idempotent=False)
+        self.assertEqual(tried, ['a', 'b'])
+
+    def test_deadline(self):
+        """
+        no retry should start after the deadline
+        """
+        policy = self.policy(retries=10, backoff=1, jitter=0, deadline=5,
+                             failure_threshold=100)
+        policy.send(['a'], lambda host: None, idempotent=True)
+        self.assertEqual(self.clock.sleeps, [1, 2])
+
+    def test_success_after_retry(self):
+        """
+        response of a retried request should be returned
+        """
+        policy = self.policy()
+        answers = [None, None, OkResponse()]
+        response = policy.send(['a'], lambda host: answers.pop(0), idempotent=True)
+        self.assertIsInstance(response, OkResponse)
+
+    def test_no_failover_after_sending(self):
+        """
+        send without idx should go to the next host only if it was not
+        sent to the previous one
+        """
+        policy = self.policy(retries=3, failure_threshold=100)
+        tried = []
+
+        def connect(error):
+            def connect(host):
+                tried.append(host)
+                raise error('failed')
+            return connect
+        self.assertIsNone(policy.send(['a', 'b'], connect(TransportError), idempotent=False))
+        self.assertEqual(tried, ['a'])
+
+        del tried[:]
+        policy = self.policy(retries=3, failure_threshold=100)
+        self.assertIsNone(policy.send(['a', 'b'], connect(ConnectError), idempotent=False))
+        self.assertEqual(tried, ['a', 'b'])
+
+    def test_read_timeout_of_send(self):
+        """
+        send which timed out waiting for the response may have been accepted,
+        it should not be sent to the other host
+        """
+        def slow(params):
+            time.sleep(0.5)
+            return sms_sent(params)
+        slow_server = StubServer(slow).start()
+        self.addCleanup(slow_server.stop)
+        server = StubServer().start()
+        self.addCleanup(server.stop)
+        for transport in (PooledHttpTransport(read_timeout=0.1), UrllibTransport(timeout=0.1)):
+            api = SmsAPI('user', 'pass', transport=transport, policy=self.policy())
+            api.set_hostname([slow_server.url, server.url])
+            with self.assertRaises(ApiProxyError):
+                api.send(api.request('sms', 'send').set_content('x').set_to('48500000000'))
+            self.assertEqual(len(server.requests), 0)
+
+        # with idx checked by the api it can be sent again
+        api.send(api.request('sms', 'send').set_content('x').set_to('48500000000')
+                    .set_idx('idx').set_check_idx())
+        self.assertEqual(len(server.requests), 1)
+
+    def test_is_idempotent(self):
+        """
+        sends should be retried only with idx checked by the api
+        """
+        self.assertTrue(is_idempotent({'status': '123'}))
+        self.assertFalse(is_idempotent({'to': '48500000000'}))
+        self.assertTrue(is_idempotent({'to': '48500000000', 'idx': 'a1', 'check_idx': 1}))
+
+    def test_dead_host_moved_back(self):
+        """
+        after a host could not be reached, client should send to the healthy one first
+        """
+        server = StubServer().start()
+        self.addCleanup(server.stop)
+        policy = self.policy()
+        api = SmsAPI('user', 'pass', policy=policy)
+        dead = 'http://127.0.0.1:1/'
+        api.set_hostname([dead, server.url])
+        for i in range(4):
+            api.send(api.request('sms', 'send').set_content('x').set_to('48500000000')
+                        .set_idx('idx%d' % i).set_check_idx())
+        self.assertEqual(len(server.requests), 4)
+        self.assertEqual(policy.order([dead, server.url]), [server.url, dead])
+        self.assertEqual(policy.state(dead).consecutive_failures, 1)
+
+
+class TestMultipartBody(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.wav')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'RIFF' + b'x' * 300000)
+        self.addCleanup(os.remove, self.path)
+
+    def test_read_in_chunks(self):
+        """
+        body read in small chunks should match the whole body and its length
+        """
+        body = MultipartBody({'to': '48500000000'}, [self.path], 'boundary')
+        whole = body.read()
+        self.assertEqual(len(whole), len(body))
+        self.assertTrue(whole.startswith(
+            b'--boundary\r\nContent-Disposition: form-data; name="to"\r\n\r\n48500000000\r\n'))
+        self.assertIn(b'Content-Type: audio/x-wav\r\n\r\nRIFFxxx', whole)
+        self.assertTrue(whole.endswith(b'\r\n--boundary--\r\n\r\n'))
+
+        body.seek(0)
+        chunks = []
+        while True:
+            chunk = body.read(1000)
+            if not chunk:
+                break
+            self.assertTrue(len(chunk) <= 1000)
+            chunks.append(chunk)
+        self.assertEqual(b''.join(chunks), whole)
+
+    def test_upload(self):
+        """
+        file should be streamed to the server by both transports and sent
+        again in full when the request goes to the next host
+        """
+        server = StubServer().start()
+        self.addCleanup(server.stop)
+        for transport in (UrllibTransport(), PooledHttpTransport()):
+            proxy = ApiHttpProxy(['http://127.0.0.1:1/', server.url],
+                                 {'to': '48500000000'}, transport=transport)
+            proxy.add_file(self.path)
+            headers, body = proxy.prepare_request()
+            expected = body.read()
+            proxy.send('vms.do', body, headers)
+            self.assertEqual(server.uploads[-1],
+                             (len(expected), hashlib.md5(expected).hexdigest()))
+        self.assertEqual(len(server.uploads), 2)
+
+
+class TestMediaCache(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.png')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\x89PNG' + b'x' * 1000)
+        self.addCleanup(os.remove, self.path)
+        self.cache = MediaCache()
+        self.addCleanup(setattr, SmilMedia, 'cache', SmilMedia.cache)
+        SmilMedia.cache = self.cache
+
+    def test_local_file(self):
+        """
+        file should be encoded once and again only after it was changed
+        """
+        first = SmilImage(self.path).element.get('src')
+        second = SmilImage(self.path).element.get('src')
+        self.assertTrue(first.startswith('data:image/png;base64,'))
+        self.assertEqual(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        with open(self.path, 'ab') as f:
+            f.write(b'y')
+        third = SmilImage(self.path).element.get('src')
+        self.assertNotEqual(third, first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+        SmilMedia.cache = None
+        self.assertEqual(SmilImage(self.path).element.get('src'), third)
+
+    def test_remote_etag(self):
+        """
+        url should be revalidated with its ETag after max_age and fetched
+        again when it was changed
+        """
+        clock = FakeClock()
+        self.cache = SmilMedia.cache = MediaCache(max_age=60, clock=clock)
+        server = StubServer().start()
+        self.addCleanup(server.stop)
+        server.media['/logo.png'] = b'\x89PNG logo'
+        url = server.url + 'logo.png'
+
+        first = SmilImage(url).element.get('src')
+        clock.now += 30
+        self.assertEqual(SmilImage(url).element.get('src'), first)
+        self.assertEqual(len(server.requests), 1)
+
+        clock.now += 60
+        self.assertEqual(SmilImage(url).element.get('src'), first)
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(self.cache.not_modified, 1)
+
+        server.media['/logo.png'] = b'\x89PNG new logo'
+        clock.now += 60
+        self.assertNotEqual(SmilImage(url).element.get('src'), first)
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 2, 'disk_hits': 0,
+                                              'not_modified': 1, 'entries': 1})
+
+    def test_memory_lru(self):
+        """
+        least recently used entry should be dropped first
+        """
+        cache = MediaCache(max_entries=2)
+        encode = lambda data: 'uri %d' % len(data)
+        paths = [self.path]
+        for i in range(2):
+            fd, path = tempfile.mkstemp(suffix='.png')
+            os.close(fd)
+            self.addCleanup(os.remove, path)
+            paths.append(path)
+        cache.data_uri(paths[0], encode)
+        cache.data_uri(paths[1], encode)
+        cache.data_uri(paths[0], encode)
+        cache.data_uri(paths[2], encode)
+        self.assertEqual(list(cache._entries), [paths[0], paths[2]])
+
+    def test_disk(self):
+        """
+        entries should be shared through the directory and removed when
+        they take too much space
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        encode = lambda data: 'x' * 1000
+        MediaCache(directory=directory).data_uri(self.path, encode)
+
+        cache = MediaCache(directory=directory, max_disk_bytes=1500)
+        self.assertEqual(cache.data_uri(self.path, encode), 'x' * 1000)
+        self.assertEqual((cache.hits, cache.disk_hits, cache.misses), (1, 1, 0))
+
+        fd, path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        os.utime(os.path.join(directory, os.listdir(directory)[0]), (0, 0))
+        cache.data_uri(path, encode)
+        self.assertEqual(os.listdir(directory), [os.path.basename(cache._path(path))])
+
+    def test_disk_eviction_of_own_entries(self):
+        """
+        files not written by the cache and entries being written by other
+        processes should not be removed
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ('other.json', 'tmp1234.tmp'):
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write('x' * 2000)
+            os.utime(os.path.join(directory, name), (0, 0))
+
+        cache = MediaCache(directory=directory, max_disk_bytes=1500)
+        cache.data_uri(self.path, lambda data: 'x' * 1000)
+        os.utime(cache._path(self.path), (0, 0))
+        fd, path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        cache.data_uri(path, lambda data: 'x' * 1000)
+        self.assertEqual(sorted(os.listdir(directory)),
+                         sorted(['other.json', 'tmp1234.tmp',
+                                 os.path.basename(cache._path(path))]))
+
+
+class TestSmilTemplate(TestCase):
+    def test_render(self):
+        """
+        filled template should match the smil rendered with the same text
+        """
+        template = SmilTemplate()
+        template.add_image('data:image/png;base64,abc')
+        template.add_text_field('content')
+
+        for content in (u'Dzień dobry', u'Jan <nieobecny> & "sp\xf3źniony"'):
+            rendered = template.render(content=content)
+            text = template.fields['content']
+            text.element.set('src', text.encode_data(content, 'text/plain'))
+            self.assertEqual(rendered, Smil.render(template))
+        self.assertIn(b'data:image/png;base64,abc', rendered)
+
+    def test_changed_template(self):
+        """
+        template should be serialised again after media were added
+        """
+        template = SmilTemplate()
+        template.add_text_field('content')
+        template.render(content='a')
+        template.add_image('data:image/png;base64,abc')
+        self.assertEqual(template.render(content='a').count(b'<img '), 1)
+        self.assertEqual(template.render(content='a').count(b'<par>'), 1)
+
+    def test_resized_template(self):
+        """
+        template should be serialised again after its size was changed
+        """
+        template = SmilTemplate()
+        template.add_text_field('content')
+        template.render(content='a')
+        template.set_width('320')
+        template.set_height('240')
+        rendered = template.render(content='a')
+        self.assertIn(b'width="320"', rendered)
+        self.assertIn(b'height="240"', rendered)
+
+
+class TestAsyncClient(TestCase):
+    def test_python3_suite(self):
+        """
+        tests of the asyncio client should pass under python3, they can not
+        be collected when the project runs on Python 2
+        """
+        if sys.version_info >= (3, 5):
+            self.skipTest('collected directly from test_smsapi_aio.py')
+        python3 = find_executable('python3')
+        if python3 is None:
+            self.skipTest('python3 is not installed, asyncio client is not tested')
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        process = subprocess.Popen(
+            [python3, '-m', 'unittest', 'edziennik.tests.test_smsapi_aio'],
+            cwd=root, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output.decode('utf-8', 'replace'))
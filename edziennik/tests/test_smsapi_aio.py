@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import unittest
+
+from smsapi.aio import AsyncHttpTransport, AsyncSmsAPI, send_all
+from smsapi.aio_testing import AsyncStubServer
+from smsapi.failover import FailoverPolicy
+from smsapi.proxy import ApiProxyError
+from smsapi.responses import ApiError
+from smsapi.transport import TransportError
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestAsyncSmsAPI(unittest.TestCase):
+    def test_fluent_send(self):
+        """
+        action should be built like in the blocking api and awaited
+        """
+        async def scenario():
+            async with AsyncStubServer() as server:
+                api = AsyncSmsAPI('user', 'pass').set_hostname(server.url)
+                result = await api.service('sms').action('send', {'from': 'Info'}) \
+                    .set_content('hello').set_to('48500000000').execute()
+                api.close()
+                return server, result
+        server, result = run(scenario())
+        self.assertEqual((result.number, result.status), ('48500000000', 'QUEUE'))
+        path, params = server.requests[0]
+        self.assertEqual(path, '/sms.do')
+        self.assertEqual((params['message'], params['from'], params['format']),
+                         ('hello', 'Info', 'json'))
+
+    def test_concurrency_limit(self):
+        """
+        sends should run at the same time, but no more than the limit
+        """
+        async def scenario():
+            async with AsyncStubServer(delay=0.05) as server:
+                api = AsyncSmsAPI('user', 'pass', concurrency=4).set_hostname(server.url)
+                results = await send_all(
+                    api, [('4850000000%d' % (i % 10), 'hello') for i in range(20)])
+                api.close()
+                return server, results
+        server, results = run(scenario())
+        self.assertEqual(len(server.requests), 20)
+        self.assertEqual(server.max_in_flight, 4)
+        self.assertEqual(server.connections, 4)
+        self.assertEqual([r.number for r in results],
+                         ['4850000000%d' % (i % 10) for i in range(20)])
+
+    def test_api_error(self):
+        """
+        api error of one message should not stop other sends
+        """
+        def responder(params):
+            if params['to'] == '48500000001':
+                return {'error': 13, 'message': 'Invalid number'}
+            return {'count': 1, 'list': [{'id': '1', 'number': params['to'],
+                                           'status': 'QUEUE', 'points': 0.16}]}
+
+        async def scenario():
+            async with AsyncStubServer(responder) as server:
+                api = AsyncSmsAPI('user', 'pass').set_hostname(server.url)
+                results = await send_all(
+                    api, [('48500000000', 'a'), ('48500000001', 'b')])
+                api.close()
+                return results
+        results = run(scenario())
+        self.assertEqual(results[0].status, 'QUEUE')
+        self.assertIsInstance(results[1], ApiError)
+        self.assertEqual(results[1].code, 13)
+
+    def test_read_timeout(self):
+        """
+        timeout on a reused connection should be reported, not retried
+        """
+        async def scenario():
+            async with AsyncStubServer() as server:
+                transport = AsyncHttpTransport(read_timeout=0.05)
+                await transport.request(server.url + 'sms.do', b'to=48500000000')
+                server.delay = 0.2
+                try:
+                    await transport.request(server.url + 'sms.do', b'to=48500000000')
+                except TransportError as e:
+                    error = e
+                transport.close()
+                return server, server.url, error
+        server, url, error = run(scenario())
+        self.assertEqual(str(error), 'Timeout: %ssms.do' % url)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_failover_policy(self):
+        """
+        failing host should be skipped by the policy after the threshold
+        """
+        dead = 'http://127.0.0.1:1/'
+        policy = FailoverPolicy(failure_threshold=1, cooldown=60)
+
+        async def scenario():
+            async with AsyncStubServer() as server:
+                api = AsyncSmsAPI('user', 'pass', policy=policy).set_hostname(
+                    [dead, server.url])
+                results = []
+                for to in ('48500000000', '48500000001'):
+                    results.append(await api.service('sms').action('send')
+                                   .set_content('hello').set_to(to).execute())
+                api.close()
+                return server, results
+        server, results = run(scenario())
+        self.assertEqual([r.number for r in results], ['48500000000', '48500000001'])
+        self.assertEqual(policy.state(dead).consecutive_failures, 1)
+        self.assertEqual(policy.order([dead, 'http://other/']), ['http://other/'])
+
+    def test_failover_retries(self):
+        """
+        only idempotent requests should be retried, with awaited backoff
+        """
+        policy = FailoverPolicy(retries=2, backoff=0.01, failure_threshold=10)
+        api = AsyncSmsAPI('user', 'pass', policy=policy).set_hostname('http://127.0.0.1:1/')
+
+        async def scenario(data):
+            try:
+                await api._send('sms.do', b'', {}, idempotent=data)
+            except ApiProxyError:
+                pass
+        run(scenario(False))
+        self.assertEqual(policy.state('http://127.0.0.1:1/').consecutive_failures, 1)
+        run(scenario(True))
+        self.assertEqual(policy.state('http://127.0.0.1:1/').consecutive_failures, 4)
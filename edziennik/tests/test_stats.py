@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User
+from django.utils.six import StringIO
+from mixer.backend.django import mixer
+import pytest
+
+from edziennik.bulk import record_attendance, record_grades
+from edziennik.models import Group, Student, StudentStats, ClassDate, Grades
+from edziennik.stats import check_stats, compute_stats
+
+pytestmark = pytest.mark.django_db
+today = datetime.today().date()
+
+
+class StatsTestCase(TestCase):
+    def setUp(self):
+        self.group = mixer.blend(Group)
+        self.students = [mixer.blend(Student, group=self.group, name='s%d' % i)
+                         for i in range(3)]
+
+    def stats(self, student):
+        stats = StudentStats.objects.get(student=student)
+        return (stats.attended, stats.missed, stats.homework, stats.grade_sum,
+                stats.grade_count, stats.last_attended)
+
+    def assertNoDrift(self):
+        self.assertEqual(check_stats(Student.objects.all()), [])
+
+
+class TestIncrementalStats(StatsTestCase):
+    def test_bulk_attendance(self):
+        """
+        saved attendance should be counted for present and absent students
+        """
+        s0, s1, s2 = self.students
+        record_attendance(self.group, 'subject', [s0.id, s1.id], [s0.id])
+        self.assertEqual(self.stats(s0), (1, 0, 1, 0, 0, today))
+        self.assertEqual(self.stats(s1), (1, 0, 0, 0, 0, today))
+        self.assertEqual(self.stats(s2), (0, 1, 0, 0, 0, None))
+        self.assertNoDrift()
+
+    def test_nobody_present(self):
+        """
+        class without any student is not a class of the group
+        """
+        record_attendance(self.group, 'subject', [], [])
+        self.assertEqual(self.stats(self.students[0]), (0, 0, 0, 0, 0, None))
+        self.assertNoDrift()
+
+    def test_bulk_grades(self):
+        """
+        grades added to many students should be summed in one query
+        """
+        s0, s1, s2 = self.students
+        record_grades('test', today, {s0: '5', s1: '3'})
+        record_grades('quiz', today, {s0: '4'})
+        self.assertEqual(self.stats(s0)[3:5], (9, 2))
+        self.assertEqual(self.stats(s1)[3:5], (3, 1))
+        self.assertEqual(StudentStats.objects.get(student=s0).grade_average(), 4.5)
+        self.assertNoDrift()
+
+    def test_single_changes(self):
+        """
+        grades and attendance changed one by one, e.g. in admin, should
+        keep stats up to date
+        """
+        s0, s1, s2 = self.students
+        grade = Grades.objects.create(name='test', student=s0, score=2)
+        grade.score = 5
+        grade.save()
+        grade.student = s1
+        grade.save()
+        self.assertNoDrift()
+        grade.delete()
+        self.assertNoDrift()
+
+        class_date = ClassDate.objects.create(date_of_class=today - timedelta(3))
+        class_date.student.add(s0)
+        class_date.has_homework.add(s0)
+        self.assertEqual(self.stats(s1)[1], 1)
+        s1.student.add(class_date)
+        class_date.date_of_class = today
+        class_date.save()
+        self.assertEqual(self.stats(s1)[5], today)
+        self.assertNoDrift()
+        class_date.student.clear()
+        self.assertNoDrift()
+        class_date.delete()
+        self.assertNoDrift()
+
+    def test_student_moved(self):
+        """
+        moved student should miss classes of the new group only
+        """
+        other_group = mixer.blend(Group)
+        record_attendance(other_group, 'subject', [
+            mixer.blend(Student, group=other_group).id], [])
+        student = self.students[0]
+        self.assertEqual(self.stats(student)[1], 0)
+        student.group = other_group
+        student.save()
+        self.assertEqual(self.stats(student)[1], 1)
+        self.assertNoDrift()
+
+    def test_only_student_moved(self):
+        """
+        class attended only by the moved student should move to the new group,
+        changing missed classes of students of both groups
+        """
+        s0, s1, s2 = self.students
+        other_group = mixer.blend(Group)
+        other_student = mixer.blend(Student, group=other_group)
+        record_attendance(self.group, 'subject', [s0.id], [])
+        self.assertEqual(self.stats(s1)[1], 1)
+        s0.group = other_group
+        s0.save()
+        self.assertEqual(self.stats(s1)[1], 0)
+        self.assertEqual(self.stats(other_student)[1], 1)
+        self.assertEqual(check_stats(self.group.student_set.all()), [])
+        self.assertEqual(check_stats(other_group.student_set.all()), [])
+
+
+class TestStudentStatsCommand(StatsTestCase):
+    def test_check_and_rebuild(self):
+        """
+        drift should be reported and fixed with --rebuild
+        """
+        record_attendance(self.group, 'subject', [self.students[0].id], [])
+        call_command('student_stats', stdout=StringIO())
+
+        StudentStats.objects.filter(student=self.students[0]).update(attended=5)
+        StudentStats.objects.filter(student=self.students[1]).delete()
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('student_stats', stdout=out)
+        self.assertIn('student %s: attended is 5, should be 1' % self.students[0].id,
+                      out.getvalue())
+        self.assertIn('student %s: missed is None, should be 1' % self.students[1].id,
+                      out.getvalue())
+
+        call_command('student_stats', rebuild=True, stdout=StringIO())
+        self.assertNoDrift()
+
+    def test_compute_queries(self):
+        """
+        stats of many students should be computed in a constant number of queries
+        """
+        students = list(Student.objects.all())
+        with self.assertNumQueries(5):
+            compute_stats(students)
+
+
+class TestStudentPage(StatsTestCase):
+    def test_stats_displayed(self):
+        """
+        student page should show stats read with the student
+        """
+        record_attendance(self.group, 'subject', [self.students[0].id], [])
+        record_grades('test', today, {self.students[0]: '4'})
+        User.objects.create_superuser(
+            username='admin', email='jlennon@beatles.com', password='glassonion')
+        self.client.login(username='admin', password='glassonion')
+        response = self.client.get(reverse('edziennik:student', args=(self.students[0].id,)))
+        self.assertEqual(response.context['stats'].attended, 1)
+        self.assertContains(response, u'średnia ocen: <b>4.00</b>')
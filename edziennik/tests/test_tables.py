@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from mixer.backend.django import mixer
+import pytest
+from datetime import datetime, timedelta
+from edziennik.models import Group, Student, ClassDate, Grades
+from edziennik.tables import build_attendance_matrix, ABSENT, PRESENT,\
+                             PRESENT_NO_HOMEWORK, build_grade_sheet,\
+                             grade_table_content
+
+pytestmark = pytest.mark.django_db
+today = datetime.today().date()
+
+
+class TestBuildAttendanceMatrix(TestCase):
+    def test_statuses(self):
+        """
+        each cell should show absence, presence or presence without homework
+        """
+        group = mixer.blend(Group)
+        student1 = mixer.blend(Student, group=group)
+        student2 = mixer.blend(Student, group=group)
+        student3 = mixer.blend(Student, group=group)
+        class_date = ClassDate.objects.create(date_of_class=today)
+        class_date.student.add(student1, student2)
+        class_date.has_homework.add(student1)
+
+        matrix = build_attendance_matrix(group)
+        self.assertEqual(matrix.students, [student1, student2, student3])
+        self.assertEqual(len(matrix.rows), 1)
+        self.assertEqual(matrix.rows[0].class_date, class_date)
+        self.assertEqual(matrix.rows[0].statuses,
+                         [PRESENT, PRESENT_NO_HOMEWORK, ABSENT])
+
+    def test_other_groups_excluded(self):
+        """
+        classes of other groups should not be displayed
+        """
+        group1 = mixer.blend(Group)
+        group2 = mixer.blend(Group)
+        student1 = mixer.blend(Student, group=group1)
+        student2 = mixer.blend(Student, group=group2)
+        class_date1 = ClassDate.objects.create(date_of_class=today-timedelta(1))
+        class_date1.student.add(student1)
+        class_date2 = ClassDate.objects.create(date_of_class=today)
+        class_date2.student.add(student2)
+
+        matrix = build_attendance_matrix(group1)
+        self.assertEqual([row.class_date for row in matrix.rows], [class_date1])
+
+    def test_constant_number_of_queries(self):
+        """
+        number of queries should not depend on the size of a group
+        """
+        small_group = mixer.blend(Group)
+        student = mixer.blend(Student, group=small_group)
+        class_date = ClassDate.objects.create(date_of_class=today)
+        class_date.student.add(student)
+
+        big_group = mixer.blend(Group)
+        students = [mixer.blend(Student, group=big_group) for i in range(15)]
+        for day in range(20):
+            class_date = ClassDate.objects.create(
+                date_of_class=today-timedelta(day))
+            class_date.student.add(*students[::2])
+            class_date.has_homework.add(*students[::4])
+
+        with self.assertNumQueries(4):
+            build_attendance_matrix(small_group)
+        with self.assertNumQueries(4):
+            matrix = build_attendance_matrix(big_group)
+        self.assertEqual(len(matrix.rows), 20)
+
+
+class TestBuildGradeSheet(TestCase):
+    def test_pivot(self):
+        """
+        each (date_of_test, name) pair should be one row with a score for every student
+        """
+        group = mixer.blend(Group)
+        student1 = mixer.blend(Student, group=group)
+        student2 = mixer.blend(Student, group=group)
+        yesterday = today-timedelta(1)
+        mixer.blend(Grades, student=student1, name='test', date_of_test=yesterday, score=5)
+        mixer.blend(Grades, student=student2, name='test', date_of_test=yesterday, score=3)
+        mixer.blend(Grades, student=student2, name='quiz', date_of_test=today, score=4)
+
+        sheet = build_grade_sheet(group)
+        self.assertEqual(sheet.students, [student1, student2])
+        self.assertEqual([(r.date_of_test, r.name, r.scores) for r in sheet.rows],
+                         [(yesterday, 'test', [5, 3]), (today, 'quiz', [None, 4])])
+        self.assertEqual(grade_table_content(sheet)[1],
+                         [today.strftime("%d/%m/%Y"), 'quiz', '-', 4])
+
+    def test_constant_number_of_queries(self):
+        """
+        number of queries should not depend on the size of a group
+        """
+        group = mixer.blend(Group)
+        students = [mixer.blend(Student, group=group) for i in range(10)]
+        for day in range(10):
+            for student in students:
+                mixer.blend(Grades, student=student, name='test',
+                            date_of_test=today-timedelta(day))
+
+        with self.assertNumQueries(2):
+            sheet = build_grade_sheet(group)
+        self.assertEqual(len(sheet.rows), 10)
@@ -3,13 +3,15 @@ from django.test import TestCase, Client
 # from django.template.loader import render_to_string
 from django.contrib.auth.models import User
 from django.contrib import auth
+from django.core.management import call_command
+from django.utils.six import StringIO
 from mixer.backend.django import mixer
 import pytest
 from datetime import datetime, timedelta
 # from django.contrib.staticfiles.templatetags.staticfiles import static
-from edziennik.models import Lector, Group, Parent, Student, ClassDate, Grades
+from edziennik.models import Lector, Group, Parent, Student, ClassDate, Grades, WeeklyReport
 
-from edziennik.utils2 import generate_weekly_admin_report
+from edziennik.utils2 import WEEK, admin_report, generate_weekly_admin_report, week_start
 
 pytestmark = pytest.mark.django_db
 today = datetime.today().date()
@@ -81,4 +83,64 @@ class Testgenerate_eekly_admin_report(TestCase):
         expected_title = 'Attendance and grades report'
         expected_body = head + f + attendance + grades
         self.assertEqual(email_title, expected_title)
-        self.assertEqual(email_body, expected_body)
\ No newline at end of file
+        self.assertEqual(email_body, expected_body)
+
+class TestAdminReport(TestCase):
+    def setUp(self):
+        self.group = mixer.blend(Group, name='g1')
+        self.student = mixer.blend(Student, name='s1', group=self.group)
+        # mondays of two finished weeks
+        self.monday = week_start(today) - 2 * WEEK
+        for day in (self.monday + timedelta(2), self.monday + WEEK + timedelta(1), today):
+            class_date = mixer.blend(ClassDate, date_of_class=day)
+            class_date.student.add(self.student)
+
+    def test_weeks_from_rollups(self):
+        """
+        finished weeks should be built once and then read from rollups,
+        without queries of raw data
+        """
+        start = self.monday - timedelta(1)
+        title, body = admin_report(start, today)
+        self.assertEqual(WeeklyReport.objects.count(), 2)
+        self.assertEqual(body.count('On '), 3)
+        self.assertTrue(body.index(str(self.monday + timedelta(2))) <
+                        body.index(str(self.monday + WEEK + timedelta(1))) <
+                        body.index(str(today)))
+
+        # 1 query for rollups, 3 for the last days, 2 for the first day
+        # which had no classes, so there are no students to prefetch
+        with self.assertNumQueries(6):
+            self.assertEqual(admin_report(start, today), (title, body))
+
+    def test_window_within_week(self):
+        """
+        report of a few days should only contain classes of these days
+        """
+        day = self.monday + timedelta(2)
+        title, body = admin_report(day, day)
+        self.assertEqual(body.count('On '), 1)
+        self.assertIn(str(day), body)
+        self.assertEqual(WeeklyReport.objects.count(), 0)
+
+
+class TestWeeklyReportsCommand(TestCase):
+    def test_rebuild(self):
+        """
+        rollups should only be built again with --rebuild
+        """
+        group = mixer.blend(Group, name='g1')
+        student = mixer.blend(Student, name='s1', group=group)
+        monday = week_start(today) - WEEK
+        since = str(monday)
+        call_command('weekly_reports', since=since, quiet=True, stderr=StringIO())
+
+        class_date = mixer.blend(ClassDate, date_of_class=monday)
+        class_date.student.add(student)
+        out = StringIO()
+        call_command('weekly_reports', since=since, stdout=out, stderr=StringIO())
+        self.assertIn('Attendance has not been checked', out.getvalue())
+
+        out = StringIO()
+        call_command('weekly_reports', since=since, rebuild=True, stdout=out, stderr=StringIO())
+        self.assertIn('On %s\nin group: g1' % monday, out.getvalue())
@@ -9,7 +9,9 @@ import pytest
 from datetime import date, datetime, timedelta
 from django.contrib.staticfiles.templatetags.staticfiles import static
 from freezegun import freeze_time
-from edziennik.models import Lector, Group, Parent, Student, ClassDate
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from edziennik.models import Lector, Group, Parent, Student, ClassDate, Grades
 pytestmark = pytest.mark.django_db
 today = datetime.today().date()
 
@@ -455,6 +457,34 @@ class StudentViewTests(TestCase):
         absent_sign = '<img src=%s>' % static('img/x-mark-red.png')
         self.assertEqual(response_attendance_table_content[0][2], absent_sign)
 
+    def test_student_view_constant_number_of_queries(self):
+        """
+        number of queries should not depend on the number of classes
+        """
+        group = mixer.blend('edziennik.Group')
+        student = mixer.blend('edziennik.Student', group=group)
+        student2 = mixer.blend('edziennik.Student', group=group)
+        user_admin = User.objects.create_superuser(username='admin',
+                                 email='jlennon@beatles.com',
+                                 password='glassonion')
+        self.client.login(username='admin', password='glassonion')
+        url = reverse('edziennik:student', args=(student.id,))
+
+        def add_classes(number):
+            for i in range(number):
+                class_date = ClassDate.objects.create(date_of_class=today-timedelta(i))
+                class_date.student.add(student, student2)
+                class_date.has_homework.add(student)
+
+        add_classes(1)
+        with CaptureQueriesContext(connection) as one_class:
+            self.client.get(url)
+        add_classes(20)
+        with CaptureQueriesContext(connection) as many_classes:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['attendance_table_content']), 21)
+        self.assertEqual(len(one_class), len(many_classes))
+
 class TestGroupView(TestCase):
     def test_group_view_for_non_staff(self):
         """
@@ -554,3 +584,179 @@ class TestAttendance_CheckView(TestCase):
 
 
 
+    def test_attendance_check_twice_a_day(self):
+        """
+        attendance can be checked only once a day in a group
+        """
+        group = mixer.blend('edziennik.Group')
+        student = mixer.blend('edziennik.Student', group=group)
+        class_date = ClassDate.objects.create(date_of_class=today)
+        class_date.student.add(student)
+        self.client.login(username='admin', password='glassonion')
+        url = reverse('edziennik:attendance_check', args=(group.id,))
+        response = self.client.post(url, {'student': [student.id], 'class_subject': 's'})
+        self.assertEqual(response.context['error_message'],
+                         "BYLA JUZ DZIS SPRAWDZANA OBECNOSC W TEJ GRUPIE")
+        self.assertEqual(ClassDate.objects.count(), 1)
+
+    def test_attendance_check_locks_group(self):
+        """
+        group should be locked before checking if attendance was saved today,
+        so that two submissions sent at the same time are not both saved
+        """
+        group = mixer.blend('edziennik.Group')
+        student = mixer.blend('edziennik.Student', group=group)
+        self.client.login(username='admin', password='glassonion')
+        url = reverse('edziennik:attendance_check', args=(group.id,))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, {'student': [student.id], 'class_subject': 's'})
+        sql = [query['sql'] for query in queries]
+        lock = [i for i, query in enumerate(sql) if query.startswith('SELECT "edziennik_group"."id" FROM')]
+        check = [i for i, query in enumerate(sql) if 'edziennik_classdate' in query]
+        self.assertTrue(lock)
+        self.assertLess(lock[-1], check[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[lock[-1]])
+
+    def test_attendance_check_resets_quizlet(self):
+        """
+        present students lose quizlet reward, absent keep it,
+        students from other groups are ignored
+        """
+        group = mixer.blend('edziennik.Group')
+        present = mixer.blend('edziennik.Student', group=group, quizlet=True)
+        absent = mixer.blend('edziennik.Student', group=group, quizlet=True)
+        other = mixer.blend('edziennik.Student', quizlet=True)
+        self.client.login(username='admin', password='glassonion')
+        url = reverse('edziennik:attendance_check', args=(group.id,))
+        self.client.post(url, {'student': [present.id, other.id],
+                               'homework': [present.id, other.id],
+                               'class_subject': 's'})
+        class_date = ClassDate.objects.get()
+        self.assertEqual(list(class_date.student.all()), [present])
+        self.assertEqual(list(class_date.has_homework.all()), [present])
+        self.assertEqual(class_date.lector, group.lector)
+        self.assertFalse(Student.objects.get(id=present.id).quizlet)
+        self.assertTrue(Student.objects.get(id=absent.id).quizlet)
+        self.assertTrue(Student.objects.get(id=other.id).quizlet)
+
+    def test_attendance_check_constant_number_of_queries(self):
+        """
+        number of queries should not depend on the size of a group
+        """
+        self.client.login(username='admin', password='glassonion')
+
+        def check(size):
+            group = mixer.blend('edziennik.Group')
+            students = [mixer.blend('edziennik.Student', group=group) for i in range(size)]
+            data = {'student': [s.id for s in students[1:]],
+                    'homework': [s.id for s in students[2:]],
+                    'class_subject': 's'}
+            url = reverse('edziennik:attendance_check', args=(group.id,))
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(url, data)
+            return len(queries)
+
+        self.assertEqual(check(3), check(20))
+
+
+class TestAddGradesView(TestCase):
+    def setUp(self):
+        User.objects.create_superuser(
+            username='admin', email='jlennon@beatles.com', password='glassonion')
+        self.client.login(username='admin', password='glassonion')
+        self.group = mixer.blend('edziennik.Group')
+        self.student1 = mixer.blend('edziennik.Student', name='s1', group=self.group)
+        self.student2 = mixer.blend('edziennik.Student', name='s2', group=self.group)
+        self.student3 = mixer.blend('edziennik.Student', name='s3', group=self.group)
+        self.url = reverse('edziennik:add_grades', args=(self.group.id,))
+
+    def test_add_grades(self):
+        """
+        grades should be added to students with a score
+        """
+        data = {'grade_name': 'test', 'date_of_test': str(today), 's1': 5, 's2': 3}
+        self.client.post(self.url, data)
+        grades = Grades.objects.order_by('student__name')
+        self.assertEqual([(g.student, g.score) for g in grades],
+                         [(self.student1, 5), (self.student2, 3)])
+
+    def test_add_duplicated_grades(self):
+        """
+        if any student already has this grade, no grade is added
+        and all duplicates are reported
+        """
+        mixer.blend('edziennik.Grades', student=self.student1, name='test', date_of_test=today)
+        mixer.blend('edziennik.Grades', student=self.student2, name='test', date_of_test=today)
+        data = {'grade_name': 'test', 'date_of_test': str(today), 's1': 5, 's2': 3, 's3': 4}
+        response = self.client.post(self.url, data, follow=True)
+        self.assertEqual(Grades.objects.count(), 2)
+        self.assertFalse(Grades.objects.filter(student=self.student3).exists())
+        message = list(response.context['messages'])[0]
+        self.assertIn('s1, s2', str(message))
+
+    def test_add_grades_constant_number_of_queries(self):
+        """
+        number of queries should not depend on the number of students
+        """
+        data = {'grade_name': 'test1', 'date_of_test': str(today), 's1': 5}
+        with CaptureQueriesContext(connection) as one_grade:
+            self.client.post(self.url, data)
+        data = {'grade_name': 'test2', 'date_of_test': str(today), 's1': 5, 's2': 3, 's3': 4}
+        with CaptureQueriesContext(connection) as three_grades:
+            self.client.post(self.url, data)
+        self.assertEqual(Grades.objects.count(), 4)
+        self.assertEqual(len(one_grade), len(three_grades))
+
+
+class TestLectorsHoursView(TestCase):
+    def setUp(self):
+        User.objects.create_superuser(
+            username='admin', email='jlennon@beatles.com', password='glassonion')
+
+    def test_lectors_hours_for_not_admin(self):
+        """
+        non admin user should not have access - status code 404
+        """
+        response = self.client.get(reverse('edziennik:lectors_hours'))
+        self.assertEqual(response.status_code, 404)
+
+    @freeze_time('2018-03-10')
+    def test_lectors_hours_in_month(self):
+        """
+        every lector should have hours in each month of the school year
+        """
+        lector1 = mixer.blend('edziennik.Lector')
+        lector2 = mixer.blend('edziennik.Lector')
+        for i in range(3):
+            mixer.blend('edziennik.ClassDate', lector=lector1,
+                        date_of_class=date(year=2017, month=10, day=20))
+        mixer.blend('edziennik.ClassDate', lector=lector2,
+                    date_of_class=date(year=2018, month=1, day=20))
+        # previous school year
+        mixer.blend('edziennik.ClassDate', lector=lector2,
+                    date_of_class=date(year=2017, month=1, day=20))
+        self.client.login(username='admin', password='glassonion')
+        response = self.client.get(reverse('edziennik:lectors_hours'))
+        months = ['9.2017', '10.2017', '11.2017', '12.2017', '1.2018',
+                  '2.2018', '3.2018', '4.2018', '5.2018', '6.2018']
+        self.assertEqual(response.context['months'], months)
+        self.assertEqual(response.context['table_content'], [
+            [lector1, 0, 3, 0, 0, 0, 0, 0, 0, 0, 0, 3],
+            [lector2, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1]])
+
+    def test_lectors_hours_date_range(self):
+        """
+        only hours between given dates should be counted
+        """
+        lectors = [mixer.blend('edziennik.Lector') for i in range(3)]
+        for lector in lectors:
+            mixer.blend('edziennik.ClassDate', lector=lector,
+                        date_of_class=date(year=2016, month=5, day=1))
+            mixer.blend('edziennik.ClassDate', lector=lector,
+                        date_of_class=date(year=2016, month=7, day=1))
+        self.client.login(username='admin', password='glassonion')
+        response = self.client.get(reverse('edziennik:lectors_hours'),
+                                   {'start_date': '2016-05-01', 'end_date': '2016-06-30'})
+        self.assertEqual(response.context['months'], ['5.2016', '6.2016'])
+        self.assertEqual([row[-1] for row in response.context['table_content']], [1, 1, 1])
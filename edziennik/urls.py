@@ -11,10 +11,17 @@ urlpatterns = [
     url(r'^(?P<pk>\d+)/add_grades$', views.add_grades, name='add_grades'),
     url(r'^(?P<group_id>\d+)/attendance_by_group$', views.attendance_by_group, name='attendance_by_group'),
     url(r'^(?P<pk>\d+)/lektor$', views.lector, name='lector'),
+    url(r'^lectors_hours/$', views.lectors_hours, name='lectors_hours'),
     url(r'^(?P<pk>\d+)/student/$', views.student, name='student'),
     url(r'^(?P<pk>\d+)/group/$', views.group, name='group'),
     url(r'^(?P<pk>\d+)/add_quizlet/$', views.add_quizlet, name='add_quizlet'),
     url(r'^process_quizlet/$', views.process_quizlet, name='process_quizlet'),
     url(r'^(?P<pk>\d+)/show_group_grades$', views.show_group_grades, name='show_group_grades'),
+    url(r'^export/(?P<table>attendance|grades)/$', views.export_table, name='export_table'),
+    url(r'^(?P<group_id>\d+)/export/(?P<table>attendance|grades)/$', views.export_table,
+        name='export_group_table'),
+    url(r'^instrumentation/$', views.instrumentation_stats, name='instrumentation'),
+    url(r'^sms/twilio_status/$', views.twilio_status_callback, name='twilio_status_callback'),
+    url(r'^sms/smsapi_status/$', views.smsapi_status_callback, name='smsapi_status_callback'),
 
 ]
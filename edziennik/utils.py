@@ -1,67 +1,154 @@
 # -*- coding: utf-8 -*-
+from uuid import uuid4
+
 from django.conf import settings
+from smsapi.batch import BatchMessage, send_batch
 from smsapi.client import SmsAPI
+from smsapi.failover import FailoverPolicy
 from smsapi.responses import ApiError
+from smsapi.transport import PooledHttpTransport
 from twilio.rest import Client
 
+from django.core.urlresolvers import reverse
+from django.utils.http import urlencode
+
 from edziennik.models import SMS, Student
-from edziennik.tasks import twilio_first_sms_status_check_task,\
-                            twilio_second_sms_status_check_task,\
-                            admin_email
+from edziennik.tasks import admin_email, schedule_sms_status_checks
+
+
+def status_callback_url(name):
+    ''' absolute url of a delivery report webhook or None if SITE_URL is not set '''
+    if not settings.SITE_URL:
+        return None
+    return settings.SITE_URL.rstrip('/') + reverse(name)
 
 # smsapi.pl
-def send_sms_smsapi(parent_phone, message):
-    api = SmsAPI()
+SMSAPI_HOSTS = ['https://api.smsapi.pl/', 'https://api2.smsapi.pl/']
+# connections to smsapi.pl are kept alive between messages sent by a worker
+smsapi_transport = PooledHttpTransport(pool_size=2, connect_timeout=5, read_timeout=15)
+# health of smsapi hosts is shared by all messages sent by a worker
+smsapi_policy = FailoverPolicy(retries=2, deadline=20)
+
+def smsapi_client():
+    api = SmsAPI(transport=smsapi_transport, policy=smsapi_policy)
+    api.set_hostname(SMSAPI_HOSTS)
     # autoryzacyja standardowa
     api.set_username(settings.SMS_API_USERNAME)
     api.set_password(settings.SMS_API_PASS)
+    return api
+
+def smsapi_options():
+    ''' parameters set on every message sent via smsapi.pl '''
+    options = {'from': 'Info'}
+    notify_url = status_callback_url('edziennik:smsapi_status_callback')
+    # the callback rejects reports without the token
+    if notify_url and settings.SMS_CALLBACK_TOKEN:
+        options['notify_url'] = '%s?%s' % (
+            notify_url, urlencode({'token': settings.SMS_CALLBACK_TOKEN}))
+    return options
+
+def send_sms_smsapi(parent, message):
+    parent_phone = '48' + str(parent.phone_number)
+    api = smsapi_client()
     try:
-        api.service('sms').action('send')
-        api.set_content(message)
-        api.set_to(parent_phone)
-        api.set_from('Info')
-        result = api.execute()
+        request = api.request('sms', 'send', smsapi_options()) \
+                     .set_content(message).set_to(parent_phone) \
+                     .set_idx(uuid4().hex).set_check_idx()
+        result = api.send(request)
         for r in result:
+            SMS.objects.create(service='smsapipl',
+                               message=message,
+                               addressee=parent.user,
+                               smsapipl_message_id=r.id,
+                               smsapipl_status=r.status)
             # print r.id, r.points, r.status
             mail_body = 'Wyslano sms do %s o tresci: %s \n\
             id: %s, points: %s, status: %s' % (parent_phone, message, r.id, r.points, r.status)
             mail_title = 'SMS wyslany do %s' % parent_phone
             admin_email(mail_title, mail_body)
-    except ApiError, e:
+    except ApiError as e:
         # print '%s - %s' % (e.code, e.message)
         mail_body = 'Blad wysylania smsa do %s, o tresci: %s \n\
-        kod bledu: %s, tresc bledu: %s, points: %s' % (parent_phone, message, r.id, r.status, r.points)
+        kod bledu: %s, tresc bledu: %s' % (parent_phone, message, e.code, e.message)
         mail_title = 'Blad SMSa do %s' % parent_phone
         admin_email(mail_title, mail_body)
 
+def send_sms_smsapi_batch(messages):
+    ''' sends (parent, content, params) messages via smsapi.pl grouped into
+    as few requests as possible, content may use params as [%1%]...[%4%];
+    admin gets one summary email '''
+    batch = [BatchMessage('48' + str(parent.phone_number), content, params, key=parent)
+             for parent, content, params in messages]
+    sent, errors = [], []
+    for result in send_batch(smsapi_client(), batch, options=smsapi_options()):
+        if result.error:
+            errors.append(result)
+            continue
+        sent.append(result)
+    SMS.objects.bulk_create([
+        SMS(service='smsapipl',
+            message=result.message.render(),
+            addressee=result.message.key.user,
+            smsapipl_message_id=result.id,
+            smsapipl_status=result.status)
+        for result in sent])
+
+    mail_title = 'Wyslano %s sms, bledy: %s' % (len(sent), len(errors))
+    mail_body = '\n'.join(
+        ['Wyslano sms do %s o tresci: %s id: %s, points: %s, status: %s' % (
+            r.message.to, r.message.render(), r.id, r.points, r.status) for r in sent] +
+        ['Blad wysylania smsa do %s, o tresci: %s kod bledu: %s' % (
+            r.message.to, r.message.render(), r.error) for r in errors])
+    admin_email(mail_title, mail_body)
+    return sent, errors
+
 # twilio
 def send_sms_twilio(parent, message):
     ACCOUNT_SID = settings.TWILIO_ACCOUNT_SID
     AUTH_TOKEN = settings.TWILIO_AUTH_TOKEN
     client = Client(ACCOUNT_SID, AUTH_TOKEN)
     parent_phone_number = '+48' + str(parent.phone_number)
+    # delivery status is reported to the webhook if SITE_URL is set,
+    # otherwise it is polled by status check tasks
     twilio_message = client.messages.create(to=parent_phone_number,
                                     # from_=settings.TWILIO_TEST_PHONE_NO,
                                     messaging_service_sid=settings.MESSAGING_SERVICE_SID,
+                                    status_callback=status_callback_url('edziennik:twilio_status_callback'),
                                     body=message)
 
     SMS.objects.create(service='twilio',
                        message=message,
                        addressee=parent.user,
                        twilio_message_sid=twilio_message.sid)
+    if not settings.SITE_URL:
+        schedule_sms_status_checks()
+
+def absence_message(student):
+    ''' returns absence message template and its params '''
+    male_student_msg = 'Informujemy ze [%1%] nie byl dzis obecny na lekcji jezyka angielskiego w szkole Energy'
+    female_student_msg = 'Informujemy ze [%1%] nie byla dzis obecna na lekcji jezyka angielskiego w szkole Energy'
+    template = male_student_msg if student.gender == 'M' else female_student_msg
+    return template, (student.name,)
+
+def students_absence(students):
+    ''' notifies parents of absent students '''
+    # send sms via SmsApi.pl, all messages in a few requests
+    # uncomment the lines below to start using this service
+    # send_sms_smsapi_batch([(student.parent,) + absence_message(student)
+    #                        for student in students])
+    # return
 
-    twilio_first_sms_status_check_task.apply_async(countdown=300)
-    twilio_second_sms_status_check_task.apply_async(countdown=1200)
+    for student in students:
+        student_absence(student)
 
 def student_absence(student):
     parent = student.parent
-    male_student_msg = 'Informujemy ze %s nie byl dzis obecny na lekcji jezyka angielskiego w szkole Energy' % student.name
-    female_student_msg = 'Informujemy ze %s nie byla dzis obecna na lekcji jezyka angielskiego w szkole Energy' % student.name
-    message = male_student_msg if student.gender == 'M' else female_student_msg
+    template, params = absence_message(student)
+    message = BatchMessage(None, template, params).render()
     
     # send sms via SmsApi.pl
     # uncomment the line below to start using this service
-    # send_sms_smsapi(parent_phone, message)
+    # send_sms_smsapi(parent, message)
 
     # send sms via twilio
     # uncomment the line below to start using this service
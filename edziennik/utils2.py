@@ -1,39 +1,168 @@
-from edziennik.models import Lector, Group, Parent, Student, ClassDate, Grades
+from edziennik.models import Lector, Group, Parent, Student, ClassDate, Grades, WeeklyReport
 import datetime
+from collections import namedtuple, OrderedDict
+from django.db import connection, IntegrityError, transaction
+from django.db.models import Count, Prefetch
+from django.utils import timezone
+
+LectorHours = namedtuple('LectorHours', ['lector', 'months', 'total'])
+
+
+def school_year(today):
+    ''' returns first and last day of the school year (September - June) '''
+    # for dates between Sep and Dec
+    if today.month in range(9,13):
+        return (datetime.date(year=today.year, month=9, day=1),
+                datetime.date(year=today.year + 1, month=6, day=30))
+    # for dates between Jan and Aug
+    return (datetime.date(year=today.year - 1, month=9, day=1),
+            datetime.date(year=today.year, month=6, day=30))
+
+
+def month_labels(start_date, end_date):
+    ''' returns labels ('month.year') of all months between two dates '''
+    labels = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        labels.append('%s.%s' % (month, year))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return labels
+
+
+def lector_hours(lectors, start_date, end_date):
+    ''' returns LectorHours of each lector with hours counted per month in the
+    database, in one query no matter how many lectors and months there are '''
+    column = '%s.%s' % (connection.ops.quote_name(ClassDate._meta.db_table),
+                        connection.ops.quote_name('date_of_class'))
+    counts = ClassDate.objects.filter(
+        lector__in=lectors, date_of_class__range=[start_date, end_date]
+    ).extra(select={
+        'year': connection.ops.date_extract_sql('year', column),
+        'month': connection.ops.date_extract_sql('month', column),
+    }).values('lector', 'year', 'month').annotate(
+        hours=Count('id')).order_by('lector', 'year', 'month')
+
+    months = dict((lector.id, OrderedDict()) for lector in lectors)
+    for row in counts:
+        label = '%s.%s' % (int(row['month']), int(row['year']))
+        months[row['lector']][label] = row['hours']
+
+    return [LectorHours(lector, months[lector.id], sum(months[lector.id].values()))
+            for lector in lectors]
+
+
+WEEK = datetime.timedelta(7)
+
+SEPARATOR = '\n--------------------------------\n'
+
+
+def week_start(day):
+    ''' returns monday of the week of a given day '''
+    return day - datetime.timedelta(day.weekday())
+
+
+def report_sections(start_date, end_date):
+    ''' returns attendance sections and grade lines of classes and grades
+    between two dates (inclusive) as dicts {monday of a week: [texts]},
+    in three queries no matter how many classes and grades there are '''
+    attendance, grades = {}, {}
+
+    class_dates = ClassDate.objects.filter(
+        date_of_class__range=[start_date, end_date]
+    ).order_by('date_of_class', 'id').prefetch_related(Prefetch(
+        'student', queryset=Student.objects.select_related('group').order_by('id')))
+    for class_date in class_dates:
+        students = class_date.student.all()
+        group = students[0].group.name if students else '-'
+        attendance.setdefault(week_start(class_date.date_of_class), []).extend(
+            ['On %s\nin group: %s\n' % (str(class_date.date_of_class), group),
+             'the following students were present:'] +
+            ['\n' + student.name for student in students] + [SEPARATOR])
+
+    # a timestamp range, unlike timestamp__date, can use the index
+    since = timezone.make_aware(datetime.datetime.combine(start_date, datetime.time.min))
+    until = timezone.make_aware(datetime.datetime.combine(end_date + datetime.timedelta(1),
+                                                          datetime.time.min))
+    given = Grades.objects.filter(timestamp__gte=since, timestamp__lt=until).select_related(
+        'student__group').order_by('timestamp', 'id')
+    for g in given:
+        date = timezone.localtime(g.timestamp).date()
+        grades.setdefault(week_start(date), []).append(' '.join([
+            str(date), 'group:', g.student.group.name, 'student:', g.student.name,
+            'for:', g.name, 'score:', str(g.score), '\n']))
+
+    return attendance, grades
+
+
+def weekly_reports(first_week, last_week):
+    ''' returns WeeklyReport of every week from monday first_week to monday
+    last_week (inclusive), weeks without one are built in one pass and saved '''
+    reports = dict((report.week_start, report) for report in
+                   WeeklyReport.objects.filter(week_start__range=[first_week, last_week]))
+    weeks = []
+    week = first_week
+    while week <= last_week:
+        weeks.append(week)
+        week += WEEK
+
+    missing = [week for week in weeks if week not in reports]
+    if missing:
+        attendance, grades = report_sections(missing[0], missing[-1] + WEEK - datetime.timedelta(1))
+        built = [WeeklyReport(week_start=week,
+                              attendance=''.join(attendance.get(week, [])),
+                              grades=''.join(grades.get(week, [])))
+                 for week in missing]
+        try:
+            with transaction.atomic():
+                WeeklyReport.objects.bulk_create(built)
+        except IntegrityError:
+            # the same weeks were built by someone else in the meantime
+            pass
+        reports.update((report.week_start, report) for report in built)
+
+    return [reports[week] for week in weeks]
+
+
+def admin_report(start_date, end_date, today=None):
+    ''' returns title and body of attendance and grades report between two dates
+    (inclusive); finished weeks are read from WeeklyReport, the rest from raw data '''
+    today = today or datetime.date.today()
+    title = 'Attendance and grades report'
+
+    first_week = week_start(start_date)
+    if first_week < start_date:
+        first_week += WEEK
+    # only weeks which are over and are whole in the period are kept
+    stop = min(week_start(end_date + datetime.timedelta(1)), week_start(today))
+
+    attendance, grades = [], []
+    if first_week < stop:
+        periods = [(start_date, first_week - datetime.timedelta(1)), None,
+                   (stop, end_date)]
+    else:
+        periods = [(start_date, end_date)]
+    for period in periods:
+        if period is None:
+            for report in weekly_reports(first_week, stop - WEEK):
+                attendance.append(report.attendance)
+                grades.append(report.grades)
+        elif period[0] <= period[1]:
+            sections, lines = report_sections(*period)
+            for week in sorted(sections):
+                attendance.extend(sections[week])
+            for week in sorted(lines):
+                grades.extend(lines[week])
+
+    output = ''.join(attendance) or 'Attendance has not been checked this week\n'
+    output2 = ''.join(grades)
+    if output2:
+        output2 = '\n' + 'Last week the following grades were given:\n' + output2
+    else:
+        output2 = 'No grades have been given last week'
+    return (title, output + output2)
 
 
 def generate_weekly_admin_report():
     ''' genereates raport for last week '''
     today = datetime.date.today()
-    title = 'Attendance and grades report'
-    class_dates = ClassDate.objects.filter(date_of_class__gte=today-datetime.timedelta(7))
-    output = 'Attendance has not been checked this week\n'
-    if class_dates:
-        output = ''
-    for class_date in class_dates:
-        students = class_date.student.all()
-        group = students.first().group
-        date = class_date.date_of_class
-        head = 'On %s\nin group: %s\n' % (str(date), group.name)
-        f = 'the following students were present:'
-        s = ''.join(['\n' + s.name for s in students])
-        end = '\n--------------------------------\n'
-        section = head + f + s + end
-        output += section
-
-    grades = Grades.objects.filter(timestamp__date__gte=today-datetime.timedelta(7))
-    output2 = 'No grades have been given last week'
-    if grades:
-        output2 = '\n' + 'Last week the following grades were given:\n'
-    for g in grades:
-        date = g.timestamp.date()
-        student = g.student
-        group = student.group.name
-        name = g.name
-        score = g.score
-        g_str = ' '.join([str(date), 'group:', group, 'student:', student.name,
-                         'for:', name, 'score:', str(score), '\n'])
-        output2 += g_str
-
-    body = output  + output2
-    return (title, body)
\ No newline at end of file
+    return admin_report(today - WEEK, today, today)
@@ -5,11 +5,26 @@ from edziennik.models import Lector, Group, Parent, Student, ClassDate, Grades
 import datetime
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
-from django.http import HttpResponseRedirect, HttpResponse, Http404
+from django.db import transaction
+from django.http import HttpResponseRedirect, HttpResponse, Http404, FileResponse,\
+                        StreamingHttpResponse
 from django.core.urlresolvers import reverse
 from django.contrib.staticfiles.templatetags.staticfiles import static
-
-from edziennik.utils import student_absence
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from twilio.request_validator import RequestValidator
+
+from edziennik import export
+from edziennik import instrumentation
+from edziennik.caching import cache_stats, cached, GROUP_ATTENDANCE, GROUP_GRADES, STUDENT
+from edziennik.bulk import attendance_checked_today, record_attendance, record_grades
+from edziennik.tasks import absence_notifications_task
+from edziennik.sms_status import record_twilio_status, record_smsapi_status
+from edziennik.utils2 import school_year, month_labels, lector_hours
+from edziennik.tables import ATTENDANCE_ICONS, attendance_icon, build_attendance_matrix,\
+                             build_grade_sheet, grade_table_content, build_student_timeline
 
 
 def index(request):
@@ -17,28 +32,24 @@ def index(request):
     if not request.user.is_authenticated():
         return render(request, 'edziennik/home_for_others.html')
 
-    lector_users = [lector.user for lector in Lector.objects.all()]
+    role = request.edziennik_role
 
     # home for lectors
-    if request.user in lector_users:
+    if role.is_lector:
         # show only groups associated with this lector
-        lector = Lector.objects.get(user=request.user)
-        context = {'groups': Group.objects.filter(lector=lector)}
+        context = {'groups': Group.objects.filter(lector=role.lector)}
         return render(request, 'edziennik/home_for_lector.html', context)
 
     # home for admins
-    if request.user.is_superuser:
-        groups = Group.objects.all()
+    if role.is_admin:
         context = { 'groups': Group.objects.all(),
-                    'lectors': Lector.objects.all(),}
+                    'lectors': Lector.objects.select_related('user'),}
         return render(request, 'edziennik/home_for_admin.html', context)
 
     # home for parents
-    parent_users = [parent.user for parent in Parent.objects.all()]
-    if request.user in parent_users:
+    if role.is_parent:
         # redirect to student view
-        parent = Parent.objects.get(user=request.user)
-        student = Student.objects.get(parent=parent)
+        student = Student.objects.get(parent=role.parent)
         return redirect('edziennik:student', pk=student.id)
 
     else:
@@ -50,77 +61,75 @@ def lector(request, pk):
         raise Http404
     lector = get_object_or_404(Lector, pk=pk)
     lectors_groups = lector.group_set.all()
-    # lectors hours
-    today = datetime.date.today()
-    # for dates between Sep and Dec
-    if today.month in range(9,13):
-        start_date = datetime.date(year=today.year, month=9, day=1)
-        end_date = datetime.date(year=today.year + 1, month=6, day=30)
-    # for dates between Jan and Jun
-    else:
-        start_date = datetime.date(year=today.year - 1, month=9, day=1)
-        end_date = datetime.date(year=today.year, month=6, day=30)
-    all_hours = ClassDate.objects.filter(lector=lector)
-    hours_in_current_year = all_hours.filter(
-        date_of_class__range=[start_date, end_date])
-    hours_in_month = {}
-    for i in hours_in_current_year:
-        hours_in_month[
-            str(i.date_of_class.month)+'.'+str(i.date_of_class.year)
-            ] = hours_in_month.get(
-                str(i.date_of_class.month)+'.'+str(i.date_of_class.year), 0) + 1
-
-    # res = {}
-    # for i in hours_in_current_year:
-    #         res[str(i.month)+'.'+str(i.year)
-    #             ] = res.get(str(i.month)+'.'+str(i.year), 0) + 1
-
-    # uu = sorted(res.items(), key=lambda i: (i[0][-4:], i[0].split('.')[0]))
-    # print(uu)
-
-    hours_in_month_list = sorted(
-        hours_in_month.items(), key=lambda i: (i[0][-4:], i[0].split('.')[0]))
+    # lectors hours in current school year
+    start_date, end_date = school_year(datetime.date.today())
+    hours = lector_hours([lector], start_date, end_date)[0]
 
     context = {
         'lector': lector,
         'lectors_groups': lectors_groups,
-        'total_hours_year': len(hours_in_current_year),
-        'hours_in_month_list': hours_in_month_list}
+        'total_hours_year': hours.total,
+        'hours_in_month_list': list(hours.months.items())}
 
     return render(request, 'edziennik/lector.html', context)
 
+def lectors_hours(request):
+    '''displays hours of all lectors per month, by default in current school year'''
+    if not request.user.is_superuser:
+        raise Http404
+    start_date, end_date = school_year(datetime.date.today())
+    try:
+        if request.GET.get('start_date'):
+            start_date = datetime.datetime.strptime(request.GET['start_date'], '%Y-%m-%d').date()
+        if request.GET.get('end_date'):
+            end_date = datetime.datetime.strptime(request.GET['end_date'], '%Y-%m-%d').date()
+    except ValueError:
+        messages.error(request, "Niepoprawna data, podaj date w formacie RRRR-MM-DD")
+
+    months = month_labels(start_date, end_date)
+    lectors = list(Lector.objects.select_related('user'))
+    table_content = []
+    for hours in lector_hours(lectors, start_date, end_date):
+        table_content.append(
+            [hours.lector] + [hours.months.get(month, 0) for month in months] + [hours.total])
+
+    context = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'months': months,
+        'table_content': table_content,
+    }
+    return render(request, 'edziennik/lectors_hours.html', context)
+
 def student(request, pk):
     '''displays info about a given student'''
-    student = get_object_or_404(Student, pk = pk)
+    student = get_object_or_404(
+        Student.objects.select_related('group__lector__user', 'parent__user', 'stats'), pk=pk)
     lector = student.group.lector
-    parents = [parent.user for parent in Parent.objects.all()]
     group = student.group
     if not (request.user.is_superuser) and (request.user != lector.user) and not (
-        request.user in parents):
+        request.edziennik_role.is_parent):
         raise Http404
-    grades = Grades.objects.filter(student=student)
-    grade_list = [(g.date_of_test.strftime("%d/%m/%Y"), g.name, g.score) for g in grades]
-    
-    students = Student.objects.filter(group=group) # all students in this group
-    all_classes = ClassDate.objects.filter(student__in=students).distinct().order_by('date_of_class') #all clases in this group
-    # check students attendance and build an array
+    def build():
+        grades = Grades.objects.filter(student=student)
+        grade_list = [(g.date_of_test.strftime("%d/%m/%Y"), g.name, g.score) for g in grades]
+
+        # check students attendance and build an array
+        icons = dict((status, attendance_icon(status)) for status in ATTENDANCE_ICONS)
+        attendance_table_content = []
+        for row in build_student_timeline(student):
+            date_string = row.class_date.date_of_class.strftime("%d/%m/%Y")
+            attendance_table_content.append(
+                [date_string, row.class_date.subject, icons[row.status]])
+        return grade_list, attendance_table_content
+
+    grade_list, attendance_table_content = cached(
+        'student_tables', student.id,
+        [(STUDENT, student.id), (GROUP_ATTENDANCE, student.group_id)], build)
     attendence_table_header = ['data', 'temat', 'obecnosc']
-    attendance_table_content = []
-    for date in all_classes:
-        date_string = date.date_of_class.strftime("%d/%m/%Y")
-        subject = date.subject
-        if student.student.filter(date_of_class=date.date_of_class):
-            if  not student.has_homework.filter(date_of_class=date.date_of_class):
-                img_url = static('img/green_on_red.png')
-            else:
-                img_url = static('img/check_sign_icon_green.png')
-        else:
-            img_url = static('img/x-mark-red.png')
-            
-        row = [date_string, subject, '<img src=%s>' % img_url]
-        attendance_table_content.append(row)
     context = {
         'student': student,
+        'stats': getattr(student, 'stats', None),
         'lector': lector,
         'group': group,
         'grade_list': grade_list,
@@ -129,6 +138,11 @@ def student(request, pk):
         }
     return render(request, 'edziennik/student.html', context)
 
+def grade_sheet(group):
+    ''' returns students of a group and rows of their grades to be displayed '''
+    sheet = build_grade_sheet(group)
+    return sheet.students, grade_table_content(sheet)
+
 def group(request, pk):
     ''' enables to select an action for a group '''
     if not request.user.is_staff:
@@ -140,25 +154,9 @@ def group(request, pk):
         print(lector.user)
         print(lector.user==request.user)
         raise Http404
-    students = Student.objects.filter(group=group)
-    grades_in_this_group = Grades.objects.filter(student__in=students)
-
-    dates_grades = []
-    for grade in grades_in_this_group:
-        if (grade.date_of_test, grade.name) not in dates_grades:
-            dates_grades.append((grade.date_of_test, grade.name))
-
-    table_header = ['data', 'za co'] + list(students)
-    table_content = []
-    for grade in dates_grades:
-        grade_date_name_score = [grade[0].strftime("%d/%m/%Y"), grade[1]]
-        for student in students:
-            item = grades_in_this_group.filter(student=student, date_of_test=grade[0], name=grade[1]).first()
-            if item:
-                grade_date_name_score.append(item.score)
-            else:
-                grade_date_name_score.append('-')
-        table_content.append(grade_date_name_score)
+    students, table_content = cached(
+        'group_grades', group.id, [(GROUP_GRADES, group.id)], lambda: grade_sheet(group))
+    table_header = ['data', 'za co'] + students
 
     context = {
         'group': group,
@@ -176,24 +174,8 @@ def show_group_grades(request, pk):
     lector = group.lector
     if not request.user.is_superuser and request.user != lector.user:
         raise Http404
-    students = Student.objects.filter(group=group)
-    grades_in_this_group = Grades.objects.filter(student__in=students)
-
-    dates_grades = []
-    for grade in grades_in_this_group:
-        if (grade.date_of_test, grade.name) not in dates_grades:
-            dates_grades.append((grade.date_of_test, grade.name))
-
-    table_content = []
-    for grade in dates_grades:
-        grade_date_name_score = [grade[0].strftime("%d/%m/%Y"), grade[1]]
-        for student in students:
-            item = grades_in_this_group.filter(student=student, date_of_test=grade[0], name=grade[1]).first()
-            if item:
-                grade_date_name_score.append(item.score)
-            else:
-                grade_date_name_score.append('-')
-        table_content.append(grade_date_name_score)
+    students, table_content = cached(
+        'group_grades', group.id, [(GROUP_GRADES, group.id)], lambda: grade_sheet(group))
 
     context = {
         'students': students,
@@ -225,40 +207,26 @@ def attendance_check(request, pk):
         raise Http404
     group = get_object_or_404(Group, pk=pk)
 
-    # checks if attendance was checked today in this group, if yes, error
-    for i in ClassDate.objects.filter(student__in=group.student_set.all()):
-        if i.date_of_class == datetime.date.today():
+    selected_student_list = request.POST.getlist('student') # wazne - getlist!!! - bierze liste wynikow a nie pojedynczy
+    class_subject = request.POST.get('class_subject')
+    have_homework = request.POST.getlist('homework')
+
+    with transaction.atomic():
+        # checks if attendance was checked today in this group, if yes, error
+        if attendance_checked_today(group):
             context = {
             'error_message': "BYLA JUZ DZIS SPRAWDZANA OBECNOSC W TEJ GRUPIE",
             'group': group,
             }
             return render(request, 'edziennik/group_check.html', context)
-   
-    # process attendance of each student
-    selected_student_list = request.POST.getlist('student') # wazne - getlist!!! - bierze liste wynikow a nie pojedynczy
-    class_subject = request.POST.get('class_subject')
-    class_date = ClassDate.objects.create(  date_of_class=datetime.datetime.today(),
-                                            subject = class_subject)
-    have_homework = request.POST.getlist('homework')
-    for id in selected_student_list:
-        student = Student.objects.get(id=id)
-        class_date.student.add(student)
-        student.quizlet = False
-        student.save()
-            
-        if id in have_homework:
-            class_date.has_homework.add(student)
-        # else:
-        #     student_without_homework = Student.objects.get(id=id)
-        #     student_without_homework.no_homework += 1
-        #     if student_without_homework.no_homework > 1:
-        #         email admin
-        #         student_without_homework.no_homework = 0
-        
-    # notify parents of absence
-    absentees = group.student_set.exclude(id__in=selected_student_list)
-    for student in absentees:
-        student_absence(student)
+
+        # process attendance of each student
+        class_date, absentees = record_attendance(
+            group, class_subject, selected_student_list, have_homework)
+
+        # notify parents of absence in one background task, once attendance is saved
+        if absentees:
+            transaction.on_commit(lambda: absence_notifications_task.delay(absentees))
 
     messages.success(request, "Obecnosc w grupie %s sprawdzona" % group.name)
     # return redirect('edziennik:name_home')
@@ -273,24 +241,18 @@ def attendance_by_group(request, group_id):
     lector = group.lector
     if not request.user.is_superuser and request.user != lector.user:
         raise Http404
-    students = group.student_set.all()
-    table_header = ['data', 'temat'] + list(students)
-    table_content = []
-    classes_in_group = ClassDate.objects.filter(student__in=students).distinct().order_by('date_of_class')
-
-    for i in classes_in_group:
-        row = [i.date_of_class.strftime("%d/%m/%Y"), i.subject]
-        for s in students:
-            if s in i.student.all():
-                if s.has_homework.filter(date_of_class=i.date_of_class):
-                    img_url = static('img/check_sign_icon_green.png')
-                else:
-                    img_url = static('img/green_on_red.png')
-            else:
-                img_url = static('img/x-mark-red.png')
-            row.append('<img src=%s>' % img_url)
-        table_content.append(row)
-
+    def build():
+        matrix = build_attendance_matrix(group)
+        icons = dict((status, attendance_icon(status)) for status in ATTENDANCE_ICONS)
+        table_content = []
+        for row in matrix.rows:
+            table_content.append(
+                [row.class_date.date_of_class.strftime("%d/%m/%Y"), row.class_date.subject] +
+                [icons[status] for status in row.statuses])
+        return matrix.students, table_content
+
+    students, table_content = cached(
+        'group_attendance', group.id, [(GROUP_ATTENDANCE, group.id)], build)
 
     context = {
         'group': group,
@@ -322,22 +284,16 @@ def add_grades(request, pk):
         raise Http404
     group = get_object_or_404(Group, pk=pk)
     students = Student.objects.filter(group=group)
-    date_of_test = request.POST.get('date_of_test') or datetime.datetime.today()
+    date_of_test = request.POST.get('date_of_test') or datetime.date.today()
     grade_name = request.POST.get('grade_name')
-    for student in students:
-        if request.POST.get(student.name):
-            todays_grades = Grades.objects.filter(student=student)
-            # make sure grade with this name is not already added
-            if todays_grades.filter(name=grade_name, date_of_test=date_of_test):
-                messages.error(request, "Ocena za %s  w dniu %s byla juz dodana uczniowi %s. Sprobuj jeszcze raz" % (grade_name, date_of_test, student.name))
-                return redirect('edziennik:group_grades', group_id=pk)
-            # add grade
-            instance = Grades.objects.create(
-                name=grade_name,
-                date_of_test=date_of_test,
-                student = student,
-                score = request.POST.get(student.name)
-                )
+    scores = dict((student, request.POST.get(student.name))
+                  for student in students if request.POST.get(student.name))
+    # make sure grade with this name is not already added, grades are added all or none
+    duplicates = record_grades(grade_name, date_of_test, scores)
+    if duplicates:
+        messages.error(request, "Ocena za %s  w dniu %s byla juz dodana uczniom: %s. Sprobuj jeszcze raz" % (
+            grade_name, date_of_test, ', '.join(s.name for s in duplicates)))
+        return redirect('edziennik:group_grades', group_id=pk)
 
     messages.success(request, "Oceny w grupie %s dodane" % group.name)
     return redirect(reverse('edziennik:group', args=(group.id,)))
@@ -364,3 +320,83 @@ def process_quizlet(request):
         student_object.save()
     messages.success(request, "Punkty za quizlet w grupie %s dodane" % student_object.group.name)
     return redirect('edziennik:name_home')
+
+def instrumentation_stats(request):
+    ''' slowest views and views making most queries, measured in this process '''
+    if not request.user.is_superuser:
+        raise Http404
+    recorder = instrumentation.recorder()
+    context = {
+        'enabled': settings.INSTRUMENT_VIEWS,
+        'measured': len(recorder.recent()),
+        'slowest': recorder.slowest(),
+        'most_queries': recorder.most_queries(),
+        'cache_stats': sorted(cache_stats().items()),
+        }
+    return render(request, 'edziennik/instrumentation.html', context)
+
+@csrf_exempt
+@require_POST
+def twilio_status_callback(request):
+    ''' receives sms delivery reports from twilio '''
+    if not settings.TWILIO_AUTH_TOKEN:
+        return HttpResponse(status=403)
+    validator = RequestValidator(settings.TWILIO_AUTH_TOKEN)
+    signature = request.META.get('HTTP_X_TWILIO_SIGNATURE', '')
+    if not validator.validate(request.build_absolute_uri(),
+                              request.POST.dict(), signature):
+        return HttpResponse(status=403)
+    sid = request.POST.get('MessageSid')
+    status = request.POST.get('MessageStatus')
+    if not sid or not status:
+        return HttpResponse(status=400)
+    record_twilio_status(sid, status)
+    return HttpResponse(status=204)
+
+@csrf_exempt
+@require_GET
+def smsapi_status_callback(request):
+    ''' receives sms delivery reports from smsapi.pl, several reports may
+    come in one request as comma separated lists '''
+    token = request.GET.get('token', '')
+    if not settings.SMS_CALLBACK_TOKEN or \
+            not constant_time_compare(token, settings.SMS_CALLBACK_TOKEN):
+        return HttpResponse(status=403)
+    message_ids = request.GET.get('MsgId', '').split(',')
+    statuses = request.GET.get('status', '').split(',')
+    if not request.GET.get('MsgId') or len(message_ids) != len(statuses):
+        return HttpResponse(status=400)
+    for message_id, status in zip(message_ids, statuses):
+        record_smsapi_status(message_id, status)
+    # smsapi.pl repeats the report until it gets OK
+    return HttpResponse('OK')
+
+def export_table(request, table, group_id=None):
+    ''' streams attendance or grades of a group, or of all groups to a superuser,
+    as csv or, with ?format=xlsx, as an xlsx file '''
+    if not request.user.is_staff:
+        raise Http404
+    if group_id is None:
+        if not request.user.is_superuser:
+            raise Http404
+        groups = Group.objects.order_by('name', 'id').iterator()
+        filename = table
+    else:
+        group = get_object_or_404(Group.objects.select_related('lector'), pk=group_id)
+        if not request.user.is_superuser and request.user.id != group.lector.user_id:
+            raise Http404
+        groups = [group]
+        filename = '%s_%s' % (table, group.id)
+
+    rows = export.table_rows(table, groups)
+    if request.GET.get('format') == 'xlsx':
+        if export.openpyxl is None:
+            raise Http404
+        response = FileResponse(export.xlsx_file(rows), content_type=(
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'))
+        filename += '.xlsx'
+    else:
+        response = StreamingHttpResponse(export.csv_lines(rows), content_type='text/csv')
+        filename += '.csv'
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
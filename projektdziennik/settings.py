@@ -31,12 +31,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'edziennik.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'edziennik.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -140,17 +142,63 @@ TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
 TWILIO_TEST_PHONE_NO = os.environ.get('TWILIO_TEST_PHONE_NO')
 MESSAGING_SERVICE_SID = os.environ.get('MESSAGING_SERVICE_SID')
+# max number of sms statuses fetched from twilio at the same time
+SMS_STATUS_CHECK_WORKERS = 10
+
+# delivery reports are sent to SITE_URL, none are requested if it is not set
+SITE_URL = os.environ.get('SITE_URL')
+# secret appended to smsapi.pl notify url
+SMS_CALLBACK_TOKEN = os.environ.get('SMS_CALLBACK_TOKEN')
 
 # CELERY STUFF
 BROKER_URL = os.environ.get('REDIS_URL')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL')
 
+# cached group and student tables; redis is shared by all web processes,
+# without it every process has its own cache, which is only correct with one
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'edziennik.redis_cache.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'KEY_PREFIX': 'edziennik',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Africa/Nairobi'
 
+# per view query count, sql, template and total time and response size,
+# logged and kept in memory, see edziennik.instrumentation
+INSTRUMENT_VIEWS = os.environ.get('INSTRUMENT_VIEWS') == '1'
+INSTRUMENTATION_BUFFER_SIZE = 500
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'edziennik.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # email
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL')
 EMAIL_HOST = os.environ.get('EMAIL_HOST')
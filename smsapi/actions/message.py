@@ -51,6 +51,11 @@ class ApiSendAction(object):
             self._data['check_idx'] = 1
             
         return self
+
+    def set_notify_url(self, url):
+        self._data['notify_url'] = url
+
+        return self
         
     def send_test(self, test=True):
         if not test:
@@ -1,8 +1,22 @@
 # -*- coding: utf-8 -*-
 
+import sys
+
 from .action import ApiAction
 from .message import ApiSendAction
 
+if sys.version_info[0] == 3:
+    text_type = str
+else:
+    text_type = unicode
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return text_type(value)
+
+
 CHARSETS= (
     'iso-8859-1'
     'iso-8859-2'
@@ -122,19 +136,15 @@ class SendAction(ApiSendAction, ApiAction):
         return self        
         
     def set_params(self, *args):
-            
-        index = 1
-        
-        params = None
-        
-        for arg in args:
+        """param1 ... param4, a list gives one value per recipient; text is
+        sent as utf-8 like the content."""
+
+        for index, arg in enumerate(args, 1):
             if isinstance(arg, (tuple, list)):
-                params = '|'.join(arg)
-                
-            self._data['param' + str(index)] = params or str(arg)                
-                
-            index += 1
-            
+                arg = u'|'.join(_text(value) for value in arg)
+
+            self._data['param' + str(index)] = _text(arg).encode('utf-8')
+
         return self
     
     def send_flash(self):
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""asyncio client, Python 3.5+ only.
+
+edziennik runs on Python 2.7 (runtime.txt) and does not use it yet; its
+tests are run by python3 from the Python 2 test suite.
+
+Mirrors the fluent API of SmsAPI, every action gets its own request
+state so many of them can run at the same time:
+
+    api = AsyncSmsAPI(username, password, concurrency=10)
+    result = await api.service('sms').action('send') \\
+        .set_content('message').set_to('48500000000').execute()
+
+Actions prepare requests exactly like the blocking ones, only sending
+is done here. A FailoverPolicy given as `policy` orders hosts and retries
+requests like in the blocking client, backoff is awaited.
+"""
+
+import asyncio
+import ssl
+from urllib.parse import urlsplit
+
+from . import services
+from .client import SmsAPI
+from .failover import is_idempotent
+from .proxy import ApiProxyError, PreparedRequest, RequestCapture
+from .responses import ApiError, ApiResponse
+from .transport import BufferedResponse, ConnectError, TransportError
+
+
+class AsyncHttpTransport(object):
+    """HTTP/1.1 client on asyncio streams keeping connections alive."""
+
+    def __init__(self, pool_size=10, connect_timeout=10, read_timeout=30):
+        self.pool_size = pool_size
+
+        self.connect_timeout = connect_timeout
+
+        self.read_timeout = read_timeout
+
+        self.connections_made = 0
+
+        self._pools = {}
+
+    async def request(self, url, body=None, headers=None):
+        parts = urlsplit(url)
+
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise TransportError('Unsupported url: %s' % url)
+
+        key = (parts.scheme, parts.hostname,
+               parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        lines = ['%s %s HTTP/1.1' % ('GET' if body is None else 'POST', path),
+                 'Host: %s' % parts.netloc]
+        for name, value in (headers or {}).items():
+            if name.lower() != 'content-length':
+                lines.append('%s: %s' % (name, value))
+        lines.append('Content-Length: %d' % len(body or b''))
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if not hasattr(body, 'read'):
+            request += body or b''
+            body = None
+
+        pool = self._pools.setdefault(key, [])
+        reused = bool(pool)
+        connection = pool.pop() if reused else await self._connect(key)
+        try:
+            status, response_headers, data = await self._exchange(connection, request, body, url)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            if not reused:
+                raise TransportError(str(e))
+            # server closed idle keep-alive connection
+            connection = await self._connect(key)
+            try:
+                status, response_headers, data = await self._exchange(
+                    connection, request, body, url)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                raise TransportError(str(e))
+
+        if response_headers.get('connection', '').lower() == 'close' or \
+                len(pool) >= self.pool_size:
+            connection[1].close()
+        else:
+            pool.append(connection)
+
+        if status >= 400:
+            raise TransportError('HTTP Error %s' % status)
+
+        return BufferedResponse(url, status, response_headers, data)
+
+    def close(self):
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for reader, writer in pool:
+                writer.close()
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == 'https' else None
+        try:
+            connection = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=context),
+                self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise ConnectError('Timeout: %s' % host)
+        except OSError as e:
+            raise ConnectError(str(e))
+        self.connections_made += 1
+        return connection
+
+    async def _exchange(self, connection, request, body, url):
+        """Sends the request, the connection is closed on failure. Timeouts
+        are not retried; they are checked first, asyncio.TimeoutError is an
+        OSError since 3.8."""
+        try:
+            return await self._send(connection, request, body)
+        except asyncio.TimeoutError:
+            connection[1].close()
+            raise TransportError('Timeout: %s' % url)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            connection[1].close()
+            raise
+
+    async def _send(self, connection, request, body=None):
+        reader, writer = connection
+        writer.write(request)
+        if body is not None:
+            # streamed body, e.g. multipart with files
+            body.seek(0)
+            for chunk in body:
+                writer.write(chunk)
+                await writer.drain()
+        await writer.drain()
+        return await asyncio.wait_for(self._read_response(reader), self.read_timeout)
+
+    async def _read_response(self, reader):
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            return status, headers, b''.join(chunks)
+
+        return status, headers, await reader.readexactly(
+            int(headers.get('content-length', 0)))
+
+
+class AsyncAction(object):
+    """Wraps a blocking action, setters are chained, execute is awaited."""
+
+    def __init__(self, api, action, capture):
+        self._api = api
+
+        self._action = action
+
+        self._capture = capture
+
+    def __getattr__(self, name):
+        attr = getattr(self._action, name)
+        if not callable(attr):
+            return attr
+
+        def setter(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self._action else result
+        return setter
+
+    async def execute(self):
+        try:
+            self._action.execute()
+        except PreparedRequest as prepared:
+            request = prepared
+        else:
+            raise RuntimeError('Action sent a request without the proxy.')
+
+        response = await self._api._send(request.uri, request.body, request.headers,
+                                         idempotent=is_idempotent(request.data))
+        return ApiResponse(response)
+
+
+class AsyncService(object):
+
+    def __init__(self, api, name):
+        self._api = api
+
+        service_name = 'Service%s' % name.title()
+        if not hasattr(services, service_name):
+            raise AttributeError('Unrecognized service name %s' % service_name)
+        self._service_class = getattr(services, service_name)
+
+    def action(self, action=None, data=None):
+        capture = self._api._capture()
+        service = self._service_class(capture)
+
+        action_name = 'action_%s' % action.lower()
+        if not hasattr(service, action_name):
+            raise ValueError('Action not exist.')
+
+        action = getattr(service, action_name)()
+        if data:
+            action.data(data)
+        return AsyncAction(self._api, action, capture)
+
+
+class AsyncSmsAPI(object):
+    """At most `concurrency` requests are sent at the same time."""
+
+    def __init__(self, username=None, password=None, concurrency=10, **kwargs):
+        self.api_url = 'https://api.smsapi.pl/'
+
+        self.hostname = self.api_url
+
+        self.response_format = 'json'
+
+        self.username = username
+
+        self.password = password
+
+        self.auth_token = kwargs.get('auth_token')
+
+        self.concurrency = concurrency
+
+        self.transport = kwargs.get('transport') or AsyncHttpTransport(pool_size=concurrency)
+
+        self.policy = kwargs.get('policy')
+
+        self._semaphore = None
+
+    def service(self, name):
+        return AsyncService(self, name)
+
+    def set_hostname(self, hostname):
+        self.hostname = hostname
+        return self
+
+    def set_username(self, username):
+        self.username = username
+        return self
+
+    def set_policy(self, policy):
+        self.policy = policy
+        return self
+
+    def set_password(self, password, encode=True):
+        self.password = SmsAPI().hash(password) if encode else password
+        return self
+
+    def close(self):
+        self.transport.close()
+
+    def _capture(self):
+        capture = RequestCapture(self.hostname, {'format': self.response_format})
+        capture.auth = self.auth_token or (self.username, self.password)
+        return capture
+
+    async def _send(self, uri, body, headers, idempotent=False):
+        hosts = self.hostname
+        if not isinstance(hosts, (list, tuple)):
+            hosts = [hosts]
+
+        if self.policy is not None:
+            response = await self._send_with_policy(hosts, uri, body, headers, idempotent)
+            if response is not None:
+                return response
+        else:
+            for host in hosts:
+                try:
+                    return await self._request(host, uri, body, headers)
+                except ConnectError:
+                    continue
+                except TransportError:
+                    if not idempotent:
+                        # the host may have got it already
+                        break
+
+        raise ApiProxyError("Unable connect to the specified url: %s" % str(self.hostname))
+
+    async def _send_with_policy(self, hosts, uri, body, headers, idempotent):
+        """FailoverPolicy.send with awaited requests and backoff, returns
+        None if no host answered."""
+        policy = self.policy
+        start = policy.clock()
+        attempts = policy.attempts(idempotent)
+        for attempt in range(attempts):
+            for host in policy.order(hosts):
+                try:
+                    response = await self._request(host, uri, body, headers)
+                except TransportError as e:
+                    policy.record_failure(host)
+                    if not policy.may_fail_over(e, idempotent):
+                        # the host may have got it already
+                        return None
+                else:
+                    policy.record_success(host)
+                    return response
+
+            delay = policy.retry_delay(attempt, attempts, start)
+            if delay is None:
+                break
+            # the concurrency slot is not held while waiting
+            await asyncio.sleep(delay)
+        return None
+
+    async def _request(self, host, uri, body, headers):
+        if self._semaphore is None:
+            # created here so that it belongs to the running loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        url = host + (uri or '') if host.endswith('/') else '%s/%s' % (host, uri or '')
+        async with self._semaphore:
+            return await self.transport.request(url, body, headers)
+
+
+async def send_all(api, messages, options=None):
+    """Sends (recipient, content) messages concurrently, returns
+    ApiResponse or ApiError for every message."""
+
+    async def send(to, content):
+        action = api.service('sms').action('send', options)
+        try:
+            return await action.set_content(content).set_to(to).execute()
+        except ApiError as e:
+            return e
+
+    return await asyncio.gather(*[send(to, content) for to, content in messages])
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""In-process fake api.smsapi.pl for tests of the asyncio client,
+Python 3.5+ only.
+
+    async with AsyncStubServer(delay=0.01) as server:
+        api.set_hostname(server.url)
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qsl
+
+from .testing import sms_sent
+
+# asyncio.current_task() is new in 3.7
+current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+class AsyncStubServer(object):
+    """Answers in the same event loop as the client, `delay` seconds are
+    spent on every request to make concurrency visible."""
+
+    def __init__(self, responder=sms_sent, delay=0):
+        self.responder = responder
+
+        self.delay = delay
+
+        self.connections = 0
+
+        self.requests = []
+
+        self.in_flight = 0
+
+        self.max_in_flight = 0
+
+        self._server = None
+
+        self._handlers = {}
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s/' % self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        # connections kept alive by clients are closed, handlers end on eof
+        for writer in self._handlers.values():
+            writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        handler = current_task()
+        self._handlers[handler] = writer
+        try:
+            while True:
+                try:
+                    request_line = await reader.readuntil(b'\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readuntil(b'\r\n')
+                    if line == b'\r\n':
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                method, path = request_line.decode('latin-1').split()[:2]
+                query = body.decode('utf-8') if method == 'POST' else path.partition('?')[2]
+                params = dict(parse_qsl(query))
+                self.requests.append((path, params))
+
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(self.delay)
+                self.in_flight -= 1
+
+                data = json.dumps(self.responder(params)).encode('utf-8')
+                writer.write(('HTTP/1.1 200 OK\r\n'
+                              'Content-Type: application/json\r\n'
+                              'Content-Length: %d\r\n\r\n' % len(data)).encode('latin-1') + data)
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    # client gave up waiting, e.g. timed out
+                    break
+        finally:
+            writer.close()
+            self._handlers.pop(handler, None)
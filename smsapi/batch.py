@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple, OrderedDict
+from uuid import uuid4
+
+from .proxy import ApiProxyError
+from .responses import ApiError
+
+# recipients of one sms.do request
+MAX_RECIPIENTS = 100
+
+# param1 ... param4 can be used in a message
+MAX_PARAMS = 4
+
+
+class BatchMessage(namedtuple('BatchMessage', ['to', 'content', 'params', 'key'])):
+    """Message to one recipient.
+
+    `content` may reference `params` as [%1%] ... [%4%], `key` is returned
+    with the result, so that it can be matched with the message.
+    """
+
+    def __new__(cls, to, content, params=(), key=None):
+        return super(BatchMessage, cls).__new__(cls, to, content, tuple(params), key)
+
+    def render(self):
+        content = self.content
+        for index, param in enumerate(self.params, 1):
+            content = content.replace('[%%%d%%]' % index, param)
+        return content
+
+
+BatchResult = namedtuple('BatchResult', ['message', 'id', 'status', 'points', 'error'])
+
+
+def plan_batches(messages, max_recipients=MAX_RECIPIENTS):
+    """Groups messages with the same content into lists of at most
+    max_recipients messages, each to a different number."""
+    groups = OrderedDict()
+    for message in messages:
+        if len(message.params) > MAX_PARAMS:
+            raise ValueError('At most %d params can be used.' % MAX_PARAMS)
+        if any('|' in param for param in message.params):
+            raise ValueError('Params must not contain "|".')
+        groups.setdefault((message.content, len(message.params)), []).append(message)
+
+    for group in groups.values():
+        # a number may get the same content twice, it goes to another batch
+        batches = []
+        for message in group:
+            for batch, numbers in batches:
+                if len(batch) < max_recipients and message.to not in numbers:
+                    break
+            else:
+                batch, numbers = [], set()
+                batches.append((batch, numbers))
+            batch.append(message)
+            numbers.add(message.to)
+        for batch, numbers in batches:
+            yield batch
+
+
+def send_batch(api, messages, max_recipients=MAX_RECIPIENTS, options=None):
+    """Sends messages in as few requests as possible, yields BatchResult
+    for every message; a failed request, rejected by the api or not sent
+    at all, gives results with an error for all its messages and the
+    remaining requests are still sent.
+
+    `options` are set on every send action, e.g. {'from': 'Info'}.
+    """
+    base = api.request('sms', 'send', options)
+    for batch in plan_batches(messages, max_recipients):
+        # unique idx lets the request be retried without sending twice
+        request = base.set_content(batch[0].content) \
+                      .set_to([message.to for message in batch]) \
+                      .set_idx([uuid4().hex for message in batch]) \
+                      .set_check_idx()
+        if batch[0].params:
+            request = request.set_params(*[[message.params[i] for message in batch]
+                                           for i in range(len(batch[0].params))])
+        try:
+            response = api.send(request)
+        except ApiError as e:
+            for message in batch:
+                yield BatchResult(message, None, None, None, e.code or e.message)
+            continue
+        except ApiProxyError as e:
+            # no host answered, the messages may still have been sent
+            for message in batch:
+                yield BatchResult(message, None, None, None, str(e))
+            continue
+
+        for message, sent in match_recipients(batch, list(response.data)):
+            if sent is None:
+                yield BatchResult(message, None, None, None, 'not sent')
+            else:
+                yield BatchResult(message, sent.get('id'), sent.get('status'),
+                                  sent.get('points'), sent.get('error'))
+
+
+def match_recipients(batch, sent):
+    """Pairs messages with response entries by number, falls back
+    to the order of recipients when numbers were normalized by the api."""
+    by_number = dict((str(entry.get('number')), entry) for entry in sent)
+    if all(message.to in by_number for message in batch):
+        return [(message, by_number[message.to]) for message in batch]
+    return [(message, sent[i] if i < len(sent) else None)
+            for i, message in enumerate(batch)]
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks, the network ones run against a local stub server.
+
+    python -m smsapi.benchmarks transport --messages 200 --handshake-delay 0.01
+    python3 -m smsapi.benchmarks multipart --size-mb 20
+    python -m smsapi.benchmarks smil --messages 2000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from .client import SmsAPI
+from .proxy import ApiHttpProxy
+from .smil import Smil, SmilTemplate
+from .testing import StubServer
+from .transport import UrllibTransport, PooledHttpTransport
+
+
+def send_messages(url, transport, messages):
+    api = SmsAPI(transport=transport)
+    api.set_hostname(url)
+    api.set_username('benchmark')
+    api.set_password('benchmark')
+    for i in range(messages):
+        api.service('sms').action('send')
+        api.set_content('benchmark %d' % i)
+        api.set_to('48500000000')
+        api.execute()
+
+
+def benchmark_transport(options):
+    print('%-12s %10s %12s %10s' % ('transport', 'messages', 'connections', 'time [s]'))
+    for name, transport in (('urllib', UrllibTransport()),
+                            ('pooled', PooledHttpTransport())):
+        with StubServer(handshake_delay=options.handshake_delay) as server:
+            start = time.time()
+            send_messages(server.url, transport, options.messages)
+            elapsed = time.time() - start
+            transport.close()
+        print('%-12s %10d %12d %10.3f' % (
+            name, options.messages, server.connections, elapsed))
+
+
+def benchmark_multipart(options):
+    if tracemalloc is None:
+        raise SystemExit('multipart benchmark needs tracemalloc (Python 3)')
+
+    fd, path = tempfile.mkstemp(suffix='.wav')
+    with os.fdopen(fd, 'wb') as f:
+        for i in range(options.size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    def buffered(url):
+        proxy = ApiHttpProxy(url, {'to': '48500000000'}, transport=PooledHttpTransport())
+        proxy.add_file(path)
+        content_type, body = proxy.encode_multipart_data()
+        proxy.send('vms.do', body, {'Content-Type': content_type})
+
+    def streamed(url):
+        proxy = ApiHttpProxy(url, {'to': '48500000000'}, transport=PooledHttpTransport())
+        proxy.add_file(path)
+        proxy.execute('vms.do')
+
+    print('%-10s %10s %16s %10s' % ('body', 'file [MB]', 'peak memory [MB]', 'time [s]'))
+    try:
+        for name, send in (('buffered', buffered), ('streamed', streamed)):
+            with StubServer() as server:
+                tracemalloc.start()
+                start = time.time()
+                send(server.url)
+                elapsed = time.time() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            print('%-10s %10d %16.1f %10.3f' % (
+                name, options.size_mb, peak / 1024.0 / 1024, elapsed))
+    finally:
+        os.remove(path)
+
+
+def benchmark_smil(options):
+    fd, path = tempfile.mkstemp(suffix='.png')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(os.urandom(20 * 1024))
+
+    contents = [u'Uczeń %d był dziś nieobecny na lekcji' % i for i in range(options.messages)]
+
+    def rendered():
+        for content in contents:
+            smil = Smil()
+            smil.add_image(path)
+            smil.add_text(content)
+            smil.render()
+
+    def template():
+        smil = SmilTemplate()
+        smil.add_image(path)
+        smil.add_text_field('content')
+        for content in contents:
+            smil.render(content=content)
+
+    print('%-10s %10s %10s %16s' % ('smil', 'messages', 'time [s]', 'per message [us]'))
+    try:
+        for name, render in (('render', rendered), ('template', template)):
+            start = time.time()
+            render()
+            elapsed = time.time() - start
+            print('%-10s %10d %10.3f %16.1f' % (
+                name, options.messages, elapsed, elapsed / options.messages * 1e6))
+    finally:
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('target', choices=['transport', 'multipart', 'smil'])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--handshake-delay', type=float, default=0.01,
+                        help='seconds spent by stub server on every new connection')
+    parser.add_argument('--size-mb', type=int, default=20,
+                        help='size of the file attached to a multipart request')
+    options = parser.parse_args(argv)
+    globals()['benchmark_%s' % options.target](options)
+
+
+if __name__ == '__main__':
+    main()
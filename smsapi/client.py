@@ -2,7 +2,10 @@
 
 import hashlib
 from . import services
-from .proxy import ApiHttpProxy
+from .failover import is_idempotent
+from .proxy import ApiHttpProxy, PreparedRequest, RequestCapture
+from .request import ApiRequest
+from .responses import ApiResponse, StreamingApiResponse
 
 
 class SmsAPI(object):
@@ -26,7 +29,8 @@ class SmsAPI(object):
         
         self._reset = True
 
-        self._proxy = ApiHttpProxy(self.api_url)
+        self._proxy = ApiHttpProxy(self.api_url, transport=kwargs.get('transport'),
+                                   policy=kwargs.get('policy'))
     
     def service(self, name):
         service_name = 'Service%s' % name.title()
@@ -70,6 +74,14 @@ class SmsAPI(object):
 
         return self
 
+    def set_transport(self, transport):
+        self._proxy.set_transport(transport)
+        return self
+
+    def set_policy(self, policy):
+        self._proxy.set_policy(policy)
+        return self
+
     def set_proxy(self, proxy):
         if not isinstance(proxy, proxy.ApiProxy):
             raise TypeError('Invalid type.')
@@ -105,6 +117,59 @@ class SmsAPI(object):
 
         return result
 
+    def request(self, service, action, data=None):
+        """Returns an immutable ApiRequest to be sent with send()."""
+        request = ApiRequest(service, action)
+        return request.data(data) if data else request
+
+    def send(self, request):
+        """Sends an ApiRequest; uses only credentials, hostname and
+        transport of the client, so one client can be shared by threads."""
+        prepared = self._prepare(request)
+        return ApiResponse(self._proxy.send(
+            prepared.uri, prepared.body, prepared.headers,
+            idempotent=is_idempotent(prepared.data)))
+
+    def stream(self, request, chunk_size=8192):
+        """Sends an ApiRequest, list items of the response are parsed as
+        they arrive. The request is sent again for every loop over
+        the response."""
+        def open_response():
+            prepared = self._prepare(request)
+            return self._proxy.send(
+                prepared.uri, prepared.body, prepared.headers, stream=True,
+                idempotent=is_idempotent(prepared.data))
+        return StreamingApiResponse(open_response, chunk_size)
+
+    def pages(self, request, page_size=100):
+        """Yields lists of records of a list endpoint taking limit and
+        offset, e.g. phonebook contacts, one request per page."""
+        offset = 0
+        while True:
+            page = list(self.send(
+                request.set_limit(page_size).set_offset(offset)))
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    def iter_all(self, request, page_size=100):
+        for page in self.pages(request, page_size):
+            for record in page:
+                yield record
+
+    def _prepare(self, request):
+        capture = RequestCapture(self._proxy.hostname, {'format': self.response_format})
+        capture.auth = self.auth_token or (self.username, self.password)
+
+        try:
+            request.build(capture).execute()
+        except PreparedRequest as prepared:
+            return prepared
+
+        raise RuntimeError('Action sent a request without the proxy.')
+
     def __getattr__(self, name):
         if self._action and hasattr(self._action, name):
             return getattr(self._action, name)
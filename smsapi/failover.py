@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+
+from .transport import ConnectError, TransportError
+
+
+def is_idempotent(data):
+    """Requests without recipients can be repeated, sends only when
+    the api rejects a repeated idx."""
+    if 'to' not in data and 'group' not in data:
+        return True
+    return bool(data.get('idx')) and bool(data.get('check_idx'))
+
+
+class HostState(object):
+
+    def __init__(self):
+        self.score = 1.0
+
+        self.consecutive_failures = 0
+
+        self.open_until = 0
+
+
+class FailoverPolicy(object):
+    """Decides which hosts are tried, in what order and how many times.
+
+    Every host has a health score (moving average of successes) and hosts
+    are tried best first. After `failure_threshold` failures in a row a
+    host is skipped for `cooldown` seconds, then it gets one trial request.
+    Failed rounds over all hosts are repeated up to `retries` times with
+    exponential backoff and jitter, but only for requests which can be
+    sent twice, and never past `deadline` seconds from the first attempt.
+    Requests which can not be sent twice go to the next host only if they
+    were not sent to the previous one, see ConnectError.
+    """
+
+    def __init__(self, retries=2, backoff=0.5, max_backoff=5, jitter=0.5,
+                 failure_threshold=3, cooldown=30, deadline=20, alpha=0.3,
+                 clock=time.time, sleep=time.sleep, random=random.random):
+        self.retries = retries
+
+        self.backoff = backoff
+
+        self.max_backoff = max_backoff
+
+        self.jitter = jitter
+
+        self.failure_threshold = failure_threshold
+
+        self.cooldown = cooldown
+
+        self.deadline = deadline
+
+        self.alpha = alpha
+
+        self.clock = clock
+
+        self.sleep = sleep
+
+        self.random = random
+
+        self._hosts = {}
+
+        self._lock = threading.Lock()
+
+    def state(self, host):
+        with self._lock:
+            return self._hosts.setdefault(host, HostState())
+
+    def order(self, hosts):
+        """Hosts with closed circuit, best score first."""
+        now = self.clock()
+        with self._lock:
+            states = [(host, self._hosts.setdefault(host, HostState())) for host in hosts]
+            available = [(index, host, state) for index, (host, state) in enumerate(states)
+                         if state.open_until <= now]
+        available.sort(key=lambda item: (-item[2].score, item[0]))
+        return [host for index, host, state in available]
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._hosts.setdefault(host, HostState())
+            state.score += self.alpha * (1 - state.score)
+            state.consecutive_failures = 0
+            state.open_until = 0
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._hosts.setdefault(host, HostState())
+            state.score -= self.alpha * state.score
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= self.failure_threshold:
+                state.open_until = self.clock() + self.cooldown
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number `attempt` (from 0)."""
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * (1 - self.jitter * self.random())
+
+    def attempts(self, idempotent):
+        """Rounds over all hosts a request gets."""
+        return self.retries + 1 if idempotent else 1
+
+    def retry_delay(self, attempt, attempts, start):
+        """Seconds to wait after failed round number `attempt` (from 0) of
+        a request first sent at `start`, None if it is not retried."""
+        if attempt + 1 == attempts:
+            return None
+        delay = self.delay(attempt)
+        if self.deadline is not None and self.clock() + delay - start > self.deadline:
+            return None
+        return delay
+
+    def may_fail_over(self, error, idempotent):
+        """Whether a request which failed with TransportError `error` can
+        be sent to another host."""
+        return idempotent or isinstance(error, ConnectError)
+
+    def send(self, hosts, connect, idempotent):
+        """Calls connect(host) until it returns a response with status 200,
+        returns None if no host answered. connect may raise TransportError."""
+        start = self.clock()
+        attempts = self.attempts(idempotent)
+        for attempt in range(attempts):
+            for host in self.order(hosts):
+                try:
+                    response = connect(host)
+                except TransportError as e:
+                    self.record_failure(host)
+                    if not self.may_fail_over(e, idempotent):
+                        # the host may have got it already
+                        return None
+                    continue
+                if response and response.getcode() == 200:
+                    self.record_success(host)
+                    return response
+                self.record_failure(host)
+
+            delay = self.retry_delay(attempt, attempts, start)
+            if delay is None:
+                break
+            self.sleep(delay)
+        return None
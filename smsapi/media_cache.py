@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+
+# names of entry files written by MediaCache, temporary files end with .tmp
+ENTRY_NAME = 'media-%s.json'
+ENTRY_NAME_RE = re.compile(r'^media-[0-9a-f]{40}\.json$')
+
+
+def is_url(src):
+    return src.startswith(('http://', 'https://'))
+
+
+def fetch(url, headers=None):
+    """Returns (data, etag), data is None if the server did not answer 200."""
+    response = urlopen(Request(url, headers=headers or {}))
+    try:
+        if response.getcode() != 200:
+            return None, None
+        return response.read(), response.info().get('ETag')
+    finally:
+        response.close()
+
+
+def read_media(src):
+    """Content of a local file or url, without any caching."""
+    if is_url(src):
+        return fetch(src)[0]
+    with open(src, 'rb') as media_file:
+        return media_file.read()
+
+
+class MediaCache(object):
+    """Encoded media (data uris) of local files and urls.
+
+    Local files are keyed by path, mtime and size, urls by their ETag which
+    is revalidated with If-None-Match once the entry is older than `max_age`
+    seconds (urls without ETag are fetched again then). Up to `max_entries`
+    uris are kept in memory, least recently used are dropped first. With
+    `directory` set entries are also stored on disk, named by the hash of
+    the source, and the least recently used files are removed when they
+    take more than `max_disk_bytes`.
+    """
+
+    def __init__(self, max_entries=128, directory=None, max_disk_bytes=64 * 1024 * 1024,
+                 max_age=300, clock=time.time):
+        self.max_entries = max_entries
+
+        self.directory = directory
+
+        self.max_disk_bytes = max_disk_bytes
+
+        self.max_age = max_age
+
+        self.clock = clock
+
+        self.hits = 0
+
+        self.misses = 0
+
+        self.disk_hits = 0
+
+        self.not_modified = 0
+
+        # src -> {'validator': mtime and size or ETag, 'checked': time, 'uri': data uri}
+        self._entries = OrderedDict()
+
+        self._lock = threading.Lock()
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits,
+                'not_modified': self.not_modified, 'entries': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def data_uri(self, src, encode):
+        """Returns the data uri of src, encode(data) is called only when
+        src is not cached or was changed. Nothing is cached when encode
+        returns None."""
+        if is_url(src):
+            return self._remote(src, encode)
+        return self._local(src, encode)
+
+    def _local(self, src, encode):
+        stat = os.stat(src)
+        validator = '%r %d' % (stat.st_mtime, stat.st_size)
+
+        entry, from_disk = self._get(src)
+        if entry is not None and entry['validator'] == validator:
+            self._hit(from_disk)
+            return entry['uri']
+
+        with open(src, 'rb') as media_file:
+            uri = encode(media_file.read())
+        return self._store(src, validator, uri)
+
+    def _remote(self, src, encode):
+        now = self.clock()
+        entry, from_disk = self._get(src)
+        if entry is not None and now - entry['checked'] < self.max_age:
+            self._hit(from_disk)
+            return entry['uri']
+
+        headers = {}
+        if entry is not None and entry['validator']:
+            headers['If-None-Match'] = entry['validator']
+        try:
+            data, etag = fetch(src, headers)
+        except HTTPError as e:
+            if e.code != 304 or entry is None:
+                raise
+            with self._lock:
+                entry['checked'] = now
+                self.not_modified += 1
+            self._hit(from_disk)
+            return entry['uri']
+
+        uri = encode(data)
+        return self._store(src, etag or '', uri, now)
+
+    def _get(self, src):
+        """Returns (entry, True if it was read from disk)."""
+        with self._lock:
+            entry = self._entries.get(src)
+            if entry is not None:
+                self._entries[src] = self._entries.pop(src)
+                return entry, False
+        if self.directory:
+            entry = self._read_disk(src)
+        return entry, entry is not None
+
+    def _hit(self, from_disk):
+        with self._lock:
+            self.hits += 1
+            if from_disk:
+                self.disk_hits += 1
+
+    def _store(self, src, validator, uri, checked=0):
+        with self._lock:
+            self.misses += 1
+        if uri is None:
+            return None
+
+        entry = {'validator': validator, 'checked': checked, 'uri': uri}
+        self._remember(src, entry)
+        if self.directory:
+            self._write_disk(src, entry)
+        return uri
+
+    def _remember(self, src, entry):
+        with self._lock:
+            self._entries.pop(src, None)
+            self._entries[src] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, src):
+        digest = hashlib.sha1(src.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, ENTRY_NAME % digest)
+
+    def _read_disk(self, src):
+        path = self._path(src)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+            # mark as recently used for eviction
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        self._remember(src, entry)
+        return entry
+
+    def _write_disk(self, src, entry):
+        path = self._path(src)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as entry_file:
+            json.dump(entry, entry_file)
+        os.rename(tmp_path, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """Removes least recently used entries, other files in the directory,
+        e.g. entries being written by other processes, are left alone."""
+        files = []
+        for name in os.listdir(self.directory):
+            if not ENTRY_NAME_RE.match(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+media_cache = MediaCache()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import mimetypes
+import os
+import sys
+
+if sys.version_info[0] == 3:
+    text_type = str
+else:
+    text_type = unicode
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _encode(data):
+    if isinstance(data, text_type):
+        data = data.encode('utf-8')
+    return data
+
+
+class MultipartBody(object):
+    """multipart/form-data body read from files while it is sent.
+
+    Only part headers are kept in memory, files are read in chunks of
+    CHUNK_SIZE bytes, the length is known up front from file sizes.
+    It can be read again after seek(0), e.g. when a request is retried.
+    """
+
+    def __init__(self, fields, files, boundary):
+        self.boundary = boundary
+
+        self.content_type = 'multipart/form-data; boundary=%s' % boundary
+
+        # bytes or (path, size) of a file
+        self.parts = []
+
+        for key, value in fields.items():
+            self.parts.append(_encode(
+                '--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % (boundary, key)))
+            self.parts.append(_encode(value if isinstance(value, bytes) else str(value)))
+            self.parts.append(b'\r\n')
+
+        for path in files:
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            self.parts.append(_encode(
+                '--%s\r\nContent-Disposition: form-data; name="file"; filename="%s"\r\n'
+                'Content-Type: %s\r\n\r\n' % (boundary, path, content_type)))
+            self.parts.append((path, os.path.getsize(path)))
+            self.parts.append(b'\r\n')
+
+        self.parts.append(_encode('--%s--\r\n\r\n' % boundary))
+
+        self.length = sum(part[1] if isinstance(part, tuple) else len(part)
+                          for part in self.parts)
+
+        self._index = 0
+
+        self._offset = 0
+
+        self._file = None
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        self.seek(0)
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise ValueError('MultipartBody can only be rewound.')
+        self.close()
+        self._index = 0
+        self._offset = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+
+        data = []
+        while size > 0 and self._index < len(self.parts):
+            part = self.parts[self._index]
+            if isinstance(part, tuple):
+                if self._file is None:
+                    self._file = open(part[0], 'rb')
+                chunk = self._file.read(size)
+                if not chunk:
+                    self.close()
+                    self._index += 1
+                    continue
+            else:
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+                if self._offset >= len(part):
+                    self._index += 1
+                    self._offset = 0
+            data.append(chunk)
+            size -= len(chunk)
+        return b''.join(data)
@@ -1,18 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import os
-import sys
-import mimetypes
 import base64
-from io import BytesIO
 
 try:
-    from urllib2 import Request, urlopen, URLError
     from urllib import urlencode
 except ImportError:
-    from urllib.request import Request, urlopen
     from urllib.parse import urlencode
-    from urllib.error import URLError
+
+from .failover import is_idempotent
+from .multipart import MultipartBody
+from .transport import ConnectError, UrllibTransport, TransportError
 
 try:
     from mimetools import choose_boundary
@@ -21,12 +19,7 @@ except ImportError:
     
     def choose_boundary():
         return str(uuid4())
-    
 
-if sys.version_info[0] == 3:
-    text_type = str
-else:
-    text_type = unicode
 
 
 class ApiProxyError(Exception):
@@ -57,13 +50,23 @@ class ApiHttpProxy(ApiProxy):
     
     user_agent = 'PySmsAPI'
     
-    def __init__(self, hostname=None, data=None):
+    def __init__(self, hostname=None, data=None, transport=None, policy=None):
         super(ApiHttpProxy, self).__init__(hostname, data)
         
+        self.transport = transport or UrllibTransport()
+
+        self.policy = policy
+
         self.headers = {}
         
         self.body = {}
     
+    def set_transport(self, transport):
+        self.transport = transport
+
+    def set_policy(self, policy):
+        self.policy = policy
+
     def execute(self, uri=None, data=None):
         
         if isinstance(data, dict):
@@ -71,37 +74,67 @@ class ApiHttpProxy(ApiProxy):
         
         headers, body = self.prepare_request()
 
+        return self.send(uri, body, headers, idempotent=is_idempotent(self.data))
+
+    def send(self, uri, body, headers, stream=False, idempotent=False):
+        """Sends a prepared request, uses no state other than hostname,
+        transport and policy, so it can be called from many threads.
+        Only idempotent requests are retried by the policy."""
+
         response = None
 
-        if isinstance(self.hostname, (list, tuple)):
+        if self.policy is not None:
+            hosts = self.hostname
+            if not isinstance(hosts, (list, tuple)):
+                hosts = [hosts]
+            response = self.policy.send(
+                hosts, lambda host: self.open(host, uri, body, headers, stream),
+                idempotent)
+        elif isinstance(self.hostname, (list, tuple)):
             for host in self.hostname:
-                response = self.connect(host, uri, body, headers)
-                
+                try:
+                    response = self.open(host, uri, body, headers, stream)
+                except ConnectError:
+                    continue
+                except TransportError:
+                    if not idempotent:
+                        # the host may have got it already
+                        response = None
+                        break
+                    continue
+
                 if response and response.getcode() == 200:
                     break
         else:
-            response = self.connect(self.hostname, uri, body, headers)
+            response = self.connect(self.hostname, uri, body, headers, stream)
 
         if not response:
             raise ApiProxyError("Unable connect to the specified url: %s" % str(self.hostname))
         
         return response
     
-    def connect(self, hostname, uri, body, headers):
+    def connect(self, hostname, uri, body, headers, stream=False):
         try:
-            uri = uri or ''
-            if hostname.endswith('/'):
-                url = hostname + uri
-            else:
-                url = '%s/%s' % (hostname, uri) 
-
-            req = Request(url, body, headers)                
-            response = urlopen(req)
-            
-            return response
-        except (URLError, ValueError):
+            return self.open(hostname, uri, body, headers, stream)
+        except TransportError:
             return False
 
+    def open(self, hostname, uri, body, headers, stream=False):
+        """Sends the request to one host, raises TransportError."""
+        uri = uri or ''
+        if hostname.endswith('/'):
+            url = hostname + uri
+        else:
+            url = '%s/%s' % (hostname, uri)
+
+        if hasattr(body, 'seek'):
+            # streamed body is read again for every host
+            body.seek(0)
+
+        if stream:
+            return self.transport.request(url, body, headers, stream=True)
+        return self.transport.request(url, body, headers)
+
     def add_file(self, filepath):
         if os.path.isfile(filepath):
             self.files.append(filepath)
@@ -124,10 +157,10 @@ class ApiHttpProxy(ApiProxy):
         headers['Authorization'] = auth_str
 
         if self.files:
-            content_type, data = self.encode_multipart_data()
+            data = self.multipart_body()
 
             headers.update({
-                'Content-Type': content_type, 
+                'Content-Type': data.content_type, 
                 'Content-Length': str(len(data))
             })
         else:
@@ -138,39 +171,39 @@ class ApiHttpProxy(ApiProxy):
         return headers, data
 
     def encode_multipart_data(self):
+        body = self.multipart_body()
 
-        def encode(data):
-            if isinstance(data, text_type):
-                data = data.encode('utf-8')
-            return data
-                
-        boundary = choose_boundary()
+        return body.content_type, body.read()
+
+    def multipart_body(self):
+        """Body streamed from the attached files as it is sent."""
+        return MultipartBody(self.data, self.files, choose_boundary())
+
+
+class PreparedRequest(Exception):
+
+    def __init__(self, uri, headers, body, data=None):
+        super(PreparedRequest, self).__init__()
+
+        self.uri = uri
+
+        self.data = data or {}
+
+        self.headers = headers
+
+        self.body = body
 
-        body = BytesIO()
-        
-        for (key, value) in self.data.items():
-            body.write(encode('--%s\r\n' % boundary))
-            body.write(encode('Content-Disposition: form-data; name="%s"' % key))
-            body.write(encode('\r\n\r\n' + str(value) + '\r\n'))
-            
-        for _file in self.files:
-            body.write(encode('--%s\r\n' % boundary))
-            body.write(encode('Content-Disposition: form-data; name="file"; filename="%s"\r\n' % _file))
-            body.write(encode('Content-Type: %s\r\n' % mimetypes.guess_type(_file)[0] or 'application/octet-stream'))
-            body.write(encode('\r\n'))
-            
-            try:
-                with open(_file, 'rb') as f:
-                    data = f.read()
-                    body.write(encode(data))
-            except IOError:
-                raise
-            
-            body.write(encode('\r\n'))            
 
-        body.write(encode('--%s--\r\n\r\n' % boundary))
+class RequestCapture(ApiHttpProxy):
+    """Proxy given to an action, stops it once the request is prepared.
 
-        content_type = 'multipart/form-data; boundary=%s' % boundary
+    A new one is used for every request, so its data is never shared.
+    """
 
-        return content_type, body.getvalue()
+    def execute(self, uri=None, data=None):
+        if isinstance(data, dict):
+            self.data.update(data)
+
+        headers, body = self.prepare_request()
 
+        raise PreparedRequest(uri, headers, body, dict(self.data))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from . import services
+
+
+class ApiRequest(object):
+    """Immutable request to the api.
+
+    Calls of action methods (set_to, set_content, ...) are recorded and
+    return a new request, they are replayed onto a fresh action when the
+    request is sent. A request can be shared between threads and reused
+    as a base for other requests:
+
+        base = api.request('sms', 'send').set_from('Info')
+        api.send(base.set_to('48500000000').set_content('message'))
+    """
+
+    __slots__ = ('service', 'action', 'calls')
+
+    def __init__(self, service, action, calls=()):
+        service_class = getattr(services, 'Service%s' % service.title(), None)
+        if service_class is None:
+            raise AttributeError('Unrecognized service name %s' % service)
+        if not hasattr(service_class, 'action_%s' % action.lower()):
+            raise ValueError('Action not exist.')
+
+        object.__setattr__(self, 'service', service)
+        object.__setattr__(self, 'action', action)
+        object.__setattr__(self, 'calls', tuple(calls))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ApiRequest is immutable.')
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            return ApiRequest(self.service, self.action,
+                              self.calls + ((name, args, kwargs),))
+        return record
+
+    def __repr__(self):
+        return 'ApiRequest(%r, %r, %r)' % (self.service, self.action, self.calls)
+
+    def build(self, proxy):
+        """Returns a new action with all recorded calls applied."""
+        service = getattr(services, 'Service%s' % self.service.title())(proxy)
+        action = getattr(service, 'action_%s' % self.action.lower())()
+        for name, args, kwargs in self.calls:
+            getattr(action, name)(*args, **kwargs)
+        return action
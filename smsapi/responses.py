@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import codecs
 import json
 
+_decoder = json.JSONDecoder()
+
+_whitespace = ' \t\r\n'
+
 class ApiError(Exception):        
 
     def __init__(self, data):
@@ -57,7 +62,8 @@ class ApiResponse(object):
             pass
 
     def __iter__(self):
-        return self
+        # every loop gets its own iterator, current is left for next()
+        return (ApiRecord(item) for item in self.data)
 
     def __next__(self):
         return self.next()
@@ -78,3 +84,202 @@ class ApiResponse(object):
         except KeyError:
             raise
 
+
+
+class ApiRecord(object):
+    """Immutable item of a response, fields are read as attributes
+    or items."""
+
+    __slots__ = ('_fields',)
+
+    def __init__(self, fields):
+        object.__setattr__(self, '_fields', fields)
+
+    def __getattr__(self, name):
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ApiRecord is immutable.')
+
+    def __getitem__(self, name):
+        return self._fields[name]
+
+    def __contains__(self, name):
+        return name in self._fields
+
+    def __eq__(self, other):
+        return isinstance(other, ApiRecord) and self._fields == other._fields
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'ApiRecord(%r)' % (self._fields,)
+
+    def get(self, name, default=None):
+        return self._fields.get(name, default)
+
+    def keys(self):
+        return list(self._fields.keys())
+
+    def as_dict(self):
+        return dict(self._fields)
+
+
+class JsonStream(object):
+    """Decodes json values one by one from a file-like object,
+    reading only as much as needed."""
+
+    def __init__(self, fileobj, chunk_size=8192):
+        self.fileobj = fileobj
+
+        self.chunk_size = chunk_size
+
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+
+        self.buffer = u''
+
+        self.pos = 0
+
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(self.chunk_size)
+        if self.pos > self.chunk_size:
+            # drop what was already decoded
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        if not chunk:
+            self.eof = True
+            self.buffer += self.decoder.decode(b'', True)
+            return False
+        self.buffer += self.decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """Returns next non-whitespace character, empty string at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expected one of %r at %d' % (chars, self.pos))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def rest(self):
+        while self.fill():
+            pass
+        return self.buffer[self.pos:]
+
+
+class StreamingApiResponse(object):
+    """Response parsed while it is read from the connection.
+
+    Items of the list are yielded as ApiRecord one by one and are not kept.
+    `open_response` is called for every loop over the response, so it can
+    be iterated more than once, each time over a new request. `count` and
+    other fields are known once they have been read.
+    """
+
+    def __init__(self, open_response, chunk_size=8192):
+        self.open_response = open_response
+
+        self.chunk_size = chunk_size
+
+        self.url = None
+
+        self.status_code = None
+
+        self.count = None
+
+        self.fields = {}
+
+    def __iter__(self):
+        response = self.open_response()
+        self.url = response.geturl()
+        self.status_code = response.getcode()
+        stream = JsonStream(response, self.chunk_size)
+        try:
+            for item in self._parse(stream):
+                yield ApiRecord(item)
+            # read to the end, so that the connection can be reused
+            stream.rest()
+        finally:
+            response.close()
+
+    def _parse(self, stream):
+        start = stream.peek()
+
+        if start == '[':
+            for item in self._items(stream):
+                yield item
+            return
+
+        if start != '{':
+            text = stream.rest()
+            if text.startswith('ERROR'):
+                raise ApiError({'error': text.split(':')[1]})
+            raise ValueError('Unexpected response: %r' % text[:100])
+
+        stream.expect('{')
+        fields = {}
+        has_list = False
+        if stream.peek() == '}':
+            stream.expect('}')
+        else:
+            while True:
+                key = stream.value()
+                stream.expect(':')
+                if key == 'list' and stream.peek() == '[':
+                    has_list = True
+                    self.fields = fields
+                    for item in self._items(stream):
+                        yield item
+                else:
+                    fields[key] = stream.value()
+                    if key == 'count':
+                        self.count = fields[key]
+                if stream.expect(',}') == '}':
+                    break
+        self.fields = fields
+
+        if fields.get('error'):
+            raise ApiError(fields)
+        if not has_list:
+            yield fields
+
+    def _items(self, stream):
+        stream.expect('[')
+        if stream.peek() == ']':
+            stream.expect(']')
+            return
+        while True:
+            yield stream.value()
+            if stream.expect(',]') == ']':
+                return
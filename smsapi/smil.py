@@ -6,11 +6,7 @@ import base64
 import mimetypes
 import xml.etree.ElementTree as ET
 
-try:
-    from urllib.request import urlopen
-except ImportError:
-    from urllib import urlopen
-
+from .media_cache import is_url, media_cache, read_media
 from .mime_types import mime_types
 
 
@@ -48,9 +44,11 @@ class Smil(object):
         
     def set_width(self, width):
         self.head.set_width(width)
+        self.update = True
 
     def set_height(self, height):
         self.head.set_height(height)
+        self.update = True
     
     def add_image(self, image, attributes=None):
         
@@ -99,6 +97,8 @@ class Smil(object):
     def tree(self):
         if self.update or self._tree is None:
             self._tree = self.root
+
+            del self._tree[:]
             
             for sub_element in self.subelements:
                 self._tree.append(sub_element.get_element())
@@ -118,6 +118,57 @@ class Smil(object):
         return self.render()
     
 
+class SmilTemplate(Smil):
+    """Smil serialised once, with text fields filled in for every message.
+
+        template = SmilTemplate()
+        template.add_image('logo.png')
+        template.add_text_field('content')
+        smil = template.render(content=u'Hello')
+
+    Filled values are base64 data uris, which need no XML escaping, so
+    rendering only joins pre-serialised bytes. The template is serialised
+    again after it was changed.
+    """
+
+    def __init__(self):
+        super(SmilTemplate, self).__init__()
+
+        self.fields = {}
+
+        self._parts = None
+
+    def add_text_field(self, name, attributes=None):
+        text = SmilText(None, attributes)
+        text.element.set('src', '@@%s@@' % name)
+        self.fields[name] = text
+        self.add_text(text, attributes)
+
+    def compile(self):
+        rendered = super(SmilTemplate, self).render()
+        self._parts = []
+        for i, part in enumerate(re.split(b'@@(\\w+)@@', rendered)):
+            # odd parts are field names
+            self._parts.append(part.decode('ascii') if i % 2 else part)
+        return self._parts
+
+    def render(self, pretty_print=False, **values):
+        if pretty_print:
+            raise ValueError("Templates are rendered without pretty print.")
+
+        parts = self._parts if self._parts is not None and not self.update else self.compile()
+
+        rendered = list(parts)
+        for i in range(1, len(rendered), 2):
+            value = values[rendered[i]]
+            text = self.fields[rendered[i]]
+            rendered[i] = text.encode_data(value, 'text/plain').encode('ascii')
+        return b''.join(rendered)
+
+    def __str__(self):
+        return super(SmilTemplate, self).render()
+
+
 class SmilHead(SmilElement):
     
     __attrs__ = ('id', 'height', 'width', 'fit')
@@ -145,7 +196,7 @@ class SmilHead(SmilElement):
         self.root_layout.set('width', width)
 
     def set_height(self, height):
-        self.root_layout.set('width', height)
+        self.root_layout.set('height', height)
 
 
 class SmilBody(SmilElement):
@@ -169,6 +220,9 @@ class SmilAnimation(SmilElement):
 class SmilMedia(SmilElement):
 
     __attrs__ = ('id', 'type', 'region', 'dur')
+
+    # encoded media are reused between messages, None turns caching off
+    cache = media_cache
     
     def __init__(self, src=None, attributes=None):
         super(SmilMedia, self).__init__()
@@ -209,32 +263,37 @@ class SmilMedia(SmilElement):
 
     def set_src(self, src):
         
-        data = None
-        
         source = ''
 
-        if os.path.isfile(src):
-            try:
-                with open(src, 'rb') as image_file:
-                    data = image_file.read()
-            except IOError:
-                raise SmilError("Cant't read file.")
-        elif src.startswith(('http://', 'https://')):
-            try:
-                http_resp = urlopen(src)
-                
-                if http_resp.getcode() == 200:
-                    data = http_resp.read()
-            except ValueError:
-                raise SmilError("Unable to fetch resource.")   
-        
-        if data:
-            self.mime_type = self.detect_mime_type(src)
-            source = self.encode_data(data)
+        if os.path.isfile(src) or is_url(src):
+            source = self.load_src(src) or ''
         elif re.match('data:%s/[^\W\d_]+;base64,[\w]+' % self.mime_prefix, src):
-            source = data
+            source = src
 
         self.element.set('src', source)
+
+    def load_src(self, src):
+        
+        def encode(data):
+            if data:
+                return self.encode_data(data, self.detect_mime_type(src))
+
+        try:
+            if self.cache is None:
+                source = encode(read_media(src))
+            else:
+                source = self.cache.data_uri(src, encode)
+        except (IOError, OSError):
+            if is_url(src):
+                raise
+            raise SmilError("Cant't read file.")
+        except ValueError:
+            raise SmilError("Unable to fetch resource.")
+
+        if source:
+            self.mime_type = self.detect_mime_type(src)
+
+        return source
         
     def detect_mime_type(self, src):    
         
@@ -251,7 +310,7 @@ class SmilMedia(SmilElement):
         if not isinstance(data, bytes):
             data = data.encode('utf-8')
         
-        data = base64.b64encode(data)
+        data = base64.b64encode(data).decode('ascii')
         
         return 'data:%s;base64,%s' % (mime_type, data)
            
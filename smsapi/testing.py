@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl
+
+
+def sms_sent(params):
+    """Default stub answer: every recipient gets a queued message."""
+    recipients = params.get('to', '').split(',')
+    return {
+        'count': len(recipients),
+        'list': [{'id': str(1000 + i), 'points': 0.16, 'number': number,
+                  'status': 'QUEUE'} for i, number in enumerate(recipients)],
+    }
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """Local HTTP/1.1 server answering like api.smsapi.pl.
+
+    `handshake_delay` seconds are spent on every new connection to make
+    the cost of connecting visible, `responder` turns request params into
+    the returned json. Files put into `media` (path -> bytes) are served
+    with an ETag and answered 304 when it was not changed.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, responder=sms_sent, handshake_delay=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+
+        self.responder = responder
+
+        self.handshake_delay = handshake_delay
+
+        self.connections = 0
+
+        self.requests = []
+
+        # (length, md5) of multipart bodies, which are not kept in memory
+        self.uploads = []
+
+        self.media = {}
+
+        self.lock = threading.Lock()
+
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s/' % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake_delay)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if self.headers.get('Content-Type', '').startswith('multipart/'):
+            digest = hashlib.md5()
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            params = {}
+            with self.server.lock:
+                self.server.uploads.append((length - remaining, digest.hexdigest()))
+        else:
+            body = self.rfile.read(length)
+            # parsed before decoding, so that utf-8 is decoded on python 2 as well
+            params = dict((name.decode('utf-8'), value.decode('utf-8'))
+                          for name, value in parse_qsl(body))
+        with self.server.lock:
+            self.server.requests.append((self.path, params))
+        self.respond(params)
+
+    def do_GET(self):
+        if self.path in self.server.media:
+            return self.send_media(self.server.media[self.path])
+        params = dict(parse_qsl(self.path.partition('?')[2]))
+        with self.server.lock:
+            self.server.requests.append((self.path, params))
+        self.respond(params)
+
+    def respond(self, params):
+        body = json.dumps(self.server.responder(params)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_media(self, data):
+        with self.server.lock:
+            self.server.requests.append((self.path, {}))
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
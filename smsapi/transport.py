@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+from collections import deque
+
+try:
+    from urllib2 import Request, urlopen, HTTPError, URLError
+    from urlparse import urlsplit
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+except ImportError:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlsplit
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+
+
+class TransportError(Exception):
+    """The request failed, it may have reached the server."""
+
+
+class ConnectError(TransportError):
+    """The request was not sent, e.g. the host could not be reached, so
+    it can be sent to another host without risk of sending it twice."""
+
+
+class BufferedResponse(object):
+    """Response read to the end, so that its connection can be reused.
+
+    Provides the part of urllib response interface used by ApiResponse.
+    """
+
+    def __init__(self, url, code, headers, body):
+        self.url = url
+
+        self.code = code
+
+        self.headers = headers
+
+        self.body = body
+
+        self._offset = 0
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+    def read(self, size=-1):
+        start = self._offset
+        if size is None or size < 0:
+            self._offset = len(self.body)
+        else:
+            self._offset = min(start + size, len(self.body))
+        return self.body[start:self._offset]
+
+    def close(self):
+        pass
+
+
+class StreamedResponse(object):
+    """Response read from the connection as it is consumed.
+
+    The connection goes back to the pool once the body is read to the end,
+    it is closed if the response is closed earlier.
+    """
+
+    def __init__(self, url, response, release):
+        self.url = url
+
+        self.code = response.status
+
+        self.headers = response.msg
+
+        self._response = response
+
+        self._release = release
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+    def read(self, size=-1):
+        if self._release is None:
+            return b''
+        if size is None or size < 0:
+            data = self._response.read()
+        else:
+            data = self._response.read(size)
+        if not data or (size is not None and size < 0):
+            self._finish(reusable=True)
+        return data
+
+    def close(self):
+        self._finish(reusable=False)
+
+    def _finish(self, reusable):
+        if self._release is not None:
+            release, self._release = self._release, None
+            release(reusable)
+
+
+class UrllibTransport(object):
+    """Opens a new connection for every request."""
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def request(self, url, body=None, headers=None, stream=False):
+        # urlopen responses are always read from the connection
+        try:
+            if self.timeout is None:
+                return urlopen(Request(url, body, headers or {}))
+            return urlopen(Request(url, body, headers or {}), timeout=self.timeout)
+        except HTTPError as e:
+            raise TransportError(str(e))
+        except (URLError, ValueError) as e:
+            # urlopen wraps errors of sending the request, not of reading the response
+            raise ConnectError(str(e))
+        except (HTTPException, socket.error) as e:
+            raise TransportError(str(e))
+
+    def close(self):
+        pass
+
+
+class PooledHttpTransport(object):
+    """Keeps connections alive and reuses them for following requests.
+
+    At most `pool_size` idle connections are kept per host. Requests are
+    sent one after another on a connection, a request on a connection
+    closed by the server in the meantime is retried once on a new one.
+    """
+
+    connection_classes = {
+        'http': HTTPConnection,
+        'https': HTTPSConnection,
+    }
+
+    def __init__(self, pool_size=4, connect_timeout=10, read_timeout=30):
+        self.pool_size = pool_size
+
+        self.connect_timeout = connect_timeout
+
+        self.read_timeout = read_timeout
+
+        self.connections_made = 0
+
+        self._pools = {}
+
+        self._lock = threading.Lock()
+
+    def request(self, url, body=None, headers=None, stream=False):
+        parts = urlsplit(url)
+
+        if parts.scheme not in self.connection_classes or not parts.hostname:
+            raise TransportError('Unsupported url: %s' % url)
+
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        method = 'GET' if body is None else 'POST'
+
+        connection, reused = self._get_connection(key)
+        try:
+            response = self._send(connection, method, path, body, headers)
+        except ConnectError:
+            connection.close()
+            raise
+        except (HTTPException, socket.error) as e:
+            connection.close()
+            if not reused or isinstance(e, socket.timeout):
+                raise TransportError(str(e))
+            # server closed idle keep-alive connection
+            connection, reused = self._new_connection(key), False
+            try:
+                response = self._send(connection, method, path, body, headers)
+            except ConnectError:
+                connection.close()
+                raise
+            except (HTTPException, socket.error) as e:
+                connection.close()
+                raise TransportError(str(e))
+
+        if response.status >= 400:
+            connection.close()
+            raise TransportError('HTTP Error %s: %s' % (response.status, response.reason))
+
+        def release(reusable):
+            if reusable and not response.will_close:
+                self._put_connection(key, connection)
+            else:
+                connection.close()
+
+        if stream:
+            return StreamedResponse(url, response, release)
+
+        data = response.read()
+        release(True)
+        return BufferedResponse(url, response.status, response.msg, data)
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for connection in pool:
+                connection.close()
+
+    def _send(self, connection, method, path, body, headers):
+        if hasattr(body, 'seek'):
+            body.seek(0)
+        if connection.sock is None:
+            try:
+                connection.connect()
+            except (HTTPException, socket.error) as e:
+                raise ConnectError(str(e))
+            connection.sock.settimeout(self.read_timeout)
+            # small requests on a kept alive connection must not wait for acks
+            connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection.request(method, path, body, headers or {})
+        return connection.getresponse()
+
+    def _get_connection(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool:
+                return pool.pop(), True
+        return self._new_connection(key), False
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        with self._lock:
+            self.connections_made += 1
+        return self.connection_classes[scheme](host, port, timeout=self.connect_timeout)
+
+    def _put_connection(self, key, connection):
+        with self._lock:
+            pool = self._pools.setdefault(key, deque())
+            if len(pool) < self.pool_size:
+                pool.append(connection)
+                return
+        connection.close()